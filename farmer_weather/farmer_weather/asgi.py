@@ -14,3 +14,9 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmer_weather.settings')
 
 application = get_asgi_application()
+
+# Opt-in weather refresh loop for single-service deployments
+# (WEATHER_SCHEDULER_IN_PROCESS); imported after Django is set up
+from weather.scheduler import start_in_process_scheduler  # noqa: E402
+
+start_in_process_scheduler()
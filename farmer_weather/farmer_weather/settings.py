@@ -63,6 +63,8 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+# Let the frontend read pagination headers from cross-origin responses
+CORS_EXPOSE_HEADERS = ['Link', 'X-Next-Cursor', 'X-Weather-Version']
 
 ROOT_URLCONF = 'farmer_weather.urls'
 
@@ -96,6 +98,26 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The weather cache is shared between farms; point REDIS_URL at a Redis
+# instance to share it between worker processes as well.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -144,7 +166,76 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Weather API Configuration
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY', '')
+# Override to use a local stand-in, e.g. http://127.0.0.1:8089/data/2.5
+# while running `python manage.py mock_openweather`
+OPENWEATHER_BASE_URL = os.getenv('OPENWEATHER_BASE_URL', '')
 GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', '')
 
+# Farms within the same grid cell (in degrees, 0.05 is roughly 5 km) share
+# one upstream payload. Forecasts are kept until the next 3-hour step,
+# current conditions for WEATHER_CURRENT_TTL seconds.
+WEATHER_CACHE_RESOLUTION = float(os.getenv('WEATHER_CACHE_RESOLUTION', '0.05'))
+WEATHER_CURRENT_TTL = int(os.getenv('WEATHER_CURRENT_TTL', '600'))
+
+# After WEATHER_BREAKER_THRESHOLD consecutive provider failures, stop calling
+# it for WEATHER_BREAKER_RESET_TIMEOUT seconds and serve stored data. A failed
+# location is not retried for WEATHER_NEGATIVE_CACHE_TTL seconds.
+WEATHER_BREAKER_THRESHOLD = int(os.getenv('WEATHER_BREAKER_THRESHOLD', '5'))
+WEATHER_BREAKER_RESET_TIMEOUT = int(os.getenv('WEATHER_BREAKER_RESET_TIMEOUT', '60'))
+WEATHER_NEGATIVE_CACHE_TTL = int(os.getenv('WEATHER_NEGATIVE_CACHE_TTL', '60'))
+
+# Provider calls are retried up to WEATHER_HTTP_RETRIES times, but no retry
+# starts later than WEATHER_HTTP_RETRY_BUDGET seconds after the first failure.
+# Each farm's current and forecast calls run in parallel on a pool of
+# WEATHER_FETCH_WORKERS threads shared by the process; when it is busy they
+# run one after the other on the request thread instead of queueing.
+WEATHER_HTTP_RETRIES = int(os.getenv('WEATHER_HTTP_RETRIES', '3'))
+WEATHER_HTTP_RETRY_BUDGET = float(os.getenv('WEATHER_HTTP_RETRY_BUDGET', '10'))
+WEATHER_FETCH_WORKERS = int(os.getenv('WEATHER_FETCH_WORKERS', '8'))
+
+# Bulk refresh: provider quota (free tier allows 60 calls/minute) and the
+# number of grid cells fetched concurrently
+OPENWEATHER_CALLS_PER_MINUTE = int(os.getenv('OPENWEATHER_CALLS_PER_MINUTE', '60'))
+WEATHER_REFRESH_CONCURRENCY = int(os.getenv('WEATHER_REFRESH_CONCURRENCY', '8'))
+
+# Stored weather older than this many seconds is refreshed by the
+# scheduler (manage.py run_weather_scheduler); pages keep serving it meanwhile
+WEATHER_REFRESH_INTERVAL = int(os.getenv('WEATHER_REFRESH_INTERVAL', '1800'))
+
+# Run the scheduler inside the web server process instead of a separate
+# worker (one pass every WEATHER_SCHEDULER_INTERVAL seconds; one process per
+# host runs it). Use this when no worker can share the database, e.g. SQLite.
+WEATHER_SCHEDULER_IN_PROCESS = os.getenv('WEATHER_SCHEDULER_IN_PROCESS', 'False') == 'True'
+WEATHER_SCHEDULER_INTERVAL = int(os.getenv('WEATHER_SCHEDULER_INTERVAL', '300'))
+
+# Shared caches (proxies/CDN) may serve GET /api/farms/<id>/weather/ for this
+# many seconds before revalidating; POST .../weather/refresh/ updates it
+WEATHER_API_MAX_AGE = int(os.getenv('WEATHER_API_MAX_AGE', '60'))
+
+# Server-sent events (GET /api/farms/<id>/weather/events/, ASGI only): each
+# process checks subscribed farms for changes written by other processes
+# every WEATHER_EVENTS_POLL_INTERVAL seconds, idle streams get a heartbeat
+# every WEATHER_EVENTS_HEARTBEAT seconds, and streams are closed (clients
+# reconnect) after WEATHER_EVENTS_MAX_AGE seconds
+WEATHER_EVENTS_POLL_INTERVAL = float(os.getenv('WEATHER_EVENTS_POLL_INTERVAL', '10'))
+WEATHER_EVENTS_HEARTBEAT = float(os.getenv('WEATHER_EVENTS_HEARTBEAT', '15'))
+WEATHER_EVENTS_MAX_AGE = int(os.getenv('WEATHER_EVENTS_MAX_AGE', '600'))
+
+# Delta-sync change log entries are kept this many days (pruned by
+# manage.py compact_weather); clients with older cursors get a full snapshot
+WEATHER_CHANGE_LOG_RETENTION_DAYS = int(os.getenv('WEATHER_CHANGE_LOG_RETENTION_DAYS', '7'))
+
+# Directory for per-farm refresh lock files when not running on PostgreSQL
+# (PostgreSQL uses advisory locks instead); defaults to the system temp dir
+WEATHER_LOCK_DIR = os.getenv('WEATHER_LOCK_DIR', '')
+
+# Computed insights are shared by farms with the same forecast window and
+# crop: up to WEATHER_INSIGHT_CACHE_SIZE entries per process, backed by the
+# WEATHER_INSIGHT_CACHE_ALIAS cache (empty to disable) for
+# WEATHER_INSIGHT_CACHE_TTL seconds.
+WEATHER_INSIGHT_CACHE_SIZE = int(os.getenv('WEATHER_INSIGHT_CACHE_SIZE', '4096'))
+WEATHER_INSIGHT_CACHE_ALIAS = os.getenv('WEATHER_INSIGHT_CACHE_ALIAS', 'default')
+WEATHER_INSIGHT_CACHE_TTL = int(os.getenv('WEATHER_INSIGHT_CACHE_TTL', '21600'))
+
 # Gemini AI Configuration
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'farmer_weather.settings')
 
 application = get_wsgi_application()
+
+# Opt-in weather refresh loop for single-service deployments
+# (WEATHER_SCHEDULER_IN_PROCESS); imported after Django is set up
+from weather.scheduler import start_in_process_scheduler  # noqa: E402
+
+start_in_process_scheduler()
@@ -37,7 +37,8 @@ def test_api():
     print(f"\n2. Testing API with coordinates: {lat}, {lon}")
     
     # Test current weather
-    url = f"https://api.openweathermap.org/data/2.5/weather"
+    base_url = settings.OPENWEATHER_BASE_URL or "https://api.openweathermap.org/data/2.5"
+    url = f"{base_url}/weather"
     params = {
         'lat': lat,
         'lon': lon,
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Crop, Farm, WeatherData, FarmingInsight
+from .models import (
+    Crop, Farm, WeatherData, FarmingInsight, WeatherSyncState,
+    HourlyWeatherRollup, DailyWeatherRollup, FarmAgronomy,
+)
 
 
 @admin.register(Crop)
@@ -27,3 +30,22 @@ class FarmingInsightAdmin(admin.ModelAdmin):
     list_display = ['farm', 'insight_type', 'title', 'priority', 'valid_from']
     list_filter = ['insight_type', 'priority', 'created_at']
     search_fields = ['farm__name', 'title']
+
+
+@admin.register(WeatherSyncState)
+class WeatherSyncStateAdmin(admin.ModelAdmin):
+    list_display = ['farm', 'checked_at']
+    search_fields = ['farm__name']
+
+
+@admin.register(HourlyWeatherRollup, DailyWeatherRollup)
+class WeatherRollupAdmin(admin.ModelAdmin):
+    list_display = ['farm', 'period_start', 'temperature_min', 'temperature_max', 'precipitation_total']
+    list_filter = ['period_start']
+    search_fields = ['farm__name']
+
+
+@admin.register(FarmAgronomy)
+class FarmAgronomyAdmin(admin.ModelAdmin):
+    list_display = ['farm', 'et0_total', 'gdd_total', 'accumulated_through']
+    search_fields = ['farm__name']
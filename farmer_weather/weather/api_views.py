@@ -1,12 +1,23 @@
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 import json
-from .models import Farm, Crop, WeatherData, FarmingInsight
-from .weather_service import WeatherService
-from .insights import InsightGenerator
-from datetime import datetime
+from django.db import transaction
+from django.db.models import Prefetch
+from .models import Farm, Crop, WeatherSyncState
+from .changelog import CursorExpired, changed_rows, changes_since, latest_cursor
+from .events import farm_event_stream, format_event, poll_interval, update_version, version_id
+from .pagination import InvalidCursor, keyset_page
+from . import queries
+from .queries import FARM_FIELDS, FARM_PAGE_SIZE
+from .refresh import last_refreshed, refresh_farm, refresh_in_background, refresh_max_age, refresh_pending
+from .weather_service import FORECAST_STEP_SECONDS, content_fingerprint
 import os
 
 # Gemini AI imports
@@ -130,22 +141,52 @@ def predict_blight(request):
         return JsonResponse({'error': str(e)}, status=500)
 
 
+MAX_FARM_PAGE_SIZE = 200
+
+
+def serialize_farm(farm, fields=FARM_FIELDS):
+    data = {}
+    for field in fields:
+        if field == 'crop':
+            data['crop'] = farm.crop.get_name_display() if farm.crop else None
+        else:
+            data[field] = getattr(farm, field)
+    return data
+
+
 @csrf_exempt
 def get_farms(request):
     """Get all farms or create a new one"""
     if request.method == 'GET':
-        farms = Farm.objects.all().order_by('-created_at')
-        farms_data = []
-        for farm in farms:
-            farms_data.append({
-                'id': farm.id,
-                'name': farm.name,
-                'location_name': farm.location_name,
-                'latitude': farm.latitude,
-                'longitude': farm.longitude,
-                'crop': farm.crop.get_name_display() if farm.crop else None,
-            })
-        return JsonResponse(farms_data, safe=False)
+        # Newest first, one page at a time; the next page is reached through
+        # the cursor in the Link / X-Next-Cursor headers so the body stays a list
+        fields = FARM_FIELDS
+        if request.GET.get('fields'):
+            fields = [field.strip() for field in request.GET['fields'].split(',') if field.strip()]
+            unknown = sorted(set(fields) - set(FARM_FIELDS))
+            if unknown:
+                return JsonResponse({'error': f"Unknown fields: {', '.join(unknown)}"}, status=400)
+        
+        try:
+            limit = int(request.GET.get('limit', FARM_PAGE_SIZE))
+        except ValueError:
+            return JsonResponse({'error': 'limit must be an integer'}, status=400)
+        limit = max(1, min(limit, MAX_FARM_PAGE_SIZE))
+        
+        farms = queries.farm_listing(request.user, fields)
+        
+        try:
+            page, next_cursor = keyset_page(farms, request.GET.get('cursor'), limit)
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        response = JsonResponse([serialize_farm(farm, fields) for farm in page], safe=False)
+        if next_cursor:
+            params = request.GET.copy()
+            params['cursor'] = next_cursor
+            response['Link'] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+            response['X-Next-Cursor'] = next_cursor
+        return response
     
     elif request.method == 'POST':
         """Create a new farm"""
@@ -155,6 +196,7 @@ def get_farms(request):
             crop = Crop.objects.get(id=crop_id) if crop_id else None
             
             farm = Farm.objects.create(
+                user=request.user if request.user.is_authenticated else None,
                 name=data.get('name'),
                 latitude=float(data.get('latitude')),
                 longitude=float(data.get('longitude')),
@@ -162,84 +204,363 @@ def get_farms(request):
                 crop=crop
             )
             
-            return JsonResponse({
-                'id': farm.id,
-                'name': farm.name,
-                'location_name': farm.location_name,
-                'latitude': farm.latitude,
-                'longitude': farm.longitude,
-                'crop': farm.crop.get_name_display() if farm.crop else None,
-            }, status=201)
+            # Fetch its first weather now so the read endpoint has data soon
+            refresh_in_background(farm)
+            return JsonResponse(serialize_farm(farm), status=201)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=400)
 
 
+def farm_weather_validators(farm_id):
+    """(etag, last_modified, checked_at, version) for a farm's weather payload, or None
+    
+    Read from the farm's sync state in one indexed lookup. The payload also
+    changes as time passes (forecast steps move into the past), so the
+    current forecast step is part of the validators. `version` is the id of
+    the event stream's latest update event for the farm.
+    """
+    row = WeatherSyncState.objects.filter(farm_id=farm_id).values_list(
+        'weather_changed_at', 'insights_changed_at', 'insight_fingerprint', 'checked_at', 'farm__updated_at'
+    ).first()
+    if row is None or row[0] is None:
+        return None
+    weather_changed_at, insights_changed_at, insight_fingerprint, checked_at, farm_updated_at = row
+    
+    step = int(timezone.now().timestamp()) // FORECAST_STEP_SECONDS * FORECAST_STEP_SECONDS
+    changes = [weather_changed_at, insights_changed_at, farm_updated_at]
+    last_modified = max([int(value.timestamp()) for value in changes if value] + [step])
+    etag = '"%s"' % content_fingerprint([
+        farm_id, step, insight_fingerprint,
+        *[value.isoformat() if value else None for value in changes],
+    ])[:32]
+    return etag, last_modified, checked_at, version_id((weather_changed_at, insights_changed_at))
+
+
+def serialize_weather(farm, current_weather, forecast_data, insights):
+    """Weather payload for one farm from its stored rows"""
+    return {
+        'location': farm.location_name,
+        'current': {
+            'temperature': current_weather.temperature if current_weather else 0,
+            'feels_like': current_weather.feels_like if current_weather else 0,
+            'humidity': current_weather.humidity if current_weather else 0,
+            'pressure': current_weather.pressure if current_weather else 0,
+            'wind_speed': current_weather.wind_speed if current_weather else 0,
+            'weather_condition': current_weather.weather_condition if current_weather else 'Unknown',
+            'weather_description': current_weather.weather_description if current_weather else 'Unknown',
+        },
+        'forecast': [
+            {
+                'timestamp': w.timestamp.isoformat(),
+                'temperature': w.temperature,
+                'humidity': w.humidity,
+                'weather_condition': w.weather_condition,
+                'weather_description': w.weather_description,
+                'precipitation': w.precipitation,
+            }
+            for w in forecast_data
+        ],
+        'insights': [
+            {
+                'title': insight.title,
+                'description': insight.description,
+                'insight_type': insight.get_insight_type_display(),
+                'priority': insight.priority,
+            }
+            for insight in insights
+        ]
+    }
+
+
+def is_stale(checked_at):
+    """Whether weather last polled at `checked_at` is due for a refresh"""
+    return checked_at is None or checked_at < timezone.now() - refresh_max_age()
+
+
+def cacheable(response, validators):
+    """Attach validators and shared-cache freshness to a weather read"""
+    if not validators:
+        # Nothing stored yet: don't let caches hold on to the empty snapshot
+        patch_cache_control(response, no_store=True)
+        return response
+    response['ETag'] = validators[0]
+    response['Last-Modified'] = http_date(validators[1])
+    # Lets clients open the event stream without replaying this version
+    response['X-Weather-Version'] = validators[3]
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'WEATHER_API_MAX_AGE', 60))
+    return response
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_farm_weather(request, farm_id):
-    """Get weather data for a specific farm"""
+    """Get the stored weather snapshot for a specific farm
+
+    Never waits on the provider, so responses can be cached by proxies.
+    Stale or missing data is served as-is while a background refresh is
+    queued; the scheduler and the refresh endpoint update it too.
+    """
     try:
-        farm = Farm.objects.get(id=farm_id)
+        # Answer revalidations (If-None-Match / If-Modified-Since) before
+        # loading or serializing anything
+        validators = farm_weather_validators(farm_id)
+        if validators:
+            etag, last_modified, checked_at, _ = validators
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                if is_stale(checked_at):
+                    refresh_in_background(Farm.objects.select_related('crop').get(id=farm_id))
+                return cacheable(not_modified, validators)
         
-        # Fetch fresh weather data
-        weather_service = WeatherService()
-        weather_summary = weather_service.get_weather_summary(farm)
+        farm = Farm.objects.select_related('crop').get(id=farm_id)
+        if validators is None or is_stale(validators[2]):
+            refresh_in_background(farm)
         
         # Get stored weather data
-        current_weather = WeatherData.objects.filter(
-            farm=farm,
-            timestamp__lte=datetime.now()
-        ).order_by('-timestamp').first()
-        
-        forecast_data = WeatherData.objects.filter(
-            farm=farm,
-            timestamp__gte=datetime.now()
-        ).order_by('timestamp')[:40]
-        
-        # Get insights
-        insight_generator = InsightGenerator()
-        insights = insight_generator.generate_insights(farm)
-        
-        active_insights = FarmingInsight.objects.filter(
-            farm=farm,
-            valid_until__gte=datetime.now()
-        ).order_by('-priority', 'valid_from')
-        
-        # Format response
-        response_data = {
-            'location': farm.location_name,
-            'current': {
-                'temperature': current_weather.temperature if current_weather else weather_summary.get('temp', 0),
-                'feels_like': current_weather.feels_like if current_weather else weather_summary.get('feels_like', 0),
-                'humidity': current_weather.humidity if current_weather else weather_summary.get('humidity', 0),
-                'pressure': current_weather.pressure if current_weather else weather_summary.get('pressure', 0),
-                'wind_speed': current_weather.wind_speed if current_weather else weather_summary.get('wind_speed', 0),
-                'weather_condition': current_weather.weather_condition if current_weather else weather_summary.get('condition', 'Unknown'),
-                'weather_description': current_weather.weather_description if current_weather else weather_summary.get('description', 'Unknown'),
+        now = timezone.now()
+        current_weather = queries.current_weather(now, farm).first()
+        forecast_data = queries.forecast(now, farm)
+        active_insights = queries.active_insights(now, farm)
+        
+        response_data = serialize_weather(farm, current_weather, forecast_data, active_insights[:10])
+        return cacheable(JsonResponse(response_data), validators)
+    except Farm.DoesNotExist:
+        return JsonResponse({'error': 'Farm not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+async def farm_weather_events(request, farm_id):
+    """Stream server-sent `update` events when a farm's weather or insights change
+
+    Clients re-read GET /api/farms/<id>/weather/ on each event instead of
+    polling it. Needs an ASGI server to hold the stream open; under WSGI the
+    current state is sent and the client reconnects after the retry delay.
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    if not await Farm.objects.filter(id=farm_id).aexists():
+        return JsonResponse({'error': 'Farm not found'}, status=404)
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(
+            farm_event_stream(farm_id, last_event_id, max_age=getattr(settings, 'WEATHER_EVENTS_MAX_AGE', 600)),
+            content_type='text/event-stream',
+        )
+    else:
+        body = f'retry: {int(poll_interval() * 1000)}\n\n'
+        version = await update_version(farm_id)
+        if version is not None and last_event_id != version_id(version):
+            body += format_event(farm_id, version)
+        response = HttpResponse(body, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+MAX_BATCH_FARMS = 100
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_farms_weather(request):
+    """Get the stored weather of several farms at once (?ids=1,2,3)
+
+    Farms, current conditions, forecasts and insights are each loaded with
+    one query for the whole batch (per-farm limits are applied in SQL), so
+    the cost does not grow with the number of farms requested.
+    """
+    try:
+        farm_ids = list(dict.fromkeys(int(value) for value in request.GET.get('ids', '').split(',') if value.strip()))
+    except ValueError:
+        return JsonResponse({'error': 'ids must be a comma-separated list of farm ids'}, status=400)
+    if not farm_ids:
+        return JsonResponse({'error': 'ids is required'}, status=400)
+    if len(farm_ids) > MAX_BATCH_FARMS:
+        return JsonResponse({'error': f'At most {MAX_BATCH_FARMS} farms per request'}, status=400)
+    
+    try:
+        now = timezone.now()
+        farms = Farm.objects.filter(id__in=farm_ids).prefetch_related(
+            Prefetch(
+                'weather_records',
+                queryset=queries.current_weather(now),
+                to_attr='current_rows',
+            ),
+            Prefetch(
+                'weather_records',
+                queryset=queries.forecast(now),
+                to_attr='forecast_rows',
+            ),
+            Prefetch(
+                'insights',
+                queryset=queries.active_insights(now)[:10],
+                to_attr='active_insights',
+            ),
+        )
+        farms = {farm.id: farm for farm in farms}
+        
+        results = []
+        for farm_id in farm_ids:
+            farm = farms.get(farm_id)
+            if farm is None:
+                continue
+            current_weather = farm.current_rows[0] if farm.current_rows else None
+            results.append({
+                'farm': farm.id,
+                **serialize_weather(farm, current_weather, farm.forecast_rows, farm.active_insights),
+            })
+        
+        response = JsonResponse({
+            'results': results,
+            'not_found': [farm_id for farm_id in farm_ids if farm_id not in farms],
+        })
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'WEATHER_API_MAX_AGE', 60))
+        return response
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def serialize_weather_row(w):
+    return {
+        'id': w.id,
+        'timestamp': w.timestamp.isoformat(),
+        'temperature': w.temperature,
+        'feels_like': w.feels_like,
+        'humidity': w.humidity,
+        'pressure': w.pressure,
+        'wind_speed': w.wind_speed,
+        'precipitation': w.precipitation,
+        'weather_condition': w.weather_condition,
+        'weather_description': w.weather_description,
+    }
+
+
+def serialize_insight_row(insight):
+    return {
+        'id': insight.id,
+        'title': insight.title,
+        'description': insight.description,
+        'insight_type': insight.get_insight_type_display(),
+        'priority': insight.priority,
+        'valid_from': insight.valid_from.isoformat(),
+        'valid_until': insight.valid_until.isoformat(),
+    }
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_farm_weather_changes(request, farm_id):
+    """Get the weather and insight rows of a farm changed since ?cursor=
+
+    Without a cursor, or when the cursor is older than the change log, the
+    response is a full snapshot with "reset": true and the client replaces
+    its local copy. Otherwise only rows added or changed since the cursor
+    are sent, plus the ids of deleted forecast slots and expired insights.
+    Pass the returned cursor to the next call; "has_more" means another
+    call is needed to catch up.
+    """
+    cursor = request.GET.get('cursor') or None
+    if cursor is not None:
+        try:
+            cursor = int(cursor)
+        except ValueError:
+            return JsonResponse({'error': f'Invalid cursor: {cursor}'}, status=400)
+    
+    try:
+        farm = Farm.objects.get(id=farm_id)
+        
+        # Change log ids are commit-ordered (see change_log_lock), so no
+        # change below the cursor handed out can still be pending; one
+        # transaction keeps the entries and the rows they point at consistent
+        with transaction.atomic():
+            reset = cursor is None
+            if not reset:
+                try:
+                    weather, insights, next_cursor, has_more = changes_since(farm, cursor)
+                except CursorExpired:
+                    reset = True
+        
+            if reset:
+                # Read the cursor first: changes landing during the snapshot are
+                # sent again next time, which clients apply idempotently
+                next_cursor, has_more = latest_cursor(), False
+                now = timezone.now()
+                weather_rows = list(queries.current_weather(now, farm)) + list(queries.forecast(now, farm))
+                insight_rows = list(queries.active_insights(now, farm))
+                deleted, expired = [], []
+            else:
+                weather_rows, insight_rows = changed_rows(weather, insights)
+                # Rows changed and since removed (e.g. compacted or pruned) count as gone
+                found_weather = {w.id for w in weather_rows}
+                found_insights = {insight.id for insight in insight_rows}
+                deleted = [pk for pk, action in weather.items() if action == 'DELETE' or pk not in found_weather]
+                expired = [pk for pk, action in insights.items() if action == 'EXPIRE' or pk not in found_insights]
+        
+        return JsonResponse({
+            'cursor': str(next_cursor),
+            'reset': reset,
+            'has_more': has_more,
+            'weather': {
+                'upserted': [serialize_weather_row(w) for w in weather_rows],
+                'deleted': deleted,
             },
-            'forecast': [
-                {
-                    'timestamp': w.timestamp.isoformat(),
-                    'temperature': w.temperature,
-                    'humidity': w.humidity,
-                    'weather_condition': w.weather_condition,
-                    'weather_description': w.weather_description,
-                    'precipitation': w.precipitation,
-                }
-                for w in forecast_data
-            ],
-            'insights': [
-                {
-                    'title': insight.title,
-                    'description': insight.description,
-                    'insight_type': insight.get_insight_type_display(),
-                    'priority': insight.priority,
-                }
-                for insight in active_insights[:10]
-            ]
-        }
+            'insights': {
+                'upserted': [serialize_insight_row(insight) for insight in insight_rows],
+                'expired': expired,
+            },
+        })
+    except Farm.DoesNotExist:
+        return JsonResponse({'error': 'Farm not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def refresh_status(farm, status):
+    refreshed_at = last_refreshed(farm)
+    return {
+        'farm': farm.id,
+        'status': status,
+        'refreshed_at': refreshed_at.isoformat() if refreshed_at else None,
+        'stale': is_stale(refreshed_at),
+    }
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def refresh_farm_weather(request, farm_id):
+    """Refresh a farm's stored weather and insights, or report refresh status
+
+    POST queues a background refresh and answers 202 at once; with ?wait=1
+    it refreshes before answering (502 when the provider returned nothing).
+    GET only reports the status.
+    """
+    try:
+        farm = Farm.objects.select_related('crop').get(id=farm_id)
+        
+        if request.method == 'GET':
+            status = 'queued' if refresh_pending(farm.id) else 'idle'
+            response = JsonResponse(refresh_status(farm, status))
+            patch_cache_control(response, no_store=True)
+            return response
+        
+        if request.GET.get('wait') in ('1', 'true'):
+            if refresh_farm(farm, max_age=None if request.GET.get('force') else refresh_max_age()):
+                return JsonResponse(refresh_status(farm, 'refreshed'))
+            # Nothing new stored: either the data was already fresh or the
+            # provider failed, which only the stored poll time tells apart
+            status = refresh_status(farm, 'fresh')
+            if status['stale'] or request.GET.get('force'):
+                status['status'] = 'failed'
+                return JsonResponse(status, status=502)
+            return JsonResponse(status)
         
-        return JsonResponse(response_data)
+        status = 'queued' if refresh_in_background(farm) else 'already_queued'
+        response = JsonResponse(refresh_status(farm, status), status=202)
+        response['Location'] = reverse('api_farm_weather', args=[farm.id])
+        return response
     except Farm.DoesNotExist:
         return JsonResponse({'error': 'Farm not found'}, status=404)
     except Exception as e:
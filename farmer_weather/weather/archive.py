@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+from datetime import datetime, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+
+from .models import WeatherData
+
+
+# Column name -> dtype of the .npy file it is stored in
+NUMERIC_COLUMNS = {
+    'timestamp': np.int64,  # Unix seconds, UTC
+    'temperature': np.float32,
+    'feels_like': np.float32,
+    'humidity': np.float32,
+    'pressure': np.float32,
+    'wind_speed': np.float32,
+    'precipitation': np.float32,
+    'clouds': np.float32,
+    'fetched_at': np.int64,
+}
+# Stored as integer codes into a per-partition category list
+CATEGORY_COLUMNS = ['weather_condition', 'weather_description']
+
+COLUMNS = [*NUMERIC_COLUMNS, *CATEGORY_COLUMNS]
+DATETIME_COLUMNS = [COLUMNS.index('timestamp'), COLUMNS.index('fetched_at')]
+
+META_FILE = '_meta.json'
+
+
+def partition_path(root, farm_id, month):
+    """Directory of one farm-month partition, e.g. root/farm=12/month=2025-06"""
+    return Path(root) / f'farm={farm_id}' / f'month={month}'
+
+
+def _epoch(value):
+    return int(value.timestamp())
+
+
+def _write_partition(root, farm_id, month, rows):
+    """Write one partition's rows as column files, replacing it atomically"""
+    target = partition_path(root, farm_id, month)
+    staging = target.with_name(target.name + '.tmp')
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    values = dict(zip(COLUMNS, zip(*rows)))
+
+    for name, dtype in NUMERIC_COLUMNS.items():
+        np.save(staging / f'{name}.npy', np.asarray(values[name], dtype=dtype))
+
+    categories = {}
+    for name in CATEGORY_COLUMNS:
+        labels, codes = np.unique(np.asarray(values[name], dtype=object).astype(str), return_inverse=True)
+        np.save(staging / f'{name}.npy', codes.astype(np.uint16))
+        categories[name] = labels.tolist()
+
+    (staging / META_FILE).write_text(json.dumps({
+        'farm_id': farm_id,
+        'month': month,
+        'rows': len(rows),
+        'columns': {name: np.dtype(dtype).str for name, dtype in NUMERIC_COLUMNS.items()},
+        'categories': categories,
+    }))
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+
+
+def export_weather(root, since=None, until=None, farm_ids=None, chunk_size=10000):
+    """Stream WeatherData into per farm-month columnar partitions under root
+
+    Rows are read in (farm, timestamp) order with a server-side iterator, so
+    only the partition being assembled is held in memory. `since`/`until`
+    bound the timestamps exported (until is exclusive). Returns a list of
+    (farm_id, month, rows) for the partitions written.
+    """
+    rows = WeatherData.objects.all()
+    if since is not None:
+        rows = rows.filter(timestamp__gte=since)
+    if until is not None:
+        rows = rows.filter(timestamp__lt=until)
+    if farm_ids:
+        rows = rows.filter(farm_id__in=farm_ids)
+
+    stream = rows.order_by('farm_id', 'timestamp').values_list('farm_id', *COLUMNS).iterator(chunk_size=chunk_size)
+
+    written = []
+    current_key, buffer = None, []
+    for farm_id, *values in stream:
+        timestamp = values[0]
+        key = (farm_id, timestamp.astimezone(dt_timezone.utc).strftime('%Y-%m'))
+        if key != current_key:
+            if buffer:
+                _write_partition(root, *current_key, buffer)
+                written.append((*current_key, len(buffer)))
+            current_key, buffer = key, []
+        for index in DATETIME_COLUMNS:
+            values[index] = _epoch(values[index])
+        buffer.append(values)
+
+    if buffer:
+        _write_partition(root, *current_key, buffer)
+        written.append((*current_key, len(buffer)))
+    return written
+
+
+class ArchivePartition:
+    """Read-only, memory-mapped view of one exported farm-month partition"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / META_FILE).read_text())
+        self.farm_id = self.meta['farm_id']
+        self.month = self.meta['month']
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getitem__(self, name):
+        """Column as a memory-mapped array (no copy); category columns are codes"""
+        return np.load(self.path / f'{name}.npy', mmap_mode='r')
+
+    def timestamps(self):
+        """Timestamp column as numpy datetime64[s] (a view, not a copy)"""
+        return self['timestamp'].view('datetime64[s]')
+
+    def labels(self, name):
+        """Decoded values of a category column"""
+        return np.asarray(self.meta['categories'][name], dtype=object)[self[name]]
+
+
+def open_archive(root, farm_id=None, months=None):
+    """Yield ArchivePartition objects under root, optionally filtered"""
+    farm_dirs = [Path(root) / f'farm={farm_id}'] if farm_id is not None else sorted(Path(root).glob('farm=*'))
+    for farm_dir in farm_dirs:
+        for month_dir in sorted(farm_dir.glob('month=*')):
+            if month_dir.name.endswith('.tmp'):
+                continue
+            if months and month_dir.name.split('=', 1)[1] not in months:
+                continue
+            yield ArchivePartition(month_dir)
+
+
+def month_start(value):
+    """Parse YYYY-MM into an aware UTC datetime at the start of that month"""
+    return datetime.strptime(value, '%Y-%m').replace(tzinfo=dt_timezone.utc)
@@ -0,0 +1,83 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+from .locks import change_log_lock
+from .models import ChangeLogEntry, FarmingInsight, WeatherData
+
+
+CHANGE_BATCH_SIZE = 1000
+DELTA_PAGE_SIZE = 500
+
+
+class CursorExpired(ValueError):
+    """The changes after a cursor have been pruned; the client must resync"""
+
+
+def log_changes(kind, action, rows):
+    """Record `action` on (farm_id, object_id) `rows`; call inside the writing transaction"""
+    rows = list(rows)
+    if not rows:
+        return
+    change_log_lock()
+    ChangeLogEntry.objects.bulk_create(
+        [ChangeLogEntry(farm_id=farm_id, kind=kind, action=action, object_id=object_id)
+         for farm_id, object_id in rows],
+        batch_size=CHANGE_BATCH_SIZE,
+    )
+
+
+def latest_cursor():
+    """Cursor positioned after every change logged so far"""
+    return ChangeLogEntry.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+
+def changes_since(farm, cursor, limit=DELTA_PAGE_SIZE):
+    """Net changes to a farm's rows after `cursor`
+
+    Several entries for one row collapse into the latest. Returns
+    (weather, insights, next_cursor, has_more) where weather and insights
+    map object ids to their last action. Raises CursorExpired when entries
+    after the cursor may have been pruned (or the cursor is not from this
+    log), in which case the client has to start over from a snapshot.
+    """
+    bounds = ChangeLogEntry.objects.aggregate(oldest=Min('id'), latest=Max('id'))
+    if bounds['oldest'] is not None and not bounds['oldest'] - 1 <= cursor <= bounds['latest']:
+        raise CursorExpired(f'Cursor {cursor} is outside the change log')
+
+    entries = list(ChangeLogEntry.objects.filter(farm=farm, id__gt=cursor).order_by('id').values_list(
+        'id', 'kind', 'action', 'object_id'
+    )[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    changed = {'WEATHER': {}, 'INSIGHT': {}}
+    for _, kind, action, object_id in entries:
+        changed[kind][object_id] = action
+    next_cursor = entries[-1][0] if entries else cursor
+    return changed['WEATHER'], changed['INSIGHT'], next_cursor, has_more
+
+
+def changed_rows(weather, insights):
+    """Current WeatherData and FarmingInsight rows for the upserted ids"""
+    weather_ids = [object_id for object_id, action in weather.items() if action == 'UPSERT']
+    insight_ids = [object_id for object_id, action in insights.items() if action == 'UPSERT']
+    return (
+        list(WeatherData.objects.filter(id__in=weather_ids).order_by('timestamp')) if weather_ids else [],
+        list(FarmingInsight.objects.filter(id__in=insight_ids)) if insight_ids else [],
+    )
+
+
+def change_log_retention():
+    return timedelta(days=getattr(settings, 'WEATHER_CHANGE_LOG_RETENTION_DAYS', 7))
+
+
+def prune_change_log(older_than=None):
+    """Delete entries older than the retention period; returns how many
+
+    The newest entry is always kept: cursors from before the oldest
+    remaining entry are how pruned changes are detected.
+    """
+    cutoff = timezone.now() - (older_than or change_log_retention())
+    deleted, _ = ChangeLogEntry.objects.filter(created_at__lt=cutoff, id__lt=latest_cursor()).delete()
+    return deleted
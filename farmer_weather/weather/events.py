@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from .models import WeatherSyncState
+
+
+# Sent after a transaction that wrote weather (sender=WeatherData) or
+# insights (sender=FarmingInsight) commits, with farm_ids=[...]
+weather_updated = Signal()
+
+logger = logging.getLogger(__name__)
+
+# Largest IN list the poller sends in one query
+POLL_CHUNK_SIZE = 500
+
+
+def notify_weather_updated(sender, farm_ids):
+    """Send weather_updated for `farm_ids` once the current transaction commits"""
+    farm_ids = list(farm_ids)
+    if farm_ids:
+        transaction.on_commit(lambda: weather_updated.send(sender=sender, farm_ids=farm_ids))
+
+
+def heartbeat_interval():
+    return getattr(settings, 'WEATHER_EVENTS_HEARTBEAT', 15)
+
+
+def poll_interval():
+    return getattr(settings, 'WEATHER_EVENTS_POLL_INTERVAL', 10)
+
+
+async def update_version(farm_id):
+    """(weather_changed_at, insights_changed_at) of a farm, or None if never refreshed"""
+    return await WeatherSyncState.objects.filter(farm_id=farm_id).values_list(
+        'weather_changed_at', 'insights_changed_at'
+    ).afirst()
+
+
+def version_id(version):
+    """Stable SSE event id for a version (sent back as Last-Event-ID on reconnect)"""
+    if version is None:
+        return ''
+    stamps = [value.isoformat() if value else '' for value in version]
+    return hashlib.sha256('|'.join(stamps).encode('utf-8')).hexdigest()[:16]
+
+
+def format_event(farm_id, version):
+    weather_changed_at, insights_changed_at = version
+    data = json.dumps({
+        'farm': farm_id,
+        'weather_changed_at': weather_changed_at.isoformat() if weather_changed_at else None,
+        'insights_changed_at': insights_changed_at.isoformat() if insights_changed_at else None,
+    })
+    return f'id: {version_id(version)}\nevent: update\ndata: {data}\n\n'
+
+
+class EventBroker:
+    """Wakes streams subscribed to a farm when its weather or insights change
+
+    Subscribers are asyncio events on the server's event loop; publish() may
+    be called from any thread. Writes made in this process arrive through
+    the weather_updated signal. Writes made elsewhere (the scheduler, other
+    workers) are picked up by one poller per event loop that checks the
+    versions of every subscribed farm in a single query per interval, so
+    idle streams cost no queries of their own.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._pollers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, farm_id):
+        """Register the calling stream for `farm_id` and return its wakeup event"""
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        with self._lock:
+            self._subscribers.setdefault(farm_id, {})[wakeup] = loop
+            if loop not in self._pollers:
+                self._pollers[loop] = loop.create_task(self._poll(loop))
+        return wakeup
+
+    def unsubscribe(self, farm_id, wakeup):
+        with self._lock:
+            subscribers = self._subscribers.get(farm_id, {})
+            subscribers.pop(wakeup, None)
+            if not subscribers:
+                self._subscribers.pop(farm_id, None)
+
+    def publish(self, farm_ids):
+        """Wake every stream subscribed to one of `farm_ids`"""
+        with self._lock:
+            targets = [
+                subscriber
+                for farm_id in farm_ids
+                for subscriber in self._subscribers.get(farm_id, {}).items()
+            ]
+        for wakeup, loop in targets:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # The loop has closed; its streams are gone
+                pass
+
+    def _farms_on(self, loop):
+        # Call with the lock held
+        return [
+            farm_id
+            for farm_id, subscribers in self._subscribers.items()
+            if any(subscriber_loop is loop for subscriber_loop in subscribers.values())
+        ]
+
+    async def _poll(self, loop):
+        known = {}
+        while True:
+            await asyncio.sleep(poll_interval())
+            with self._lock:
+                farm_ids = self._farms_on(loop)
+                if not farm_ids:
+                    self._pollers.pop(loop, None)
+                    return
+
+            changed = []
+            try:
+                for start in range(0, len(farm_ids), POLL_CHUNK_SIZE):
+                    chunk = farm_ids[start:start + POLL_CHUNK_SIZE]
+                    async for farm_id, *version in WeatherSyncState.objects.filter(farm_id__in=chunk).values_list(
+                        'farm_id', 'weather_changed_at', 'insights_changed_at'
+                    ):
+                        # Newly watched farms are published too: their streams
+                        # compare against the version they started from
+                        if known.get(farm_id) != tuple(version):
+                            changed.append(farm_id)
+                        known[farm_id] = tuple(version)
+            except Exception as e:
+                logger.warning("Weather event poll failed: %s", e)
+                continue
+
+            for farm_id in set(known) - set(farm_ids):
+                del known[farm_id]
+            if changed:
+                self.publish(changed)
+
+
+broker = EventBroker()
+
+
+@receiver(weather_updated)
+def _publish_update(sender, farm_ids, **kwargs):
+    broker.publish(farm_ids)
+
+
+async def farm_event_stream(farm_id, last_event_id=None, max_age=None):
+    """Server-sent events for one farm: an `update` event whenever its
+    weather or insights change, and a comment line as heartbeat
+
+    The current version is sent at once unless it matches `last_event_id`
+    (from a reconnecting client), so no change is missed between
+    connections. The stream ends after `max_age` seconds and the client
+    reconnects.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_age if max_age else None
+    wakeup = broker.subscribe(farm_id)
+    try:
+        yield f'retry: {int(poll_interval() * 1000)}\n\n'
+        version = await update_version(farm_id)
+        if version is not None and last_event_id != version_id(version):
+            yield format_event(farm_id, version)
+
+        while True:
+            timeout = heartbeat_interval()
+            if deadline is not None:
+                timeout = min(timeout, deadline - loop.time())
+                if timeout <= 0:
+                    return
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                yield ': heartbeat\n\n'
+                continue
+
+            wakeup.clear()
+            current = await update_version(farm_id)
+            if current is not None and current != version:
+                version = current
+                yield format_event(farm_id, version)
+    finally:
+        broker.unsubscribe(farm_id, wakeup)
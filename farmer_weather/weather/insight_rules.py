@@ -0,0 +1,304 @@
+import hashlib
+import operator
+import string
+from collections import namedtuple
+from datetime import timedelta
+
+import numpy as np
+
+
+COMPARISONS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+RANGE_COMPARISONS = ('between', 'outside')
+AGGREGATES = ('count', 'any', 'all', 'sum', 'mean', 'min', 'max')
+
+# Crop fields rules may compare against, referenced as 'crop.<field>'
+CROP_PARAMS = [
+    'optimal_temp_min', 'optimal_temp_max',
+    'optimal_humidity_min', 'optimal_humidity_max',
+    'water_requirement', 'frost_tolerance',
+]
+
+# Series built from the raw forecast columns before any term is evaluated
+DERIVED_SERIES = {
+    'wet': lambda series: (series['precipitation'] > 2) | series['rain'],
+}
+
+
+class Term(namedtuple('Term', ['aggregate', 'series', 'window', 'op', 'ref'])):
+    """Aggregate of a series over its first `window` forecast steps (all when
+    None), or of the mask `series <op> ref` when op is given"""
+
+    def __new__(cls, aggregate, series, window=None, op=None, ref=None):
+        return super().__new__(cls, aggregate, series, window, op, ref)
+
+
+# Named terms rules refer to in conditions and description placeholders.
+# Forecast steps are 3 hours apart, so 8 steps cover 24 hours.
+TERMS = {
+    'wet_steps': Term('count', 'wet'),
+    'hot_steps': Term('count', 'temperature', op='>', ref='crop.optimal_temp_max'),
+    'cold_steps': Term('count', 'temperature', op='<', ref='crop.optimal_temp_min'),
+    'frost_risk': Term('any', 'temperature', op='<', ref=2),
+    'avg_temp_24h': Term('mean', 'temperature', window=8),
+    'avg_humidity_24h': Term('mean', 'humidity', window=8),
+    'strong_wind_24h': Term('any', 'wind_speed', window=8, op='>', ref=15),
+    'rain_total_72h': Term('sum', 'precipitation', window=24),
+    'avg_humidity_72h': Term('mean', 'humidity', window=24),
+}
+
+# Each rule fires when all of its `when` conditions hold. A condition is
+# (term or 'crop.<field>', comparison, value), where value is a constant, a
+# 'crop.<field>' reference, or a (low, high) pair for between/outside.
+# Descriptions are format strings over term names and `crop` (not the farm:
+# farms with the same forecast window and crop share one rendered result).
+# `valid_for` is a timedelta from now, or None for the end of the forecast.
+RULES = [
+    {
+        'insight_type': 'WATERING',
+        'title': 'Heavy Rainfall Expected',
+        'priority': 2,
+        'when': [('wet_steps', '>=', 3)],
+        'valid_for': None,
+        'description': 'Rain is expected for {wet_steps} days in the next 5 days. '
+                       'You can skip irrigation during this period. Ensure proper drainage '
+                       'to prevent waterlogging, especially for {crop.name}.',
+    },
+    {
+        'insight_type': 'WATERING',
+        'title': 'No Rainfall Expected',
+        'priority': 2,
+        'when': [('wet_steps', '==', 0)],
+        'valid_for': None,
+        'description': 'No significant rainfall expected in the next 5 days. '
+                       'Ensure regular irrigation for your {crop.name} crop. '
+                       'Water requirement: {crop.water_requirement}.',
+    },
+    {
+        'insight_type': 'WARNING',
+        'title': 'High Temperature Alert',
+        'priority': 3,
+        'when': [('hot_steps', '>=', 3)],
+        'valid_for': None,
+        'description': 'Temperatures above optimal range ({crop.optimal_temp_max}°C) '
+                       'expected for {hot_steps} days. Increase irrigation frequency '
+                       'and consider shade protection for {crop.name}.',
+    },
+    {
+        'insight_type': 'WARNING',
+        'title': 'Low Temperature Alert',
+        'priority': 3,
+        'when': [('cold_steps', '>=', 3)],
+        'valid_for': None,
+        'description': 'Temperatures below optimal range ({crop.optimal_temp_min}°C) '
+                       'expected for {cold_steps} days. Consider protective measures '
+                       'for {crop.name}.',
+    },
+    {
+        'insight_type': 'WARNING',
+        'title': 'Frost Risk Warning',
+        'priority': 3,
+        'when': [('crop.frost_tolerance', '==', False), ('frost_risk', '==', True)],
+        'valid_for': None,
+        'description': 'Frost conditions expected! {crop.name} is not frost-tolerant. '
+                       'Take immediate protective measures: cover plants, use frost blankets, '
+                       'or consider temporary heating solutions.',
+    },
+    {
+        'insight_type': 'PLANTING',
+        'title': 'Favorable Planting Conditions',
+        'priority': 2,
+        'when': [
+            ('avg_temp_24h', 'between', ('crop.optimal_temp_min', 'crop.optimal_temp_max')),
+            ('avg_humidity_24h', 'between', ('crop.optimal_humidity_min', 'crop.optimal_humidity_max')),
+            ('strong_wind_24h', '==', False),
+        ],
+        'valid_for': timedelta(days=3),
+        'description': 'Current weather conditions are optimal for planting {crop.name}. '
+                       'Temperature: {avg_temp_24h:.1f}°C, Humidity: {avg_humidity_24h:.1f}%. '
+                       'Next few days look promising for seed germination.',
+    },
+    {
+        'insight_type': 'PLANTING',
+        'title': 'Wait for Better Temperature',
+        'priority': 1,
+        'when': [('avg_temp_24h', 'outside', ('crop.optimal_temp_min', 'crop.optimal_temp_max'))],
+        'valid_for': timedelta(days=3),
+        'description': 'Current temperature ({avg_temp_24h:.1f}°C) is outside optimal range '
+                       '({crop.optimal_temp_min}-{crop.optimal_temp_max}°C) for {crop.name}. '
+                       'Consider waiting for more favorable conditions.',
+    },
+    {
+        'insight_type': 'WATERING',
+        'title': 'Increase Irrigation',
+        'priority': 2,
+        'when': [
+            ('rain_total_72h', '<', 5),
+            ('avg_humidity_72h', '<', 60),
+            ('crop.water_requirement', '==', 'HIGH'),
+        ],
+        'valid_for': timedelta(days=3),
+        'description': '{crop.name} requires high water. With low rainfall ({rain_total_72h:.1f}mm) '
+                       'and humidity ({avg_humidity_72h:.1f}%) expected, increase irrigation frequency. '
+                       'Best time: Early morning or evening.',
+    },
+]
+
+
+def _is_crop_ref(value):
+    return isinstance(value, str) and value.startswith('crop.')
+
+
+def _aggregate(kind, values):
+    """Reduce along the last (time) axis; NaN marks padding past a farm's forecast"""
+    if kind == 'count':
+        return np.count_nonzero(values, axis=-1)
+    if kind == 'any':
+        return np.any(values, axis=-1)
+    if kind == 'all':
+        return np.all(values, axis=-1)
+    with np.errstate(all='ignore'):
+        if kind == 'sum':
+            return np.nansum(values, axis=-1)
+        valid = ~np.isnan(values)
+        if kind == 'mean':
+            return np.nansum(values, axis=-1) / np.count_nonzero(valid, axis=-1)
+        fill = np.inf if kind == 'min' else -np.inf
+        reduced = (np.min if kind == 'min' else np.max)(np.where(valid, values, fill), axis=-1)
+        return np.where(valid.any(axis=-1), reduced, np.nan)
+
+
+class CompiledRules:
+    """Rule set checked and flattened once, evaluated in a single pass
+
+    Every term used by any rule is evaluated exactly once per call, and
+    identical term definitions (or identical predicate masks) under
+    different names share the work, so adding rules over the same data adds
+    comparisons rather than passes. Inputs may be 1-D (one farm) or
+    farms x steps arrays with crop parameters as per-farm vectors.
+    """
+
+    def __init__(self, rules, terms=TERMS):
+        self.rules = [dict(rule) for rule in rules]
+        formatter = string.Formatter()
+        used = set()
+
+        for rule in self.rules:
+            conditions = []
+            for subject, comparison, value in rule['when']:
+                if not _is_crop_ref(subject) and subject not in terms:
+                    raise ValueError(f"Rule '{rule['title']}' uses unknown term '{subject}'")
+                if comparison in RANGE_COMPARISONS:
+                    if not (isinstance(value, tuple) and len(value) == 2):
+                        raise ValueError(f"Rule '{rule['title']}': {comparison} needs a (low, high) pair")
+                elif comparison not in COMPARISONS:
+                    raise ValueError(f"Rule '{rule['title']}' uses unknown comparison '{comparison}'")
+                conditions.append((subject, comparison, value))
+                if not _is_crop_ref(subject):
+                    used.add(subject)
+            rule['when'] = conditions
+
+            placeholders = {
+                field.split('.')[0].split('[')[0]
+                for _, field, _, _ in formatter.parse(rule['description'])
+                if field
+            }
+            rule['placeholders'] = sorted(placeholders & set(terms))
+            used.update(rule['placeholders'])
+
+        for name in used:
+            term = terms[name]
+            if term.aggregate not in AGGREGATES:
+                raise ValueError(f"Term '{name}' uses unknown aggregate '{term.aggregate}'")
+            if term.op is not None and term.op not in COMPARISONS:
+                raise ValueError(f"Term '{name}' uses unknown comparison '{term.op}'")
+            if _is_crop_ref(term.ref) and term.ref[5:] not in CROP_PARAMS:
+                raise ValueError(f"Term '{name}' compares against unknown crop field '{term.ref}'")
+
+        # Unique term definitions, each evaluated once; names map onto them
+        self.terms = list(dict.fromkeys(terms[name] for name in sorted(used)))
+        self.term_names = {name: terms[name] for name in used}
+
+        # Changes whenever a rule or term definition does, so stored results
+        # computed by an older rule set are not mistaken for current ones
+        self.version = hashlib.sha256(
+            repr((rules, sorted(self.term_names.items()))).encode('utf-8')
+        ).hexdigest()[:16]
+
+    def _resolve(self, value, params):
+        if _is_crop_ref(value):
+            return params[value[5:]]
+        return value
+
+    def evaluate(self, series, params):
+        """Evaluate every term once
+
+        `series` maps forecast column names to arrays (time on the last
+        axis), `params` maps CROP_PARAMS to scalars or per-farm arrays.
+        Returns a dict of term name -> value (or per-farm array).
+        """
+        series = dict(series)
+        for name, derive in DERIVED_SERIES.items():
+            series[name] = derive(series)
+
+        masks, results = {}, {}
+        for term in self.terms:
+            values = series[term.series]
+            if term.window is not None:
+                values = values[..., :term.window]
+            if term.op is not None:
+                key = (term.series, term.window, term.op, term.ref)
+                if key not in masks:
+                    ref = self._resolve(term.ref, params)
+                    if np.ndim(ref):
+                        ref = np.asarray(ref)[..., np.newaxis]
+                    with np.errstate(invalid='ignore'):
+                        masks[key] = COMPARISONS[term.op](values, ref)
+                values = masks[key]
+            results[term] = _aggregate(term.aggregate, values)
+
+        return {name: results[term] for name, term in self.term_names.items()}
+
+    def _check(self, condition, values, params):
+        subject, comparison, value = condition
+        left = params[subject[5:]] if _is_crop_ref(subject) else values[subject]
+        if comparison in RANGE_COMPARISONS:
+            low, high = (self._resolve(bound, params) for bound in value)
+            inside = (low <= left) & (left <= high)
+            return inside if comparison == 'between' else ~inside
+        return COMPARISONS[comparison](left, self._resolve(value, params))
+
+    def fired(self, values, params):
+        """List of (rule, mask) pairs; mask is a bool or per-farm bool array"""
+        fired = []
+        for rule in self.rules:
+            mask = True
+            for condition in rule['when']:
+                mask = mask & np.asarray(self._check(condition, values, params))
+            fired.append((rule, mask))
+        return fired
+
+    def describe(self, rule, values, crop, index=None):
+        """Render a fired rule's description from one farm's term values
+
+        With `index`, values are per-farm arrays and row `index` is used.
+        """
+        context = {
+            name: values[name] if index is None else values[name][index]
+            for name in rule['placeholders']
+        }
+        return rule['description'].format(crop=crop, **context)
+
+
+def crop_params(crop):
+    """CROP_PARAMS of one crop as scalars"""
+    return {field: getattr(crop, field) for field in CROP_PARAMS}
+
+
+RULE_SET = CompiledRules(RULES)
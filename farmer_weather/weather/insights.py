@@ -1,221 +1,497 @@
-from datetime import datetime, timedelta
-from .models import FarmingInsight, Farm, WeatherData
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from .changelog import log_changes
+from .events import notify_weather_updated
+from .locks import farm_locks
+from .insight_rules import CROP_PARAMS, RULE_SET, crop_params
+from .models import FarmingInsight, Farm, WeatherData, WeatherSyncState
+from .weather_service import content_fingerprint
+
+
+FORECAST_WINDOW = 40  # Next 5 days (8 records per day)
+FLEET_BATCH_SIZE = 1000
+# Farms whose insights are written under one set of farm locks; keeps the
+# number of locks (and lock files) held at once small
+FLEET_LOCK_BATCH_SIZE = 100
+# Recomputed validity shifting by less than this does not rewrite an insight
+INSIGHT_VALIDITY_TOLERANCE = timedelta(hours=1)
+# Expired insights are kept this long before being pruned
+INSIGHT_RETENTION = timedelta(days=7)
+
+
+class ForecastSnapshot:
+    """A farm's upcoming forecast window loaded once into NumPy arrays"""
+    
+    FIELDS = ('timestamp', 'temperature', 'humidity', 'precipitation', 'wind_speed', 'weather_condition')
+    
+    def __init__(self, rows):
+        timestamps, temperature, humidity, precipitation, wind_speed, conditions = (
+            zip(*rows) if rows else ((),) * len(self.FIELDS)
+        )
+        self.timestamps = list(timestamps)
+        self.temperature = np.array(temperature, dtype=float)
+        self.humidity = np.array(humidity, dtype=float)
+        self.precipitation = np.array(precipitation, dtype=float)
+        self.wind_speed = np.array(wind_speed, dtype=float)
+        self.conditions = np.array(conditions, dtype=str)
+        self.is_rain = np.char.find(np.char.lower(self.conditions), 'rain') >= 0
+    
+    @classmethod
+    def load(cls, farm, window=FORECAST_WINDOW):
+        """Read the forecast window with a single query"""
+        rows = WeatherData.objects.filter(
+            farm=farm,
+            timestamp__gte=timezone.now()
+        ).order_by('timestamp').values_list(*cls.FIELDS)[:window]
+        return cls(list(rows))
+    
+    def __len__(self):
+        return len(self.timestamps)
+    
+    def series(self):
+        """Columns the insight rules evaluate, keyed by series name"""
+        return {
+            'temperature': self.temperature,
+            'humidity': self.humidity,
+            'precipitation': self.precipitation,
+            'wind_speed': self.wind_speed,
+            'rain': self.is_rain,
+        }
+    
+    def fingerprint(self):
+        """Hash of the window contents"""
+        return _window_fingerprint(
+            self.timestamps,
+            (self.temperature, self.humidity, self.precipitation, self.wind_speed),
+            self.conditions.tolist(),
+        )
+
+
+class ForecastMatrix:
+    """Upcoming forecast windows of many farms as farms x steps arrays
+
+    Row i belongs to farm_ids[i]; farms with fewer than `window` upcoming
+    steps are padded with NaN (and no rain / empty condition).
+    """
+    
+    def __init__(self, rows, window=FORECAST_WINDOW):
+        if rows:
+            farm_col, *columns = zip(*rows)
+        else:
+            farm_col, columns = (), [()] * len(ForecastSnapshot.FIELDS)
+        farm_col = np.array(farm_col, dtype=np.int64)
+        
+        # Rows arrive ordered by (farm, timestamp): a row's step is its offset
+        # from the first row of its farm
+        self.farm_ids, starts, counts = np.unique(farm_col, return_index=True, return_counts=True)
+        row = np.searchsorted(self.farm_ids, farm_col)
+        step = np.arange(len(farm_col)) - starts[row]
+        keep = step < window
+        row, step = row[keep], step[keep]
+        self.lengths = np.minimum(counts, window)
+        shape = (len(self.farm_ids), window)
+        
+        def matrix(values, dtype, fill):
+            result = np.full(shape, fill, dtype=dtype)
+            result[row, step] = np.asarray(values, dtype=dtype)[keep]
+            return result
+        
+        timestamps, temperature, humidity, precipitation, wind_speed, conditions = columns
+        self.timestamps = matrix(timestamps, object, None)
+        self.temperature = matrix(temperature, float, np.nan)
+        self.humidity = matrix(humidity, float, np.nan)
+        self.precipitation = matrix(precipitation, float, np.nan)
+        self.wind_speed = matrix(wind_speed, float, np.nan)
+        self.conditions = matrix(conditions, object, '')
+        self.is_rain = np.char.find(np.char.lower(self.conditions.astype(str)), 'rain') >= 0
+    
+    @classmethod
+    def load(cls, farm_ids, window=FORECAST_WINDOW):
+        """Read the forecast windows of all `farm_ids` with a single query"""
+        rows = WeatherData.objects.filter(
+            farm_id__in=farm_ids,
+            timestamp__gte=timezone.now()
+        ).order_by('farm_id', 'timestamp').values_list('farm_id', *ForecastSnapshot.FIELDS)
+        return cls(list(rows), window)
+    
+    def __len__(self):
+        return len(self.farm_ids)
+    
+    def series(self):
+        """Columns the insight rules evaluate, keyed by series name"""
+        return {
+            'temperature': self.temperature,
+            'humidity': self.humidity,
+            'precipitation': self.precipitation,
+            'wind_speed': self.wind_speed,
+            'rain': self.is_rain,
+        }
+    
+    def last_timestamp(self, index):
+        return self.timestamps[index, self.lengths[index] - 1]
+    
+    def fingerprint(self, index):
+        """Same hash ForecastSnapshot.fingerprint gives for this farm's window"""
+        length = self.lengths[index]
+        return _window_fingerprint(
+            self.timestamps[index, :length].tolist(),
+            (self.temperature[index, :length], self.humidity[index, :length],
+             self.precipitation[index, :length], self.wind_speed[index, :length]),
+            self.conditions[index, :length].tolist(),
+        )
+
+
+def _window_fingerprint(timestamps, columns, conditions):
+    digest = hashlib.sha256()
+    digest.update(repr([ts.isoformat() for ts in timestamps]).encode('utf-8'))
+    for values in columns:
+        digest.update(np.ascontiguousarray(values).tobytes())
+    digest.update('\0'.join(conditions).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class InsightCache:
+    """Computed insight specs keyed by insight fingerprint
+    
+    A per-process LRU in front of an optional shared Django cache, so farms
+    with the same forecast window and crop (e.g. in one grid cell), including
+    those handled by other workers, share one evaluation of the rules.
+    """
+    
+    def __init__(self, max_size=4096, alias=None, timeout=None):
+        self.max_size = max_size
+        self.alias = alias
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _key(self, fingerprint):
+        return f'insights:{fingerprint}'
+    
+    def _remember(self, fingerprint, spec):
+        with self._lock:
+            self._entries[fingerprint] = spec
+            self._entries.move_to_end(fingerprint)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def get_many(self, fingerprints):
+        found = {}
+        with self._lock:
+            for fingerprint in fingerprints:
+                if fingerprint in self._entries:
+                    self._entries.move_to_end(fingerprint)
+                    found[fingerprint] = self._entries[fingerprint]
+        
+        missing = [fingerprint for fingerprint in fingerprints if fingerprint not in found]
+        if missing and self.alias:
+            shared = caches[self.alias].get_many([self._key(fingerprint) for fingerprint in missing])
+            for fingerprint in missing:
+                spec = shared.get(self._key(fingerprint))
+                if spec is not None:
+                    found[fingerprint] = spec
+                    self._remember(fingerprint, spec)
+        return found
+    
+    def get(self, fingerprint):
+        return self.get_many([fingerprint]).get(fingerprint)
+    
+    def set_many(self, specs):
+        for fingerprint, spec in specs.items():
+            self._remember(fingerprint, spec)
+        if self.alias:
+            caches[self.alias].set_many(
+                {self._key(fingerprint): spec for fingerprint, spec in specs.items()}, self.timeout
+            )
+    
+    def set(self, fingerprint, spec):
+        self.set_many({fingerprint: spec})
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+insight_cache = InsightCache(
+    max_size=getattr(settings, 'WEATHER_INSIGHT_CACHE_SIZE', 4096),
+    alias=getattr(settings, 'WEATHER_INSIGHT_CACHE_ALIAS', 'default'),
+    timeout=getattr(settings, 'WEATHER_INSIGHT_CACHE_TTL', 6 * 60 * 60),
+)
 
 
 class InsightGenerator:
     """Generate farming insights based on weather conditions and crop requirements"""
     
     def generate_insights(self, farm):
-        """Generate all insights for a farm"""
+        """Generate all insights for a farm
+        
+        Callers hold the farm's farm_lock (refresh_farm and BulkRefresher do).
+        """
         if not farm.crop:
             return []
         
-        insights = []
-        weather_data = WeatherData.objects.filter(
-            farm=farm,
-            timestamp__gte=datetime.now()
-        ).order_by('timestamp')[:40]  # Next 5 days (8 records per day)
+        forecast = ForecastSnapshot.load(farm)
         
-        if not weather_data:
-            return insights
+        if not len(forecast):
+            return []
         
-        # Clear old insights
-        FarmingInsight.objects.filter(
-            farm=farm,
-            valid_until__lt=datetime.now()
-        ).delete()
+        # Insights only depend on this forecast window and the crop; skip the
+        # rewrite when neither changed since the last run
+        state, _ = WeatherSyncState.objects.get_or_create(farm=farm)
+        fingerprint = self._fingerprint(farm.crop, forecast)
+        if fingerprint == state.insight_fingerprint:
+            return list(FarmingInsight.objects.filter(
+                farm=farm,
+                valid_until__gte=timezone.now()
+            ))
         
-        # Clear ALL existing insights for this farm to avoid duplicates
-        FarmingInsight.objects.filter(farm=farm).delete()
+        spec = insight_cache.get(fingerprint)
+        if spec is None:
+            spec = self._evaluate(farm.crop, forecast)
+            insight_cache.set(fingerprint, spec)
         
-        # Generate various insights
-        insights.extend(self._check_rainfall(farm, weather_data))
-        insights.extend(self._check_temperature(farm, weather_data))
-        insights.extend(self._check_frost(farm, weather_data))
-        insights.extend(self._check_planting_window(farm, weather_data))
-        insights.extend(self._check_watering_needs(farm, weather_data))
+        now = timezone.now()
+        computed = self._materialize(farm, spec, forecast.timestamps[-1], now)
+        with transaction.atomic():
+            insights, _ = self._sync([farm.id], computed, now)
+            state.insight_fingerprint = fingerprint
+            state.insights_changed_at = now
+            state.save(update_fields=['insight_fingerprint', 'insights_changed_at'])
+            notify_weather_updated(FarmingInsight, [farm.id])
         
         return insights
     
-    def _check_rainfall(self, farm, weather_data):
-        """Check for rainfall and provide recommendations"""
-        insights = []
-        rainy_days = []
+    def _sync(self, farm_ids, computed, now):
+        """Apply the difference between computed and active insights
         
-        # Convert to list to avoid queryset issues
-        weather_list = list(weather_data)
+        Insights are matched on (farm, type, title). A match keeps its id and
+        valid_from and is only rewritten when its text, priority or validity
+        (beyond INSIGHT_VALIDITY_TOLERANCE) changed; active insights that are
+        no longer produced are expired, and long-expired ones are pruned.
+        Returns (current insights, rows written).
+        """
+        active, expired = {}, []
+        for insight in FarmingInsight.objects.filter(farm_id__in=farm_ids, valid_until__gt=now).order_by('id'):
+            key = (insight.farm_id, insight.insight_type, insight.title)
+            if key in active:
+                expired.append(insight)
+            else:
+                active[key] = insight
         
-        for weather in weather_list:
-            if weather.precipitation > 2 or 'rain' in weather.weather_condition.lower():
-                rainy_days.append(weather.timestamp.date())
+        current, created, updated = [], [], []
+        for insight in computed:
+            existing = active.pop((insight.farm_id, insight.insight_type, insight.title), None)
+            if existing is None:
+                created.append(insight)
+                continue
+            if (existing.description != insight.description
+                    or existing.priority != insight.priority
+                    or abs(existing.valid_until - insight.valid_until) > INSIGHT_VALIDITY_TOLERANCE):
+                existing.description = insight.description
+                existing.priority = insight.priority
+                existing.valid_until = insight.valid_until
+                existing.updated_at = now
+                updated.append(existing)
+            current.append(existing)
+        expired.extend(active.values())
         
-        if len(rainy_days) >= 3:
-            # Multiple rainy days expected
-            insight = FarmingInsight.objects.create(
-                farm=farm,
-                insight_type='WATERING',
-                title='Heavy Rainfall Expected',
-                description=f'Rain is expected for {len(rainy_days)} days in the next 5 days. '
-                           f'You can skip irrigation during this period. Ensure proper drainage '
-                           f'to prevent waterlogging, especially for {farm.crop.name}.',
-                priority=2,
-                valid_from=datetime.now(),
-                valid_until=weather_list[-1].timestamp if weather_list else datetime.now() + timedelta(days=5)
+        FarmingInsight.objects.bulk_create(created, batch_size=FLEET_BATCH_SIZE)
+        if updated:
+            FarmingInsight.objects.bulk_update(
+                updated, ['description', 'priority', 'valid_until', 'updated_at'], batch_size=FLEET_BATCH_SIZE
             )
-            insights.append(insight)
-        elif len(rainy_days) == 0:
-            # No rain expected
-            insight = FarmingInsight.objects.create(
-                farm=farm,
-                insight_type='WATERING',
-                title='No Rainfall Expected',
-                description=f'No significant rainfall expected in the next 5 days. '
-                           f'Ensure regular irrigation for your {farm.crop.name} crop. '
-                           f'Water requirement: {farm.crop.water_requirement}.',
-                priority=2,
-                valid_from=datetime.now(),
-                valid_until=weather_list[-1].timestamp if weather_list else datetime.now() + timedelta(days=5)
+        if expired:
+            FarmingInsight.objects.filter(id__in=[insight.id for insight in expired]).update(
+                valid_until=now, updated_at=now
             )
-            insights.append(insight)
+        log_changes('INSIGHT', 'UPSERT', [(insight.farm_id, insight.id) for insight in created + updated])
+        log_changes('INSIGHT', 'EXPIRE', [(insight.farm_id, insight.id) for insight in expired])
+        FarmingInsight.objects.filter(
+            farm_id__in=farm_ids,
+            valid_until__lt=now - INSIGHT_RETENTION
+        ).delete()
         
-        return insights
+        return current + created, len(created) + len(updated) + len(expired)
     
-    def _check_temperature(self, farm, weather_data):
-        """Check temperature conditions"""
-        insights = []
-        crop = farm.crop
-        
-        # Convert to list
-        weather_list = list(weather_data)
-        
-        high_temp_days = sum(1 for w in weather_list 
-                            if w.temperature > crop.optimal_temp_max)
-        low_temp_days = sum(1 for w in weather_list 
-                           if w.temperature < crop.optimal_temp_min)
-        
-        if high_temp_days >= 3:
-            insight = FarmingInsight.objects.create(
-                farm=farm,
-                insight_type='WARNING',
-                title='High Temperature Alert',
-                description=f'Temperatures above optimal range ({crop.optimal_temp_max}°C) '
-                           f'expected for {high_temp_days} days. Increase irrigation frequency '
-                           f'and consider shade protection for {crop.name}.',
-                priority=3,
-                valid_from=datetime.now(),
-                valid_until=weather_list[-1].timestamp if weather_list else datetime.now() + timedelta(days=5)
-            )
-            insights.append(insight)
+    def _fingerprint(self, crop, forecast):
+        """Hash of everything the insight rules read"""
+        return self._combined_fingerprint(crop, forecast.fingerprint())
+    
+    def _combined_fingerprint(self, crop, weather_fingerprint):
+        return content_fingerprint({
+            'crop': [crop.id, crop.name, crop.optimal_temp_min, crop.optimal_temp_max,
+                     crop.optimal_humidity_min, crop.optimal_humidity_max,
+                     crop.water_requirement, crop.frost_tolerance],
+            'weather': weather_fingerprint,
+            'rules': RULE_SET.version,
+        })
+    
+    def _evaluate(self, crop, forecast):
+        """Evaluate the compiled rule set for one farm's window into an insight spec"""
+        params = crop_params(crop)
+        values = RULE_SET.evaluate(forecast.series(), params)
+        return [
+            self._spec_entry(rule, values, crop)
+            for rule, fired in RULE_SET.fired(values, params)
+            if fired
+        ]
+    
+    def _spec_entry(self, rule, values, crop, index=None):
+        valid_for = None if rule['valid_for'] is None else rule['valid_for'].total_seconds()
+        return (rule['insight_type'], rule['title'], RULE_SET.describe(rule, values, crop, index),
+                rule['priority'], valid_for)
+    
+    def _materialize(self, farm, spec, forecast_end, now):
+        """Build (unsaved) insights for a farm from a spec
         
-        if low_temp_days >= 3:
-            insight = FarmingInsight.objects.create(
+        A spec entry is (type, title, description, priority, valid_for), with
+        valid_for in seconds from now or None for the end of the forecast.
+        """
+        return [
+            FarmingInsight(
                 farm=farm,
-                insight_type='WARNING',
-                title='Low Temperature Alert',
-                description=f'Temperatures below optimal range ({crop.optimal_temp_min}°C) '
-                           f'expected for {low_temp_days} days. Consider protective measures '
-                           f'for {crop.name}.',
-                priority=3,
-                valid_from=datetime.now(),
-                valid_until=weather_list[-1].timestamp if weather_list else datetime.now() + timedelta(days=5)
+                insight_type=insight_type,
+                title=title,
+                description=description,
+                priority=priority,
+                valid_from=now,
+                valid_until=forecast_end if valid_for is None else now + timedelta(seconds=valid_for),
             )
-            insights.append(insight)
-        
-        return insights
+            for insight_type, title, description, priority, valid_for in spec
+        ]
     
-    def _check_frost(self, farm, weather_data):
-        """Check for frost conditions"""
-        insights = []
-        
-        # Convert to list
-        weather_list = list(weather_data)
-        
-        if not farm.crop.frost_tolerance:
-            frost_risk = any(w.temperature < 2 for w in weather_list)
-            
-            if frost_risk:
-                insight = FarmingInsight.objects.create(
-                    farm=farm,
-                    insight_type='WARNING',
-                    title='Frost Risk Warning',
-                    description=f'Frost conditions expected! {farm.crop.name} is not frost-tolerant. '
-                               f'Take immediate protective measures: cover plants, use frost blankets, '
-                               f'or consider temporary heating solutions.',
-                    priority=3,
-                    valid_from=datetime.now(),
-                    valid_until=weather_list[-1].timestamp if weather_list else datetime.now() + timedelta(days=5)
-                )
-                insights.append(insight)
+    def generate_fleet_insights(self, farms=None, batch_size=FLEET_BATCH_SIZE):
+        """Regenerate insights for many farms at once
         
-        return insights
+        Each batch loads every farm's forecast window with one query into a
+        ForecastMatrix, evaluates the rule set for the whole batch with crop
+        thresholds broadcast as per-farm vectors, and writes the results back
+        with bulk queries. Farms whose forecast and crop are unchanged since
+        their last run are left alone, and farms refreshed by another worker
+        while the batch was evaluated are evaluated again rather than
+        overwritten. Returns (farms_updated, insight_rows_written).
+        """
+        if farms is None:
+            farms = Farm.objects.all()
+        farm_ids = list(farms.filter(crop__isnull=False).order_by('id').values_list('id', flat=True))
+        
+        updated = written = 0
+        for start in range(0, len(farm_ids), batch_size):
+            batch = Farm.objects.filter(id__in=farm_ids[start:start + batch_size]).select_related('crop')
+            batch_updated, batch_written = self._generate_batch({farm.id: farm for farm in batch})
+            updated += batch_updated
+            written += batch_written
+        return updated, written
     
-    def _check_planting_window(self, farm, weather_data):
-        """Determine if it's a good time for planting"""
-        insights = []
-        crop = farm.crop
+    def _generate_batch(self, farms):
+        forecast = ForecastMatrix.load(list(farms))
+        if not len(forecast):
+            return 0, 0
         
-        # Check if conditions are favorable
-        avg_temp = sum(w.temperature for w in weather_data[:8]) / min(len(weather_data), 8)
-        avg_humidity = sum(w.humidity for w in weather_data[:8]) / min(len(weather_data), 8)
+        batch = [farms[farm_id] for farm_id in forecast.farm_ids.tolist()]
         
-        is_temp_good = crop.optimal_temp_min <= avg_temp <= crop.optimal_temp_max
-        is_humidity_good = crop.optimal_humidity_min <= avg_humidity <= crop.optimal_humidity_max
-        no_extreme_weather = not any(w.wind_speed > 15 for w in weather_data[:8])
+        WeatherSyncState.objects.bulk_create(
+            [WeatherSyncState(farm=farm) for farm in batch], ignore_conflicts=True
+        )
+        states = {state.farm_id: state for state in WeatherSyncState.objects.filter(farm__in=batch)}
         
-        if is_temp_good and is_humidity_good and no_extreme_weather:
-            insight = FarmingInsight.objects.create(
-                farm=farm,
-                insight_type='PLANTING',
-                title='Favorable Planting Conditions',
-                description=f'Current weather conditions are optimal for planting {crop.name}. '
-                           f'Temperature: {avg_temp:.1f}°C, Humidity: {avg_humidity:.1f}%. '
-                           f'Next few days look promising for seed germination.',
-                priority=2,
-                valid_from=datetime.now(),
-                valid_until=datetime.now() + timedelta(days=3)
-            )
-            insights.append(insight)
-        elif not is_temp_good:
-            insight = FarmingInsight.objects.create(
-                farm=farm,
-                insight_type='PLANTING',
-                title='Wait for Better Temperature',
-                description=f'Current temperature ({avg_temp:.1f}°C) is outside optimal range '
-                           f'({crop.optimal_temp_min}-{crop.optimal_temp_max}°C) for {crop.name}. '
-                           f'Consider waiting for more favorable conditions.',
-                priority=1,
-                valid_from=datetime.now(),
-                valid_until=datetime.now() + timedelta(days=3)
-            )
-            insights.append(insight)
+        now = timezone.now()
+        changed, previous = {}, {}
+        for index, farm in enumerate(batch):
+            fingerprint = self._combined_fingerprint(farm.crop, forecast.fingerprint(index))
+            state = states[farm.id]
+            if fingerprint != state.insight_fingerprint:
+                previous[farm.id] = state.insight_fingerprint
+                state.insight_fingerprint = fingerprint
+                state.insights_changed_at = now
+                changed[index] = fingerprint
+        if not changed:
+            return 0, 0
         
-        return insights
-    
-    def _check_watering_needs(self, farm, weather_data):
-        """Determine watering recommendations"""
-        insights = []
-        crop = farm.crop
+        # Farms sharing a forecast window and crop share one spec; evaluate
+        # the rules only for one farm per fingerprint missing from the cache
+        specs = insight_cache.get_many(set(changed.values()))
+        pending = {}
+        for index, fingerprint in changed.items():
+            if fingerprint not in specs:
+                pending.setdefault(fingerprint, index)
+        if pending:
+            specs.update(self._evaluate_rows(batch, forecast, pending))
+            insight_cache.set_many({fingerprint: specs[fingerprint] for fingerprint in pending})
         
-        # Calculate moisture needs based on weather
-        next_3_days = weather_data[:24]  # 3 days of data
-        avg_temp = sum(w.temperature for w in next_3_days) / len(next_3_days) if next_3_days else 0
-        total_rain = sum(w.precipitation for w in next_3_days)
-        avg_humidity = sum(w.humidity for w in next_3_days) / len(next_3_days) if next_3_days else 0
+        insights, fingerprints = {}, {}
+        for index, fingerprint in changed.items():
+            farm = batch[index]
+            insights[farm.id] = self._materialize(farm, specs[fingerprint], forecast.last_timestamp(index), now)
+            fingerprints[farm.id] = fingerprint
         
-        water_needed = crop.water_requirement
+        changed_farms = [batch[index] for index in changed]
+        updated = written = 0
+        superseded = []
+        for start in range(0, len(changed_farms), FLEET_LOCK_BATCH_SIZE):
+            farm_ids = [farm.id for farm in changed_farms[start:start + FLEET_LOCK_BATCH_SIZE]]
+            # Same farm locks as single-farm refreshes, so their writes
+            # never interleave with these
+            with farm_locks(farm_ids), transaction.atomic():
+                # A refresh may have stored newer weather or insights for
+                # some farms since the batch was evaluated; leave those out
+                current = self._unchanged_farms(farms, farm_ids, previous, fingerprints)
+                if current:
+                    _, chunk_written = self._sync(
+                        current, [insight for farm_id in current for insight in insights[farm_id]], now
+                    )
+                    WeatherSyncState.objects.bulk_update(
+                        [states[farm_id] for farm_id in current], ['insight_fingerprint', 'insights_changed_at']
+                    )
+                    notify_weather_updated(FarmingInsight, current)
+                    updated += len(current)
+                    written += chunk_written
+            superseded.extend(sorted(set(farm_ids) - set(current)))
         
-        if total_rain < 5 and avg_humidity < 60 and water_needed == 'HIGH':
-            insight = FarmingInsight.objects.create(
-                farm=farm,
-                insight_type='WATERING',
-                title='Increase Irrigation',
-                description=f'{crop.name} requires high water. With low rainfall ({total_rain:.1f}mm) '
-                           f'and humidity ({avg_humidity:.1f}%) expected, increase irrigation frequency. '
-                           f'Best time: Early morning or evening.',
-                priority=2,
-                valid_from=datetime.now(),
-                valid_until=datetime.now() + timedelta(days=3)
-            )
-            insights.append(insight)
+        if superseded:
+            # Evaluate those again against what the refresh stored
+            retry_updated, retry_written = self._generate_batch({farm_id: farms[farm_id] for farm_id in superseded})
+            updated += retry_updated
+            written += retry_written
+        return updated, written
+    
+    def _unchanged_farms(self, farms, farm_ids, previous, fingerprints):
+        """Ids in `farm_ids` whose stored insight fingerprint and forecast are
+        still what the batch was evaluated against; call under their farm locks"""
+        stored = dict(WeatherSyncState.objects.filter(farm_id__in=farm_ids).values_list(
+            'farm_id', 'insight_fingerprint'
+        ))
+        forecast = ForecastMatrix.load(farm_ids)
+        return [
+            farm_id
+            for index, farm_id in enumerate(forecast.farm_ids.tolist())
+            if stored.get(farm_id) == previous[farm_id]
+            and self._combined_fingerprint(farms[farm_id].crop, forecast.fingerprint(index)) == fingerprints[farm_id]
+        ]
+    
+    def _evaluate_rows(self, batch, forecast, rows):
+        """Evaluate the rule set for the forecast rows in `rows` (fingerprint -> row index) at once"""
+        fingerprints = list(rows)
+        indexes = np.array([rows[fingerprint] for fingerprint in fingerprints])
+        crops = [batch[index].crop for index in indexes]
+        params = {
+            field: np.array([getattr(crop, field) for crop in crops])
+            for field in CROP_PARAMS
+        }
+        series = {name: values[indexes] for name, values in forecast.series().items()}
+        values = RULE_SET.evaluate(series, params)
         
-        return insights
+        specs = {fingerprint: [] for fingerprint in fingerprints}
+        for rule, fired in RULE_SET.fired(values, params):
+            for position in np.flatnonzero(np.broadcast_to(fired, indexes.shape)):
+                specs[fingerprints[position]].append(
+                    self._spec_entry(rule, values, crops[position], position)
+                )
+        return specs
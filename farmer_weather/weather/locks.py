@@ -0,0 +1,121 @@
+import os
+import tempfile
+import threading
+from contextlib import ExitStack, contextmanager
+from django.conf import settings
+from django.db import connection
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks
+    fcntl = None
+
+
+# First key of the two-key PostgreSQL advisory lock used for farm refreshes
+ADVISORY_LOCK_NAMESPACE = 0x5745
+# Second key of the change log lock (farm ids, the other second keys, start at 1)
+CHANGE_LOG_LOCK_KEY = 0
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapse concurrent calls for the same key into one execution
+
+    The first caller runs the function; callers arriving while it is in
+    progress wait and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+def _lock_dir():
+    path = getattr(settings, 'WEATHER_LOCK_DIR', '') or os.path.join(tempfile.gettempdir(), 'farmer_weather_locks')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextmanager
+def farm_lock(farm_id):
+    """Serialize writes for one farm across threads and worker processes
+
+    Uses a PostgreSQL advisory lock when the database supports it (works
+    across hosts), otherwise an exclusive lock file shared by workers on the
+    same machine.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s, %s)', [ADVISORY_LOCK_NAMESPACE, farm_id])
+        try:
+            yield
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [ADVISORY_LOCK_NAMESPACE, farm_id])
+        return
+
+    if fcntl is None:
+        yield
+        return
+
+    with open(os.path.join(_lock_dir(), f'farm-{farm_id}.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def farm_locks(farm_ids):
+    """Hold farm_lock for several farms, taken in id order so concurrent
+    holders of overlapping sets cannot deadlock"""
+    with ExitStack() as stack:
+        for farm_id in sorted(set(farm_ids)):
+            stack.enter_context(farm_lock(farm_id))
+        yield
+
+
+def change_log_lock():
+    """Serialize change log writers until the current transaction ends
+
+    PostgreSQL hands out sequence ids before commit, so without this a
+    reader could see a later id committed while an earlier one is still
+    pending, and move its cursor past it. Holding the lock from allocating
+    ids until commit makes ChangeLogEntry ids commit-ordered, which lets
+    readers page by id without locking. SQLite already allows a single
+    writer at a time.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [ADVISORY_LOCK_NAMESPACE, CHANGE_LOG_LOCK_KEY])
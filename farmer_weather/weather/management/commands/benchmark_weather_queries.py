@@ -0,0 +1,175 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from weather import queries
+from weather.models import Crop, Farm, WeatherData, FarmingInsight
+from weather.pagination import keyset_rows
+from weather.refresh import stale_farms
+from weather.summaries import update_daily_summaries
+
+
+BENCHMARK_PREFIX = 'benchmark-farm-'
+STEP = timedelta(hours=3)
+
+
+class Command(BaseCommand):
+    help = ("Seed synthetic farms and weather history into a throwaway test database, then "
+            "report query plans and timings for the dashboard and API queries")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farms', type=int, default=1000)
+        parser.add_argument('--rows-per-farm', type=int, default=1000,
+                            help="3-hourly WeatherData rows per farm, 40 of them in the future")
+        parser.add_argument('--samples', type=int, default=200,
+                            help="Timed executions per query")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Keep the benchmark database and reuse its seed data on the next run")
+
+    def handle(self, *args, **options):
+        # Never seed the configured database: benchmark against the test
+        # database Django creates next to it (test_<NAME>, or in memory on SQLite)
+        database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(database_name, verbosity=0, keepdb=options['keepdb'])
+            # SQLite leaves an in-memory test database open; reconnect to the configured one
+            connection.close()
+
+    def benchmark(self, options):
+        farm_ids = list(Farm.objects.filter(name__startswith=BENCHMARK_PREFIX).values_list('id', flat=True))
+        if not farm_ids:
+            self.seed(options['farms'], options['rows_per_farm'], options['batch_size'])
+            farm_ids = list(Farm.objects.filter(name__startswith=BENCHMARK_PREFIX).values_list('id', flat=True))
+        if not farm_ids:
+            self.stderr.write("No benchmark farms found")
+            return
+
+        for name, query in self.queries():
+            self.report(name, query, farm_ids, options['samples'])
+
+    def seed(self, farm_count, rows_per_farm, batch_size):
+        crop, _ = Crop.objects.get_or_create(name='TOMATO', defaults={
+            'optimal_temp_min': 18,
+            'optimal_temp_max': 29,
+            'optimal_humidity_min': 60,
+            'optimal_humidity_max': 80,
+            'water_requirement': 'MEDIUM',
+            'growing_season_days': 75,
+        })
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        first_timestamp = now - STEP * (rows_per_farm - 40)
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            farms = Farm.objects.bulk_create([
+                Farm(
+                    name=f'{BENCHMARK_PREFIX}{i}',
+                    latitude=random.uniform(-60, 60),
+                    longitude=random.uniform(-180, 180),
+                    location_name='Benchmark',
+                    crop=crop,
+                )
+                for i in range(farm_count)
+            ], batch_size=batch_size)
+            if farms and farms[0].pk is None:
+                farms = list(Farm.objects.filter(name__startswith=BENCHMARK_PREFIX))
+
+        batch = []
+        for farm in farms:
+            for step in range(rows_per_farm):
+                temperature = random.uniform(5, 35)
+                batch.append(WeatherData(
+                    farm=farm,
+                    timestamp=first_timestamp + STEP * step,
+                    temperature=temperature,
+                    feels_like=temperature,
+                    humidity=random.uniform(30, 95),
+                    pressure=random.uniform(995, 1025),
+                    wind_speed=random.uniform(0, 12),
+                    precipitation=random.choice([0, 0, 0, 0.5, 3]),
+                    weather_condition='Clouds',
+                    weather_description='scattered clouds',
+                    clouds=random.uniform(0, 100),
+                ))
+                if len(batch) >= batch_size:
+                    WeatherData.objects.bulk_create(batch)
+                    batch = []
+        WeatherData.objects.bulk_create(batch)
+
+        timestamps = [first_timestamp + STEP * step for step in range(rows_per_farm)]
+        for farm in farms:
+            update_daily_summaries(farm, timestamps)
+
+        FarmingInsight.objects.bulk_create([
+            FarmingInsight(
+                farm=farm,
+                insight_type='GENERAL',
+                title=f'Benchmark insight {n}',
+                description='Benchmark',
+                priority=n % 3 + 1,
+                valid_from=now - timedelta(days=n),
+                valid_until=now + timedelta(days=2 - n),
+            )
+            for farm in farms
+            for n in range(5)
+        ], batch_size=batch_size)
+
+        self.stdout.write(
+            f"Seeded {len(farms)} farms x {rows_per_farm} rows in {time.perf_counter() - started:.1f}s"
+        )
+
+    def queries(self):
+        """The per-request queries issued by views.py and api_views.py, built by weather.queries"""
+        def current_weather(farm_id, now):
+            return queries.current_weather(now, farm_id)
+
+        def forecast(farm_id, now):
+            return queries.forecast(now, farm_id)
+
+        def calendar(farm_id, now):
+            return queries.calendar_days(farm_id, timezone.localdate(now))
+
+        def active_insights(farm_id, now):
+            return queries.active_insights(now, farm_id)
+
+        def farm_list(farm_id, now):
+            return keyset_rows(queries.farm_listing(AnonymousUser()))[:queries.FARM_PAGE_SIZE + 1]
+
+        def stale(farm_id, now):
+            return stale_farms().values('id')[:50]
+
+        return [
+            ('current weather', current_weather),
+            ('forecast', forecast),
+            ('calendar', calendar),
+            ('active insights', active_insights),
+            ('farm list', farm_list),
+            ('stale farms', stale),
+        ]
+
+    def report(self, name, query, farm_ids, samples):
+        now = timezone.now()
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n{name}"))
+        self.stdout.write(query(farm_ids[0], now).explain())
+
+        timings = []
+        for _ in range(samples):
+            queryset = query(random.choice(farm_ids), now)
+            started = time.perf_counter()
+            list(queryset)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        p95 = timings[min(int(len(timings) * 0.95), len(timings) - 1)]
+        self.stdout.write(
+            f"mean={statistics.mean(timings):.2f}ms p50={statistics.median(timings):.2f}ms "
+            f"p95={p95:.2f}ms max={timings[-1]:.2f}ms"
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from weather.changelog import prune_change_log
+from weather.retention import compact_weather
+
+
+class Command(BaseCommand):
+    help = "Roll old WeatherData into hourly and daily rollups, delete the raw rows and prune the change log"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help="Keep raw rows newer than this many days (default 30)")
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Rows deleted per DELETE statement (default 5000)")
+        parser.add_argument('--window-days', type=int, default=7,
+                            help="Days of one farm's history compacted per transaction (default 7)")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many rows would be compacted")
+
+    def handle(self, *args, **options):
+        farms, deleted = compact_weather(
+            older_than_days=options['days'],
+            chunk_size=options['chunk_size'],
+            window_days=options['window_days'],
+            dry_run=options['dry_run'],
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        action = "Would compact" if options['dry_run'] else "Compacted"
+        self.stdout.write(self.style.SUCCESS(f"{action} {deleted} rows across {farms} farms"))
+
+        if not options['dry_run']:
+            pruned = prune_change_log()
+            self.stdout.write(self.style.SUCCESS(f"Pruned {pruned} change log entries"))
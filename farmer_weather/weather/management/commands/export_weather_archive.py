@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from weather.archive import export_weather, month_start
+
+
+class Command(BaseCommand):
+    help = ("Export WeatherData into a columnar .npy archive partitioned by farm and month; "
+            "open it with weather.archive.open_archive()")
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="Archive root directory")
+        parser.add_argument('--since', help="First month to export (YYYY-MM)")
+        parser.add_argument('--until', help="Export months before this one (YYYY-MM, default: current month, "
+                                            "so only complete months are written)")
+        parser.add_argument('--farm', type=int, action='append', dest='farm_ids',
+                            help="Only export this farm id (repeatable)")
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help="Rows fetched from the database per round trip")
+
+    def handle(self, *args, **options):
+        try:
+            since = month_start(options['since']) if options['since'] else None
+            if options['until']:
+                until = month_start(options['until'])
+            else:
+                until = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        except ValueError:
+            raise CommandError("--since and --until must be in YYYY-MM format")
+
+        written = export_weather(
+            options['output'],
+            since=since,
+            until=until,
+            farm_ids=options['farm_ids'],
+            chunk_size=options['chunk_size'],
+        )
+        rows = sum(count for _, _, count in written)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(written)} partitions ({rows} rows) to {options['output']}"
+        ))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from weather.insights import FLEET_BATCH_SIZE, InsightGenerator
+from weather.models import Farm
+
+
+class Command(BaseCommand):
+    help = "Regenerate farming insights for every farm (or selected farms) in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farm', type=int, action='append', dest='farm_ids',
+                            help="Only regenerate this farm id (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=FLEET_BATCH_SIZE,
+                            help=f"Farms evaluated per batch (default {FLEET_BATCH_SIZE})")
+
+    def handle(self, *args, **options):
+        farms = Farm.objects.all()
+        if options['farm_ids']:
+            farms = farms.filter(id__in=options['farm_ids'])
+
+        started = time.perf_counter()
+        updated, written = InsightGenerator().generate_fleet_insights(farms, batch_size=options['batch_size'])
+        self.stdout.write(
+            f"Updated insights for {updated} farms ({written} insight rows written) "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
@@ -0,0 +1,210 @@
+import copy
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+SAMPLES_DIR = Path(__file__).resolve().parents[2] / 'openweather_samples'
+ENDPOINTS = ('weather', 'forecast')
+FORECAST_STEP_SECONDS = 3 * 60 * 60
+CURRENT_STEP_SECONDS = 10 * 60
+
+
+def load_payload_sets(directory):
+    """Read every <set>/weather.json + <set>/forecast.json pair in directory"""
+    payload_sets = []
+    for set_dir in sorted(Path(directory).iterdir()):
+        if not set_dir.is_dir():
+            continue
+        try:
+            payload_sets.append({
+                endpoint: json.loads((set_dir / f'{endpoint}.json').read_text())
+                for endpoint in ENDPOINTS
+            })
+        except FileNotFoundError:
+            continue
+    return payload_sets
+
+
+def rebase_current(payload, lat, lon, now):
+    """Move a recorded /weather payload to the requested location and time"""
+    payload = copy.deepcopy(payload)
+    payload['coord'] = {'lon': lon, 'lat': lat}
+    payload['dt'] = now - now % CURRENT_STEP_SECONDS
+    return payload
+
+
+def rebase_forecast(payload, lat, lon, now):
+    """Shift a recorded /forecast payload so its first step is the next 3-hour slot"""
+    payload = copy.deepcopy(payload)
+    steps = payload.get('list', [])
+    if steps:
+        next_slot = now - now % FORECAST_STEP_SECONDS + FORECAST_STEP_SECONDS
+        offset = next_slot - steps[0]['dt']
+        for step in steps:
+            step['dt'] += offset
+            step['dt_txt'] = datetime.fromtimestamp(step['dt'], tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    if 'city' in payload:
+        payload['city']['coord'] = {'lat': lat, 'lon': lon}
+    return payload
+
+
+class MockOpenWeatherServer(ThreadingHTTPServer):
+    """Threaded stand-in for the OpenWeatherMap 2.5 /weather and /forecast API"""
+
+    daemon_threads = True
+
+    def __init__(self, address, payload_sets, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=503):
+        super().__init__(address, MockOpenWeatherHandler)
+        self.payload_sets = payload_sets
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.stats = {'requests': 0, 'errors': 0}
+        self.stats_lock = threading.Lock()
+
+    def pick_payloads(self, lat, lon):
+        """Choose a payload set deterministically per location"""
+        key = f'{round(lat, 2)}:{round(lon, 2)}'.encode()
+        return self.payload_sets[zlib.crc32(key) % len(self.payload_sets)]
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+
+class MockOpenWeatherHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        endpoint = url.path.rstrip('/').rsplit('/', 1)[-1]
+        params = parse_qs(url.query)
+
+        server.delay()
+        with server.stats_lock:
+            server.stats['requests'] += 1
+
+        if endpoint not in ENDPOINTS:
+            return self._send(404, {'cod': '404', 'message': 'Internal error'})
+
+        try:
+            lat = float(params['lat'][0])
+            lon = float(params['lon'][0])
+        except (KeyError, ValueError):
+            return self._send(400, {'cod': '400', 'message': 'wrong latitude'})
+
+        if server.error_rate and random.random() < server.error_rate:
+            with server.stats_lock:
+                server.stats['errors'] += 1
+            headers = {'Retry-After': '1'} if server.error_status == 429 else {}
+            return self._send(server.error_status,
+                              {'cod': server.error_status, 'message': 'Injected error'}, headers)
+
+        now = int(time.time())
+        payloads = server.pick_payloads(lat, lon)
+        if endpoint == 'weather':
+            body = rebase_current(payloads['weather'], lat, lon, now)
+        else:
+            body = rebase_forecast(payloads['forecast'], lat, lon, now)
+        self._send(200, body)
+
+    def _send(self, status, body, headers=None):
+        encoded = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = ("Serve sample OpenWeatherMap payloads locally for offline testing and benchmarks. "
+            "Point OPENWEATHER_BASE_URL at http://<host>:<port>/data/2.5")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8089)
+        parser.add_argument('--samples', default=str(SAMPLES_DIR),
+                            help="Directory of payload sets (one sub-directory per set)")
+        parser.add_argument('--latency', type=float, default=0.0,
+                            help="Mean added latency per request in milliseconds")
+        parser.add_argument('--jitter', type=float, default=0.0,
+                            help="Standard deviation of the added latency in milliseconds")
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help="Fraction of requests (0-1) answered with --error-status")
+        parser.add_argument('--error-status', type=int, default=503)
+        parser.add_argument('--record', metavar='NAME',
+                            help="Record real /weather and /forecast responses for --lat/--lon "
+                                 "into a new payload set NAME instead of serving")
+        parser.add_argument('--lat', type=float)
+        parser.add_argument('--lon', type=float)
+
+    def handle(self, *args, **options):
+        if options['record']:
+            return self.record(options)
+
+        payload_sets = load_payload_sets(options['samples'])
+        if not payload_sets:
+            raise CommandError(f"No payload sets found in {options['samples']}")
+
+        server = MockOpenWeatherServer(
+            (options['host'], options['port']),
+            payload_sets,
+            latency=options['latency'] / 1000,
+            jitter=options['jitter'] / 1000,
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+        )
+        self.stdout.write(
+            f"Serving {len(payload_sets)} payload sets on "
+            f"http://{options['host']}:{server.server_port}/data/2.5 (Ctrl+C to stop)"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served {server.stats['requests']} requests "
+                              f"({server.stats['errors']} injected errors)")
+
+    def record(self, options):
+        if options['lat'] is None or options['lon'] is None:
+            raise CommandError("--record needs --lat and --lon")
+        if not settings.OPENWEATHER_API_KEY:
+            raise CommandError("OPENWEATHER_API_KEY is not configured")
+
+        target = Path(options['samples']) / options['record']
+        target.mkdir(parents=True, exist_ok=True)
+        for endpoint in ENDPOINTS:
+            response = requests.get(
+                f"https://api.openweathermap.org/data/2.5/{endpoint}",
+                params={
+                    'lat': options['lat'],
+                    'lon': options['lon'],
+                    'appid': settings.OPENWEATHER_API_KEY,
+                    'units': 'metric',
+                },
+                timeout=10,
+            )
+            response.raise_for_status()
+            (target / f'{endpoint}.json').write_text(json.dumps(response.json(), indent=2))
+        self.stdout.write(f"Recorded payload set '{options['record']}' in {target}")
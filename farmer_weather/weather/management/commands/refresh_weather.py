@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from weather.models import Farm
+from weather.refresh import BulkRefresher
+
+
+class Command(BaseCommand):
+    help = "Refresh weather data for many farms concurrently"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farm', type=int, action='append', dest='farm_ids',
+                            help="Only refresh this farm id (repeatable)")
+        parser.add_argument('--concurrency', type=int,
+                            help="Maximum grid cells fetched at once")
+        parser.add_argument('--calls-per-minute', type=int,
+                            help="Provider call quota (default OPENWEATHER_CALLS_PER_MINUTE)")
+
+    def handle(self, *args, **options):
+        farms = Farm.objects.all()
+        if options['farm_ids']:
+            farms = farms.filter(id__in=options['farm_ids'])
+
+        refresher = BulkRefresher(
+            concurrency=options['concurrency'],
+            calls_per_minute=options['calls_per_minute'],
+        )
+        report = refresher.run(farms)
+        summary = report.summary()
+
+        self.stdout.write(
+            f"Refreshed {summary['refreshed']} farms ({summary['failed']} failed) "
+            f"with {summary['upstream_calls']} provider calls in {summary['duration']:.2f}s "
+            f"({summary['throughput']:.1f} farms/s)"
+        )
+        self.stdout.write(
+            f"Latency p50={summary['p50'] * 1000:.0f}ms p95={summary['p95'] * 1000:.0f}ms "
+            f"p99={summary['p99'] * 1000:.0f}ms max={summary['max'] * 1000:.0f}ms"
+        )
+        if report.failed:
+            self.stderr.write(f"Failed farm ids: {', '.join(str(i) for i in report.failed)}")
@@ -0,0 +1,39 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from weather.refresh import refresh_max_age
+from weather.scheduler import run_pass
+
+
+class Command(BaseCommand):
+    help = "Keep farm weather and insights fresh so page views never wait on the provider"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=300,
+                            help="Seconds between scheduler passes (default 300)")
+        parser.add_argument('--max-age', type=int,
+                            help="Refresh farms whose data is older than this many seconds "
+                                 "(default WEATHER_REFRESH_INTERVAL)")
+        parser.add_argument('--once', action='store_true',
+                            help="Run a single pass and exit")
+
+    def handle(self, *args, **options):
+        max_age = timedelta(seconds=options['max_age']) if options['max_age'] else refresh_max_age()
+
+        while True:
+            try:
+                summary = run_pass(max_age)
+                if summary['refreshed'] or summary['failed']:
+                    self.stdout.write(
+                        f"Refreshed {summary['refreshed']} farms ({summary['failed']} failed), "
+                        f"{summary['upstream_calls']} provider calls in {summary['duration']:.1f}s"
+                    )
+            except Exception as e:
+                self.stderr.write(f"Scheduler pass failed: {e}")
+
+            if options['once']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
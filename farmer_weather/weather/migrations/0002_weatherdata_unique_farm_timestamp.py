@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:08
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_weather(apps, schema_editor):
+    """Keep only the most recently stored row for each (farm, timestamp)"""
+    WeatherData = apps.get_model("weather", "WeatherData")
+    duplicates = (
+        WeatherData.objects.values("farm_id", "timestamp")
+        .annotate(rows=Count("id"), keep_id=Max("id"))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        WeatherData.objects.filter(
+            farm_id=duplicate["farm_id"], timestamp=duplicate["timestamp"]
+        ).exclude(id=duplicate["keep_id"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_weather, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="weatherdata",
+            constraint=models.UniqueConstraint(
+                fields=("farm", "timestamp"), name="unique_weather_farm_timestamp"
+            ),
+        ),
+    ]
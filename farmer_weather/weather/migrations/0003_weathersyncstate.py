@@ -0,0 +1,76 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_checked_at(apps, schema_editor):
+    """Seed checked_at from the newest stored weather so existing farms aren't treated as empty"""
+    WeatherData = apps.get_model("weather", "WeatherData")
+    WeatherSyncState = apps.get_model("weather", "WeatherSyncState")
+    latest = WeatherData.objects.values("farm_id").annotate(last=Max("fetched_at"))
+    WeatherSyncState.objects.bulk_create(
+        [
+            WeatherSyncState(farm_id=row["farm_id"], checked_at=row["last"])
+            for row in latest
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0002_weatherdata_unique_farm_timestamp"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WeatherSyncState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "forecast_fingerprint",
+                    models.CharField(
+                        blank=True,
+                        help_text="Hash of the last stored forecast payload",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "insight_fingerprint",
+                    models.CharField(
+                        blank=True,
+                        help_text="Hash of the forecast window and crop insights were built from",
+                        max_length=64,
+                    ),
+                ),
+                (
+                    "checked_at",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="When the provider was last polled for this farm",
+                        null=True,
+                    ),
+                ),
+                (
+                    "farm",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sync_state",
+                        to="weather.farm",
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(backfill_checked_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,112 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0003_weathersyncstate"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HourlyWeatherRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "sample_count",
+                    models.IntegerField(help_text="Raw observations in the period"),
+                ),
+                ("temperature_min", models.FloatField()),
+                ("temperature_max", models.FloatField()),
+                ("temperature_mean", models.FloatField()),
+                ("humidity_mean", models.FloatField()),
+                ("pressure_mean", models.FloatField()),
+                ("wind_speed_mean", models.FloatField()),
+                ("wind_speed_max", models.FloatField()),
+                ("clouds_mean", models.FloatField()),
+                (
+                    "precipitation_total",
+                    models.FloatField(help_text="Total precipitation in mm"),
+                ),
+                ("period_start", models.DateTimeField()),
+                (
+                    "farm",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="hourly_rollups",
+                        to="weather.farm",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["period_start"],
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyWeatherRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "sample_count",
+                    models.IntegerField(help_text="Raw observations in the period"),
+                ),
+                ("temperature_min", models.FloatField()),
+                ("temperature_max", models.FloatField()),
+                ("temperature_mean", models.FloatField()),
+                ("humidity_mean", models.FloatField()),
+                ("pressure_mean", models.FloatField()),
+                ("wind_speed_mean", models.FloatField()),
+                ("wind_speed_max", models.FloatField()),
+                ("clouds_mean", models.FloatField()),
+                (
+                    "precipitation_total",
+                    models.FloatField(help_text="Total precipitation in mm"),
+                ),
+                ("period_start", models.DateTimeField()),
+                (
+                    "farm",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_rollups",
+                        to="weather.farm",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["period_start"],
+                "abstract": False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="hourlyweatherrollup",
+            constraint=models.UniqueConstraint(
+                fields=("farm", "period_start"), name="unique_hourly_rollup"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="dailyweatherrollup",
+            constraint=models.UniqueConstraint(
+                fields=("farm", "period_start"), name="unique_daily_rollup"
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0004_weather_rollups"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="farminginsight",
+            name="farm",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="insights",
+                to="weather.farm",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="weatherdata",
+            name="farm",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="weather_records",
+                to="weather.farm",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="weathersyncstate",
+            name="checked_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_index=True,
+                help_text="When the provider was last polled for this farm",
+                null=True,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="farm",
+            index=models.Index(fields=["-created_at"], name="farm_created_at_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="farminginsight",
+            index=models.Index(
+                fields=["farm", "valid_until"], name="insight_farm_valid_until_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0005_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="farminginsight",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0006_farminginsight_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FarmAgronomy",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "accumulated_through",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="End of the last weather step included in the totals",
+                        null=True,
+                    ),
+                ),
+                (
+                    "et0_total",
+                    models.FloatField(
+                        default=0, help_text="Reference evapotranspiration in mm"
+                    ),
+                ),
+                (
+                    "gdd_total",
+                    models.FloatField(
+                        default=0, help_text="Growing degree days in °C·days"
+                    ),
+                ),
+                (
+                    "gdd_base",
+                    models.FloatField(
+                        blank=True,
+                        help_text="Base temperature gdd_total was accumulated with",
+                        null=True,
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "farm",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="agronomy",
+                        to="weather.farm",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:25
+
+from datetime import datetime, time
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def backfill_summaries(apps, schema_editor):
+    """Summarize stored weather from today on so the calendar has data before the next refresh"""
+    WeatherData = apps.get_model("weather", "WeatherData")
+    DailyWeatherSummary = apps.get_model("weather", "DailyWeatherSummary")
+    today = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+    rows = WeatherData.objects.filter(timestamp__gte=today).annotate(
+        date=TruncDate("timestamp")
+    )
+
+    dominant = {}
+    for values in (
+        rows.values("farm_id", "date", "weather_condition", "weather_description")
+        .annotate(count=Count("id"))
+        .order_by("farm_id", "date", "-count", "weather_condition")
+    ):
+        dominant.setdefault(
+            (values["farm_id"], values["date"]),
+            (values["weather_condition"], values["weather_description"]),
+        )
+
+    summaries = []
+    for values in (
+        rows.values("farm_id", "date")
+        .annotate(
+            sample_count=Count("id"),
+            temperature_min=Min("temperature"),
+            temperature_max=Max("temperature"),
+            temperature_mean=Avg("temperature"),
+            humidity_mean=Avg("humidity"),
+            precipitation_total=Sum("precipitation"),
+            wind_speed_max=Max("wind_speed"),
+        )
+        .order_by()
+    ):
+        condition, description = dominant[(values["farm_id"], values["date"])]
+        summaries.append(
+            DailyWeatherSummary(
+                dominant_condition=condition, dominant_description=description, **values
+            )
+        )
+    DailyWeatherSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0007_farmagronomy"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyWeatherSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("sample_count", models.IntegerField()),
+                ("temperature_min", models.FloatField()),
+                ("temperature_max", models.FloatField()),
+                ("temperature_mean", models.FloatField()),
+                ("humidity_mean", models.FloatField()),
+                (
+                    "precipitation_total",
+                    models.FloatField(help_text="Total precipitation in mm"),
+                ),
+                ("wind_speed_max", models.FloatField()),
+                ("dominant_condition", models.CharField(max_length=100)),
+                ("dominant_description", models.CharField(max_length=200)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "farm",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_summaries",
+                        to="weather.farm",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="dailyweathersummary",
+            constraint=models.UniqueConstraint(
+                fields=("farm", "date"), name="unique_daily_summary"
+            ),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("weather", "0008_dailyweathersummary"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="farm",
+            name="farm_created_at_idx",
+        ),
+        migrations.AlterField(
+            model_name="farm",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="farm",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="farm_created_at_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="farm",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="farm_user_created_at_id_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:28
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_changed_at(apps, schema_editor):
+    """Existing data last changed no later than the last poll"""
+    WeatherSyncState = apps.get_model("weather", "WeatherSyncState")
+    WeatherSyncState.objects.filter(checked_at__isnull=False).update(
+        weather_changed_at=F("checked_at"), insights_changed_at=F("checked_at")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0009_farm_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="weathersyncstate",
+            name="insights_changed_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the farm's insights were last regenerated",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="weathersyncstate",
+            name="weather_changed_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="Latest fetched_at of the farm's stored weather",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(backfill_changed_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0010_weathersyncstate_changed_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLogEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("WEATHER", "Weather data"),
+                            ("INSIGHT", "Farming insight"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("UPSERT", "Added or changed"),
+                            ("DELETE", "Deleted"),
+                            ("EXPIRE", "Expired"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "object_id",
+                    models.BigIntegerField(
+                        help_text="Id of the WeatherData or FarmingInsight row"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                (
+                    "farm",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="changes",
+                        to="weather.farm",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["farm", "id"], name="changelog_farm_id_idx")
+                ],
+            },
+        ),
+    ]
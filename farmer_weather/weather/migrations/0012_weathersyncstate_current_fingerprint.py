@@ -0,0 +1,22 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0011_changelogentry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="weathersyncstate",
+            name="current_fingerprint",
+            field=models.CharField(
+                blank=True,
+                help_text="Hash of the last stored current weather payload",
+                max_length=64,
+            ),
+        ),
+    ]
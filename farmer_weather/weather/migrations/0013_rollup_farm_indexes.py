@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("weather", "0012_weathersyncstate_current_fingerprint"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="dailyweatherrollup",
+            name="farm",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="daily_rollups",
+                to="weather.farm",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="hourlyweatherrollup",
+            name="farm",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="hourly_rollups",
+                to="weather.farm",
+            ),
+        ),
+    ]
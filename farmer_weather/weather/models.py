@@ -34,7 +34,8 @@ class Crop(models.Model):
 
 class Farm(models.Model):
     """Model representing a farmer's location and crop selection"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # Indexed through the leading column of the (user, created_at, id) index
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False)
     name = models.CharField(max_length=200)
     latitude = models.FloatField()
     longitude = models.FloatField()
@@ -43,13 +44,20 @@ class Farm(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination of the farm list, overall and per user
+            models.Index(fields=['-created_at', '-id'], name='farm_created_at_id_idx'),
+            models.Index(fields=['user', '-created_at', '-id'], name='farm_user_created_at_id_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.name} - {self.location_name}"
 
 
 class WeatherData(models.Model):
     """Model to cache weather data"""
-    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='weather_records')
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='weather_records', db_index=False)
     timestamp = models.DateTimeField()
     temperature = models.FloatField(help_text="Temperature in Celsius")
     feels_like = models.FloatField(help_text="Feels like temperature in Celsius")
@@ -64,11 +72,117 @@ class WeatherData(models.Model):
     
     class Meta:
         ordering = ['timestamp']
+        constraints = [
+            models.UniqueConstraint(fields=['farm', 'timestamp'], name='unique_weather_farm_timestamp'),
+        ]
         
     def __str__(self):
         return f"{self.farm.name} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
 
 
+class WeatherRollup(models.Model):
+    """Aggregated WeatherData for a period compacted out of the raw table"""
+    sample_count = models.IntegerField(help_text="Raw observations in the period")
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    temperature_mean = models.FloatField()
+    humidity_mean = models.FloatField()
+    pressure_mean = models.FloatField()
+    wind_speed_mean = models.FloatField()
+    wind_speed_max = models.FloatField()
+    clouds_mean = models.FloatField()
+    precipitation_total = models.FloatField(help_text="Total precipitation in mm")
+    
+    class Meta:
+        abstract = True
+        ordering = ['period_start']
+
+
+class HourlyWeatherRollup(WeatherRollup):
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='hourly_rollups', db_index=False)
+    period_start = models.DateTimeField()
+    
+    class Meta(WeatherRollup.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['farm', 'period_start'], name='unique_hourly_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.farm.name} - {self.period_start.strftime('%Y-%m-%d %H:00')}"
+
+
+class DailyWeatherRollup(WeatherRollup):
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='daily_rollups', db_index=False)
+    period_start = models.DateTimeField()
+    
+    class Meta(WeatherRollup.Meta):
+        constraints = [
+            models.UniqueConstraint(fields=['farm', 'period_start'], name='unique_daily_rollup'),
+        ]
+    
+    def __str__(self):
+        return f"{self.farm.name} - {self.period_start.strftime('%Y-%m-%d')}"
+
+
+class DailyWeatherSummary(models.Model):
+    """Per-day aggregate of a farm's stored weather, rebuilt whenever it is ingested"""
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='daily_summaries', db_index=False)
+    date = models.DateField()
+    sample_count = models.IntegerField()
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    temperature_mean = models.FloatField()
+    humidity_mean = models.FloatField()
+    precipitation_total = models.FloatField(help_text="Total precipitation in mm")
+    wind_speed_max = models.FloatField()
+    dominant_condition = models.CharField(max_length=100)
+    dominant_description = models.CharField(max_length=200)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['farm', 'date'], name='unique_daily_summary'),
+        ]
+    
+    def __str__(self):
+        return f"{self.farm.name} - {self.date}"
+
+
+class WeatherSyncState(models.Model):
+    """Per-farm ingestion bookkeeping used to skip unchanged payloads"""
+    farm = models.OneToOneField(Farm, on_delete=models.CASCADE, related_name='sync_state')
+    current_fingerprint = models.CharField(max_length=64, blank=True,
+                                           help_text="Hash of the last stored current weather payload")
+    forecast_fingerprint = models.CharField(max_length=64, blank=True,
+                                            help_text="Hash of the last stored forecast payload")
+    insight_fingerprint = models.CharField(max_length=64, blank=True,
+                                           help_text="Hash of the forecast window and crop insights were built from")
+    checked_at = models.DateTimeField(null=True, blank=True, db_index=True,
+                                      help_text="When the provider was last polled for this farm")
+    weather_changed_at = models.DateTimeField(null=True, blank=True,
+                                              help_text="Latest fetched_at of the farm's stored weather")
+    insights_changed_at = models.DateTimeField(null=True, blank=True,
+                                               help_text="When the farm's insights were last regenerated")
+    
+    def __str__(self):
+        return f"{self.farm.name} - sync state"
+
+
+class FarmAgronomy(models.Model):
+    """Running evapotranspiration and growing degree day totals for a farm"""
+    farm = models.OneToOneField(Farm, on_delete=models.CASCADE, related_name='agronomy')
+    accumulated_through = models.DateTimeField(null=True, blank=True,
+                                               help_text="End of the last weather step included in the totals")
+    et0_total = models.FloatField(default=0, help_text="Reference evapotranspiration in mm")
+    gdd_total = models.FloatField(default=0, help_text="Growing degree days in °C·days")
+    gdd_base = models.FloatField(null=True, blank=True, help_text="Base temperature gdd_total was accumulated with")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.farm.name} - agronomy"
+
+
 class FarmingInsight(models.Model):
     """Model to store farming recommendations and insights"""
     INSIGHT_TYPES = [
@@ -79,7 +193,7 @@ class FarmingInsight(models.Model):
         ('GENERAL', 'General Advice'),
     ]
     
-    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='insights')
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='insights', db_index=False)
     insight_type = models.CharField(max_length=20, choices=INSIGHT_TYPES)
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -87,9 +201,44 @@ class FarmingInsight(models.Model):
     valid_from = models.DateTimeField()
     valid_until = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-priority', 'valid_from']
+        indexes = [
+            models.Index(fields=['farm', 'valid_until'], name='insight_farm_valid_until_idx'),
+        ]
         
     def __str__(self):
         return f"{self.farm.name} - {self.title}"
+
+
+class ChangeLogEntry(models.Model):
+    """One row of a farm's WeatherData or FarmingInsight being written, for delta sync
+
+    Ids increase monotonically, so a client's sync cursor is the last id it
+    has seen. Entries are written in the same transaction as the change.
+    """
+    KINDS = [
+        ('WEATHER', 'Weather data'),
+        ('INSIGHT', 'Farming insight'),
+    ]
+    ACTIONS = [
+        ('UPSERT', 'Added or changed'),
+        ('DELETE', 'Deleted'),
+        ('EXPIRE', 'Expired'),
+    ]
+    
+    farm = models.ForeignKey(Farm, on_delete=models.CASCADE, related_name='changes', db_index=False)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    object_id = models.BigIntegerField(help_text="Id of the WeatherData or FarmingInsight row")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['farm', 'id'], name='changelog_farm_id_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.farm_id} - {self.kind} {self.action} {self.object_id}"
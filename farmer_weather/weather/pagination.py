@@ -0,0 +1,46 @@
+import base64
+import json
+from datetime import datetime
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    """Opaque cursor pointing just past the row (created_at, pk)"""
+    payload = json.dumps([created_at.isoformat(), pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor}') from e
+
+
+def keyset_rows(queryset, cursor=None):
+    """`queryset` in newest-first (created_at, id) order, starting just past the cursor"""
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+    return queryset
+
+
+def keyset_page(queryset, cursor=None, limit=50):
+    """One page of `queryset` in newest-first (created_at, id) order
+
+    Seeks past the cursor with an indexed range condition instead of an
+    OFFSET, so every page costs the same however deep it is. Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    rows = list(keyset_rows(queryset, cursor)[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
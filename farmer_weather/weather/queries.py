@@ -0,0 +1,52 @@
+from datetime import timedelta
+from .models import DailyWeatherSummary, Farm, FarmingInsight, WeatherData
+
+
+FARM_FIELDS = ['id', 'name', 'location_name', 'latitude', 'longitude', 'crop']
+FARM_PAGE_SIZE = 50
+FORECAST_STEPS = 40
+CALENDAR_DAYS = 5
+
+
+def farm_listing(user, fields=FARM_FIELDS):
+    """Farms `user` may list (their own when logged in, otherwise unowned ones), loading only `fields`"""
+    if user.is_authenticated:
+        farms = Farm.objects.filter(user=user)
+    else:
+        farms = Farm.objects.filter(user__isnull=True)
+    columns = ['id', 'created_at'] + [field for field in fields if field not in ('id', 'crop')]
+    if 'crop' in fields:
+        farms = farms.select_related('crop')
+        columns.append('crop__name')
+    return farms.only(*columns)
+
+
+def for_farm(queryset, farm):
+    """Restrict `queryset` to one farm (instance or id); None keeps every farm, e.g. for a Prefetch"""
+    if farm is None:
+        return queryset
+    return queryset.filter(farm=farm)
+
+
+def current_weather(now, farm=None):
+    """The latest reading at or before `now`"""
+    return for_farm(WeatherData.objects.filter(timestamp__lte=now), farm).order_by('-timestamp')[:1]
+
+
+def forecast(now, farm=None):
+    """The next FORECAST_STEPS readings from `now` on"""
+    return for_farm(WeatherData.objects.filter(timestamp__gte=now), farm).order_by('timestamp')[:FORECAST_STEPS]
+
+
+def active_insights(now, farm=None):
+    """Insights still valid at `now`, most important first"""
+    return for_farm(FarmingInsight.objects.filter(valid_until__gte=now), farm).order_by('-priority', 'valid_from')
+
+
+def calendar_days(farm, today):
+    """The farm's daily summaries for today and the following days of the calendar"""
+    return DailyWeatherSummary.objects.filter(
+        farm=farm,
+        date__gte=today,
+        date__lt=today + timedelta(days=CALENDAR_DAYS)
+    ).order_by('date')
@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from .models import Farm, WeatherSyncState
+from .weather_service import WeatherService
+from .agronomy import accumulate_agronomy
+from .insights import InsightGenerator
+from .locks import SingleFlight, farm_lock
+
+
+logger = logging.getLogger(__name__)
+
+_background = ThreadPoolExecutor(max_workers=2, thread_name_prefix='weather-refresh')
+_pending = set()
+_pending_lock = threading.Lock()
+_farm_flights = SingleFlight()
+
+
+class TokenBucket:
+    """Async token bucket allowing `rate` provider calls per `period` seconds"""
+
+    def __init__(self, rate, period=60.0, capacity=None):
+        self.fill_rate = rate / period
+        self.capacity = capacity or rate
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        """Wait until `tokens` calls are allowed, then take them"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.fill_rate)
+
+
+class RefreshReport:
+    """Throughput and per-farm latency of a bulk refresh run"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.failed = []
+        self.upstream_calls = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def duration(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def throughput(self):
+        """Refreshed farms per second"""
+        return len(self.latencies) / self.duration if self.duration else 0.0
+
+    def percentile(self, pct):
+        """Latency percentile in seconds (nearest rank)"""
+        values = sorted(self.latencies.values())
+        if not values:
+            return 0.0
+        rank = max(int(round(pct / 100 * len(values))) - 1, 0)
+        return values[min(rank, len(values) - 1)]
+
+    def summary(self):
+        return {
+            'refreshed': len(self.latencies),
+            'failed': len(self.failed),
+            'upstream_calls': self.upstream_calls,
+            'duration': self.duration,
+            'throughput': self.throughput,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.percentile(100),
+        }
+
+
+class BulkRefresher:
+    """Refresh weather for many farms concurrently within the provider's quota
+
+    Farms are grouped by the service's grid cell, so each cell costs at most
+    one current and one forecast call regardless of how many farms share it.
+    """
+
+    def __init__(self, service=None, concurrency=None, calls_per_minute=None, generate_insights=False):
+        self.service = service or WeatherService()
+        self.generate_insights = generate_insights
+        self.concurrency = concurrency or getattr(settings, 'WEATHER_REFRESH_CONCURRENCY', 8)
+        self.calls_per_minute = calls_per_minute or getattr(settings, 'OPENWEATHER_CALLS_PER_MINUTE', 60)
+
+    def run(self, farms):
+        """Synchronous entry point; returns a RefreshReport"""
+        return asyncio.run(self.refresh(list(farms)))
+
+    async def refresh(self, farms):
+        report = RefreshReport()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = TokenBucket(self.calls_per_minute)
+
+        cells = {}
+        for farm in farms:
+            cells.setdefault(self.service.get_cell(farm.latitude, farm.longitude), []).append(farm)
+
+        await asyncio.gather(*(
+            self._refresh_cell(cell_farms, semaphore, bucket, report)
+            for cell_farms in cells.values()
+        ))
+        report.finished = time.monotonic()
+        return report
+
+    async def _refresh_cell(self, farms, semaphore, bucket, report):
+        lat, lon = farms[0].latitude, farms[0].longitude
+        # Provider calls run in parallel threads; the thread-sensitive store
+        # keeps all database writes on one thread
+        store = sync_to_async(self._store)
+
+        async with semaphore:
+            started = time.monotonic()
+            if not self.service.is_cached(lat, lon):
+                await bucket.acquire(2)
+                report.upstream_calls += 2
+
+            current, forecast = await asyncio.gather(
+                sync_to_async(self.service.get_current_weather, thread_sensitive=False)(lat, lon),
+                sync_to_async(self.service.get_forecast, thread_sensitive=False)(lat, lon),
+            )
+            if current is None and forecast is None:
+                report.failed.extend(farm.id for farm in farms)
+                return
+
+            for farm in farms:
+                try:
+                    await store(farm, current, forecast)
+                except Exception:
+                    logger.exception("Error storing weather for farm %s", farm.id)
+                    report.failed.append(farm.id)
+                else:
+                    report.latencies[farm.id] = time.monotonic() - started
+
+    def _store(self, farm, current, forecast):
+        with farm_lock(farm.id):
+            self.service.store_weather(farm, current, forecast)
+            if self.generate_insights:
+                InsightGenerator().generate_insights(farm)
+
+
+def refresh_farms(farms=None, **kwargs):
+    """Refresh weather for `farms` (default: every farm) and return the report"""
+    if farms is None:
+        farms = Farm.objects.all()
+    return BulkRefresher(**kwargs).run(farms)
+
+
+def refresh_max_age():
+    return timedelta(seconds=getattr(settings, 'WEATHER_REFRESH_INTERVAL', 30 * 60))
+
+
+def refresh_farm(farm, service=None, max_age=None):
+    """Fetch and store fresh weather for one farm, then rebuild its insights
+
+    Concurrent calls for the same farm in this process share one refresh.
+    The provider is called without holding any lock; the farm lock only
+    serializes the writes across workers. With max_age the refresh is
+    skipped when another worker completed one in the meantime. Returns True
+    if fresh weather was stored, False if the refresh was skipped or the
+    provider returned nothing.
+    """
+    return _farm_flights.do(farm.id, _refresh_farm, farm, service, max_age)
+
+
+def _refresh_farm(farm, service, max_age):
+    service = service or WeatherService()
+    last = last_refreshed(farm)
+    if is_recent(last, max_age):
+        return False
+    current, forecast = service.fetch_weather(farm)
+
+    with farm_lock(farm.id):
+        latest = last_refreshed(farm)
+        if latest != last and is_recent(latest, max_age):
+            # Another worker stored a refresh while this one was fetching
+            return False
+        service.store_weather(farm, current, forecast)
+        if last_refreshed(farm) == latest:
+            # Provider unavailable (or circuit open): nothing was stored
+            return False
+        InsightGenerator().generate_insights(farm)
+        accumulate_agronomy([farm])
+    return True
+
+
+def is_recent(checked_at, max_age):
+    """Whether a farm polled at `checked_at` counts as fresh for `max_age` (None: never)"""
+    return max_age is not None and checked_at is not None and checked_at >= timezone.now() - max_age
+
+
+def last_refreshed(farm):
+    """When the provider was last polled for the farm, or None if never"""
+    return WeatherSyncState.objects.filter(farm=farm).values_list('checked_at', flat=True).first()
+
+
+def stale_farms(max_age=None):
+    """Farms never polled or last polled more than max_age ago"""
+    cutoff = timezone.now() - (max_age or refresh_max_age())
+    return Farm.objects.select_related('crop').filter(
+        Q(sync_state__checked_at__isnull=True) | Q(sync_state__checked_at__lt=cutoff)
+    )
+
+
+def refresh_in_background(farm):
+    """Queue a refresh for the farm unless one is already queued"""
+    with _pending_lock:
+        if farm.id in _pending:
+            return False
+        _pending.add(farm.id)
+    _background.submit(_run_background_refresh, farm)
+    return True
+
+
+def refresh_pending(farm_id):
+    """Whether a background refresh is queued or running for the farm"""
+    with _pending_lock:
+        return farm_id in _pending
+
+
+def _run_background_refresh(farm):
+    try:
+        refresh_farm(farm, max_age=refresh_max_age())
+    except Exception:
+        logger.exception("Background refresh failed for farm %s", farm.id)
+    finally:
+        with _pending_lock:
+            _pending.discard(farm.id)
+        close_old_connections()
+
+
+def ensure_weather(farm):
+    """Stale-while-revalidate: block only when the farm has no weather at all
+
+    Stale data is served as-is while a background refresh is queued; the
+    scheduler normally keeps farms fresh before this is needed.
+    """
+    last = last_refreshed(farm)
+    if last is None:
+        refresh_farm(farm, max_age=refresh_max_age())
+    elif last < timezone.now() - refresh_max_age():
+        refresh_in_background(farm)
+
+
+def refresh_stale_farms(max_age=None, **kwargs):
+    """Refresh every stale farm in bulk, then update their insights and agronomy totals in batches"""
+    report = BulkRefresher(**kwargs).run(stale_farms(max_age))
+    if report.latencies:
+        refreshed = Farm.objects.filter(id__in=list(report.latencies))
+        InsightGenerator().generate_fleet_insights(refreshed)
+        accumulate_agronomy(refreshed.select_related('crop'))
+    return report
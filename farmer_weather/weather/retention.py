@@ -0,0 +1,115 @@
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+from .models import WeatherData, HourlyWeatherRollup, DailyWeatherRollup
+
+
+ROLLUPS = [
+    (HourlyWeatherRollup, TruncHour),
+    (DailyWeatherRollup, TruncDay),
+]
+
+MEAN_FIELDS = ['temperature_mean', 'humidity_mean', 'pressure_mean', 'wind_speed_mean', 'clouds_mean']
+
+
+def _aggregate(rows, trunc):
+    """Aggregate raw rows into one dict per period"""
+    return rows.annotate(period_start=trunc('timestamp')).values('period_start').annotate(
+        sample_count=Count('id'),
+        temperature_min=Min('temperature'),
+        temperature_max=Max('temperature'),
+        temperature_mean=Avg('temperature'),
+        humidity_mean=Avg('humidity'),
+        pressure_mean=Avg('pressure'),
+        wind_speed_mean=Avg('wind_speed'),
+        wind_speed_max=Max('wind_speed'),
+        clouds_mean=Avg('clouds'),
+        precipitation_total=Sum('precipitation'),
+    ).order_by()
+
+
+def _merge(rollup, values):
+    """Fold freshly aggregated values into an existing rollup"""
+    total = rollup.sample_count + values['sample_count']
+    for field in MEAN_FIELDS:
+        merged = getattr(rollup, field) * rollup.sample_count + values[field] * values['sample_count']
+        setattr(rollup, field, merged / total)
+    rollup.temperature_min = min(rollup.temperature_min, values['temperature_min'])
+    rollup.temperature_max = max(rollup.temperature_max, values['temperature_max'])
+    rollup.wind_speed_max = max(rollup.wind_speed_max, values['wind_speed_max'])
+    rollup.precipitation_total += values['precipitation_total']
+    rollup.sample_count = total
+
+
+def _rollup_window(farm_id, rows):
+    for model, trunc in ROLLUPS:
+        aggregated = list(_aggregate(rows, trunc))
+        existing = {
+            rollup.period_start: rollup
+            for rollup in model.objects.filter(
+                farm_id=farm_id,
+                period_start__in=[values['period_start'] for values in aggregated],
+            )
+        }
+        created, updated = [], []
+        for values in aggregated:
+            rollup = existing.get(values['period_start'])
+            if rollup is None:
+                created.append(model(farm_id=farm_id, **values))
+            else:
+                _merge(rollup, values)
+                updated.append(rollup)
+        model.objects.bulk_create(created)
+        if updated:
+            model.objects.bulk_update(updated, ['sample_count', 'temperature_min', 'temperature_max',
+                                                'wind_speed_max', 'precipitation_total'] + MEAN_FIELDS)
+
+
+def _delete_in_chunks(rows, chunk_size):
+    deleted = 0
+    while True:
+        ids = list(rows.values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += WeatherData.objects.filter(id__in=ids).delete()[0]
+
+
+def compact_weather(older_than_days=30, chunk_size=5000, window_days=7, dry_run=False, log=None):
+    """Roll raw WeatherData older than the cutoff into hourly/daily rollups and delete it
+
+    The cutoff is aligned to midnight so every rolled-up day is complete.
+    Each farm is processed in windows of `window_days`; a window's rollups
+    and deletes share one transaction, so an interrupted run can be resumed
+    without double counting. Returns (farms, deleted_rows).
+    """
+    cutoff = (timezone.now() - timedelta(days=older_than_days)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    old_rows = WeatherData.objects.filter(timestamp__lt=cutoff)
+    farm_ids = list(old_rows.values_list('farm_id', flat=True).distinct().order_by('farm_id'))
+
+    total_deleted = 0
+    for farm_id in farm_ids:
+        farm_rows = old_rows.filter(farm_id=farm_id)
+        window_start = farm_rows.aggregate(first=Min('timestamp'))['first'].replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        farm_deleted = 0
+        while window_start < cutoff:
+            window_end = min(window_start + timedelta(days=window_days), cutoff)
+            rows = farm_rows.filter(timestamp__gte=window_start, timestamp__lt=window_end)
+            if dry_run:
+                farm_deleted += rows.count()
+            else:
+                with transaction.atomic():
+                    _rollup_window(farm_id, rows)
+                    farm_deleted += _delete_in_chunks(rows, chunk_size)
+            window_start = window_end
+
+        total_deleted += farm_deleted
+        if log:
+            log(f"Farm {farm_id}: {'would compact' if dry_run else 'compacted'} {farm_deleted} rows")
+
+    return len(farm_ids), total_deleted
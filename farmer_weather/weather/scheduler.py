@@ -0,0 +1,97 @@
+import logging
+import os
+import sys
+import threading
+import time
+from django.conf import settings
+from django.core import mail
+from django.core.management import get_commands
+from django.db import close_old_connections
+from .locks import _lock_dir
+from .refresh import refresh_max_age, refresh_stale_farms
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# Management commands that serve requests and so may host the in-process scheduler
+SERVER_COMMANDS = {'runserver'}
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def run_pass(max_age=None):
+    """Refresh every stale farm once; returns the report summary"""
+    close_old_connections()
+    try:
+        return refresh_stale_farms(max_age or refresh_max_age()).summary()
+    finally:
+        close_old_connections()
+
+
+def _acquire_leader(lock_file):
+    """Whether this process is the one running the in-process scheduler"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _run_forever(interval):
+    leader = False
+    with open(os.path.join(_lock_dir(), 'scheduler.lock'), 'a') as lock_file:
+        while True:
+            # Only one worker process per host runs passes; the others keep
+            # trying so one takes over if the leader exits
+            leader = leader or _acquire_leader(lock_file)
+            if leader:
+                try:
+                    summary = run_pass()
+                    if summary['refreshed'] or summary['failed']:
+                        logger.info(
+                            "Refreshed %s farms (%s failed), %s provider calls in %.1fs",
+                            summary['refreshed'], summary['failed'], summary['upstream_calls'], summary['duration'],
+                        )
+                except Exception:
+                    logger.exception("Scheduler pass failed")
+            time.sleep(interval)
+
+
+def serving_requests(argv=None):
+    """Whether this process is a web server rather than a test run or another management command"""
+    # The test runners (manage.py test, pytest-django) install the locmem outbox
+    if hasattr(mail, 'outbox'):
+        return False
+    argv = sys.argv if argv is None else argv
+    if len(argv) > 1 and argv[1] in get_commands():
+        return argv[1] in SERVER_COMMANDS
+    return True
+
+
+def start_in_process_scheduler():
+    """Run the weather scheduler on a daemon thread of this server process
+
+    For deployments without a separate worker running
+    `manage.py run_weather_scheduler` (e.g. a single web service on SQLite).
+    Enabled by WEATHER_SCHEDULER_IN_PROCESS; called from the WSGI/ASGI entry
+    points, and never started under tests or management commands other than
+    runserver, even when they load those entry points.
+    """
+    global _started
+    if not getattr(settings, 'WEATHER_SCHEDULER_IN_PROCESS', False) or not serving_requests():
+        return False
+    with _start_lock:
+        if _started:
+            return False
+        _started = True
+    interval = getattr(settings, 'WEATHER_SCHEDULER_INTERVAL', 300)
+    threading.Thread(target=_run_forever, args=(interval,), name='weather-scheduler', daemon=True).start()
+    return True
@@ -0,0 +1,71 @@
+from datetime import datetime, time, timedelta
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import DailyWeatherSummary, WeatherData
+
+
+SUMMARY_FIELDS = [
+    'sample_count', 'temperature_min', 'temperature_max', 'temperature_mean', 'humidity_mean',
+    'precipitation_total', 'wind_speed_max', 'dominant_condition', 'dominant_description',
+]
+
+
+def local_date(value):
+    """Calendar date of a (naive or aware) timestamp in the current time zone"""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def daily_aggregates(rows):
+    """Aggregate WeatherData rows into one dict of summary fields per date"""
+    rows = rows.annotate(date=TruncDate('timestamp'))
+
+    dominant = {}
+    conditions = rows.values('date', 'weather_condition', 'weather_description').annotate(
+        count=Count('id')
+    ).order_by('date', '-count', 'weather_condition', 'weather_description')
+    for values in conditions:
+        dominant.setdefault(values['date'], (values['weather_condition'], values['weather_description']))
+
+    summaries = {}
+    for values in rows.values('date').annotate(
+        sample_count=Count('id'),
+        temperature_min=Min('temperature'),
+        temperature_max=Max('temperature'),
+        temperature_mean=Avg('temperature'),
+        humidity_mean=Avg('humidity'),
+        precipitation_total=Sum('precipitation'),
+        wind_speed_max=Max('wind_speed'),
+    ).order_by():
+        date = values.pop('date')
+        values['dominant_condition'], values['dominant_description'] = dominant[date]
+        summaries[date] = values
+    return summaries
+
+
+def update_daily_summaries(farm, timestamps):
+    """Rebuild the farm's DailyWeatherSummary rows for the days containing `timestamps`
+
+    Called at ingest time with the timestamps just written, so reads (the
+    calendar) get one row per day instead of aggregating raw readings.
+    """
+    dates = {local_date(timestamp) for timestamp in timestamps}
+    if not dates:
+        return []
+
+    start = timezone.make_aware(datetime.combine(min(dates), time.min))
+    end = timezone.make_aware(datetime.combine(max(dates) + timedelta(days=1), time.min))
+    aggregates = daily_aggregates(WeatherData.objects.filter(farm=farm, timestamp__gte=start, timestamp__lt=end))
+
+    return DailyWeatherSummary.objects.bulk_create(
+        [
+            DailyWeatherSummary(farm=farm, date=date, **values)
+            for date, values in aggregates.items()
+            if date in dates
+        ],
+        update_conflicts=True,
+        unique_fields=['farm', 'date'],
+        update_fields=SUMMARY_FIELDS + ['updated_at'],
+    )
@@ -1,4 +1,1569 @@
-# Empty tests file - Add your tests here
-from django.test import TestCase
+import asyncio
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock, skipIf
+import numpy as np
+from asgiref.sync import async_to_sync
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date
+from .changelog import CursorExpired, changes_since, latest_cursor, log_changes, prune_change_log
+from . import agronomy, insights, locks, scheduler, weather_service
+from .archive import open_archive
+from .insights import InsightCache, InsightGenerator, insight_cache
+from .locks import SingleFlight
+from .events import EventBroker, broker as event_broker, version_id, weather_updated
+from .management.commands.mock_openweather import (
+    SAMPLES_DIR, MockOpenWeatherServer, load_payload_sets, rebase_current, rebase_forecast,
+)
+from .models import (
+    ChangeLogEntry, Crop, DailyWeatherRollup, Farm, FarmAgronomy, FarmingInsight, HourlyWeatherRollup, WeatherData, WeatherSyncState,
+)
+from .pagination import InvalidCursor, keyset_page
+from . import refresh
+from .refresh import BulkRefresher, TokenBucket, ensure_weather, refresh_farm, refresh_max_age
+from .retention import compact_weather
+from .summaries import update_daily_summaries
+from .weather_service import CircuitBreaker, JitteredRetry, WeatherService, breaker
 
-# Create your tests here.
+
+def make_crop(**fields):
+    values = {
+        'name': 'TOMATO',
+        'optimal_temp_min': 18,
+        'optimal_temp_max': 27,
+        'optimal_humidity_min': 60,
+        'optimal_humidity_max': 80,
+        'water_requirement': 'MEDIUM',
+        'frost_tolerance': False,
+        'growing_season_days': 80,
+    }
+    values.update(fields)
+    return Crop.objects.create(**values)
+
+
+def make_farm(name='Test farm', crop=None, **fields):
+    return Farm.objects.create(
+        name=name, latitude=fields.pop('latitude', 12.97), longitude=fields.pop('longitude', 77.59),
+        location_name='Test', crop=crop, **fields
+    )
+
+
+def weather_fields(temperature=20.0, **fields):
+    values = {
+        'temperature': temperature,
+        'feels_like': temperature,
+        'humidity': 70,
+        'pressure': 1012,
+        'wind_speed': 3,
+        'precipitation': 0,
+        'weather_condition': 'Clouds',
+        'weather_description': 'scattered clouds',
+        'clouds': 40,
+    }
+    values.update(fields)
+    return values
+
+
+def sample_payloads(farm):
+    """(current, forecast) provider payloads for the farm from the bundled mock samples"""
+    payloads = load_payload_sets(SAMPLES_DIR)[0]
+    now = int(time.time())
+    return (
+        rebase_current(payloads['weather'], farm.latitude, farm.longitude, now),
+        rebase_forecast(payloads['forecast'], farm.latitude, farm.longitude, now),
+    )
+
+
+class InsightSyncTests(TestCase):
+    """InsightGenerator._sync keeps insight rows stable across regenerations"""
+
+    def setUp(self):
+        self.farm = make_farm()
+        self.generator = InsightGenerator()
+        self.now = timezone.now()
+
+    def computed(self, *titles, description='Water in the morning'):
+        return [
+            FarmingInsight(
+                farm=self.farm,
+                insight_type='WATERING',
+                title=title,
+                description=description,
+                priority=2,
+                valid_from=self.now,
+                valid_until=self.now + timedelta(days=1),
+            )
+            for title in titles
+        ]
+
+    def active(self, at=None):
+        return FarmingInsight.objects.filter(farm=self.farm, valid_until__gt=at or self.now)
+
+    def test_regeneration_keeps_ids(self):
+        first, written = self.generator._sync([self.farm.id], self.computed('Irrigate', 'Mulch'), self.now)
+        self.assertEqual(written, 2)
+
+        second, written = self.generator._sync([self.farm.id], self.computed('Irrigate', 'Mulch'), self.now)
+        self.assertEqual(written, 0)
+        self.assertEqual(sorted(insight.id for insight in first), sorted(insight.id for insight in second))
+        self.assertEqual(self.active().count(), 2)
+
+    def test_changed_text_updates_in_place(self):
+        first, _ = self.generator._sync([self.farm.id], self.computed('Irrigate'), self.now)
+
+        second, written = self.generator._sync(
+            [self.farm.id], self.computed('Irrigate', description='Water twice'), self.now
+        )
+        self.assertEqual(written, 1)
+        self.assertEqual(second[0].id, first[0].id)
+        self.assertEqual(FarmingInsight.objects.get(id=first[0].id).description, 'Water twice')
+
+    def test_dropped_insight_is_expired(self):
+        first, _ = self.generator._sync([self.farm.id], self.computed('Irrigate', 'Mulch'), self.now)
+        mulch = next(insight for insight in first if insight.title == 'Mulch')
+
+        later = self.now + timedelta(minutes=5)
+        self.generator._sync([self.farm.id], self.computed('Irrigate'), later)
+        self.assertEqual(FarmingInsight.objects.get(id=mulch.id).valid_until, later)
+        self.assertEqual(list(self.active(later).values_list('title', flat=True)), ['Irrigate'])
+        self.assertTrue(ChangeLogEntry.objects.filter(kind='INSIGHT', action='EXPIRE', object_id=mulch.id).exists())
+
+    def test_duplicates_are_collapsed(self):
+        duplicates = FarmingInsight.objects.bulk_create(self.computed('Irrigate', 'Irrigate'))
+        kept, dropped = sorted(duplicates, key=lambda insight: insight.id)
+
+        current, _ = self.generator._sync([self.farm.id], self.computed('Irrigate'), self.now)
+        self.assertEqual([insight.id for insight in current], [kept.id])
+        self.assertEqual(FarmingInsight.objects.get(id=dropped.id).valid_until, self.now)
+
+
+class InsightCacheTests(TestCase):
+    """InsightCache evicts least recently used specs and falls back to the shared cache"""
+
+    def setUp(self):
+        cache.clear()
+        insight_cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(insight_cache.clear)
+
+    def test_evicts_least_recently_used(self):
+        specs = InsightCache(max_size=2)
+        specs.set('a', ['spec a'])
+        specs.set('b', ['spec b'])
+        specs.get('a')
+        specs.set('c', ['spec c'])
+        self.assertEqual(specs.get_many(['a', 'b', 'c']), {'a': ['spec a'], 'c': ['spec c']})
+
+    def test_shared_cache_fallback(self):
+        # Two workers: specs one computes are found by the other through the shared cache
+        writer = InsightCache(max_size=2, alias='default', timeout=60)
+        reader = InsightCache(max_size=2, alias='default', timeout=60)
+        writer.set_many({'a': ['spec a'], 'b': ['spec b']})
+
+        self.assertEqual(reader.get_many(['a', 'b', 'c']), {'a': ['spec a'], 'b': ['spec b']})
+        # and kept locally once found
+        cache.clear()
+        self.assertEqual(reader.get('a'), ['spec a'])
+        self.assertIsNone(InsightCache(alias=None).get('a'))
+
+    def test_changed_fingerprint_is_evaluated_again(self):
+        crop = make_crop()
+        farm, neighbour = make_farm(crop=crop), make_farm('Neighbour', crop=crop)
+        start = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        for each in (farm, neighbour):
+            WeatherData.objects.bulk_create([
+                WeatherData(farm=each, timestamp=start + timedelta(hours=3 * step), **weather_fields(20 + step))
+                for step in range(8)
+            ])
+        generator = InsightGenerator()
+
+        with mock.patch.object(generator, '_evaluate', wraps=generator._evaluate) as evaluate:
+            generator.generate_insights(farm)
+            # Same crop and window: the neighbour reuses the cached spec
+            generator.generate_insights(neighbour)
+            self.assertEqual(evaluate.call_count, 1)
+            fingerprint = WeatherSyncState.objects.get(farm=farm).insight_fingerprint
+            self.assertIsNotNone(insight_cache.get(fingerprint))
+
+            WeatherData.objects.filter(farm=farm).update(temperature=-3)
+            generator.generate_insights(farm)
+            self.assertEqual(evaluate.call_count, 2)
+            changed = WeatherSyncState.objects.get(farm=farm).insight_fingerprint
+            self.assertNotEqual(changed, fingerprint)
+            self.assertIsNotNone(insight_cache.get(changed))
+
+            crop.optimal_temp_min = -10
+            crop.save()
+            neighbour.refresh_from_db()
+            generator.generate_insights(neighbour)
+            self.assertEqual(evaluate.call_count, 3)
+            self.assertNotEqual(WeatherSyncState.objects.get(farm=neighbour).insight_fingerprint, fingerprint)
+
+
+class WeatherUpsertTests(TestCase):
+    """Stored weather has one row per farm and timestamp"""
+
+    def setUp(self):
+        self.farm = make_farm()
+        self.service = WeatherService()
+        self.timestamp = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+    def test_upsert_overwrites_same_timestamp(self):
+        self.service.upsert_weather_data([WeatherData(farm=self.farm, timestamp=self.timestamp, **weather_fields(20))])
+        first = WeatherData.objects.get(farm=self.farm)
+
+        self.service.upsert_weather_data([
+            WeatherData(farm=self.farm, timestamp=self.timestamp, **weather_fields(25)),
+            WeatherData(farm=self.farm, timestamp=self.timestamp + timedelta(hours=3), **weather_fields(22)),
+        ])
+        self.assertEqual(WeatherData.objects.filter(farm=self.farm).count(), 2)
+        stored = WeatherData.objects.get(farm=self.farm, timestamp=self.timestamp)
+        self.assertEqual(stored.id, first.id)
+        self.assertEqual(stored.temperature, 25)
+
+    def test_other_farms_keep_their_rows(self):
+        other = make_farm('Other farm')
+        self.service.upsert_weather_data([
+            WeatherData(farm=farm, timestamp=self.timestamp, **weather_fields())
+            for farm in (self.farm, other)
+        ])
+        self.assertEqual(WeatherData.objects.filter(timestamp=self.timestamp).count(), 2)
+
+
+class StoreWeatherTests(TestCase):
+    """store_weather only writes, logs and notifies when a payload changed"""
+
+    def setUp(self):
+        self.farm = make_farm()
+        self.service = WeatherService()
+        self.current, self.forecast = sample_payloads(self.farm)
+
+        self.notified = []
+
+        def receiver(sender, farm_ids, **kwargs):
+            self.notified.append(farm_ids)
+        weather_updated.connect(receiver)
+        self.addCleanup(weather_updated.disconnect, receiver)
+
+    def store(self, current):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.store_weather(self.farm, current, self.forecast)
+        return WeatherSyncState.objects.get(farm=self.farm)
+
+    def test_identical_payloads_are_not_rewritten(self):
+        first = self.store(self.current)
+        changes = ChangeLogEntry.objects.count()
+        summaries = list(self.farm.daily_summaries.values_list('updated_at', flat=True))
+
+        second = self.store(dict(self.current))
+        self.assertEqual(second.weather_changed_at, first.weather_changed_at)
+        self.assertGreater(second.checked_at, first.checked_at)
+        self.assertEqual(ChangeLogEntry.objects.count(), changes)
+        self.assertEqual(list(self.farm.daily_summaries.values_list('updated_at', flat=True)), summaries)
+        self.assertEqual(self.notified, [[self.farm.id]])
+
+    def test_changed_current_payload_is_written(self):
+        first = self.store(self.current)
+        changed = dict(self.current, main=dict(self.current['main'], temp=self.current['main']['temp'] + 1))
+
+        second = self.store(changed)
+        self.assertGreater(second.weather_changed_at, first.weather_changed_at)
+        self.assertEqual(len(self.notified), 2)
+        self.assertTrue(WeatherData.objects.filter(farm=self.farm, temperature=changed['main']['temp']).exists())
+
+
+class DailySummaryTests(TestCase):
+    """Daily summaries aggregate the day's readings and feed the 5-day calendar"""
+
+    def setUp(self):
+        self.farm = make_farm()
+        self.today = timezone.localdate()
+
+    def day(self, offset, hour):
+        return timezone.make_aware(datetime.combine(self.today + timedelta(days=offset), datetime.min.time())) + timedelta(hours=hour)
+
+    def test_summary_aggregates(self):
+        readings = [
+            (3, weather_fields(14.0, humidity=90, precipitation=1.5, wind_speed=2, weather_description='light rain',
+                               weather_condition='Rain')),
+            (9, weather_fields(21.0, humidity=70, precipitation=0, wind_speed=6)),
+            (15, weather_fields(29.5, humidity=50, precipitation=4.0, wind_speed=4)),
+            (21, weather_fields(18.5, humidity=80, precipitation=0.5, wind_speed=3)),
+        ]
+        rows = WeatherData.objects.bulk_create([
+            WeatherData(farm=self.farm, timestamp=self.day(0, hour), **fields) for hour, fields in readings
+        ])
+        # A reading on the next day must not leak into today's totals
+        WeatherData.objects.create(farm=self.farm, timestamp=self.day(1, 0), **weather_fields(40.0, precipitation=9))
+
+        update_daily_summaries(self.farm, [row.timestamp for row in rows])
+        summary = self.farm.daily_summaries.get()
+        self.assertEqual(summary.date, self.today)
+        self.assertEqual(summary.sample_count, 4)
+        self.assertEqual(summary.temperature_min, 14.0)
+        self.assertEqual(summary.temperature_max, 29.5)
+        self.assertAlmostEqual(summary.temperature_mean, 20.75)
+        self.assertAlmostEqual(summary.humidity_mean, 72.5)
+        self.assertAlmostEqual(summary.precipitation_total, 6.0)
+        self.assertEqual(summary.wind_speed_max, 6)
+        self.assertEqual((summary.dominant_condition, summary.dominant_description), ('Clouds', 'scattered clouds'))
+
+    def test_calendar_shows_five_days(self):
+        rows = WeatherData.objects.bulk_create([
+            WeatherData(farm=self.farm, timestamp=self.day(offset, 12), **weather_fields())
+            for offset in range(-1, 7)
+        ])
+        update_daily_summaries(self.farm, [row.timestamp for row in rows])
+
+        response = self.client.get(reverse('weather_calendar', args=[self.farm.id]))
+        self.assertEqual(
+            [day.date for day in response.context['calendar_days']],
+            [self.today + timedelta(days=offset) for offset in range(5)]
+        )
+
+
+class RemoveDuplicateWeatherMigrationTests(TransactionTestCase):
+    """Migration 0002 drops duplicate rows before adding the unique constraint"""
+
+    before = [('weather', '0001_initial')]
+    after = [('weather', '0002_weatherdata_unique_farm_timestamp')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_keeps_latest_row_per_timestamp(self):
+        apps = self.migrate(self.before)
+        OldFarm = apps.get_model('weather', 'Farm')
+        OldWeatherData = apps.get_model('weather', 'WeatherData')
+
+        farm = OldFarm.objects.create(name='Test farm', latitude=0, longitude=0, location_name='Test')
+        timestamp = timezone.now().replace(minute=0, second=0, microsecond=0)
+        rows = [
+            OldWeatherData.objects.create(farm=farm, timestamp=timestamp, **weather_fields(temperature))
+            for temperature in (18, 19, 20)
+        ]
+        single = OldWeatherData.objects.create(farm=farm, timestamp=timestamp + timedelta(hours=3), **weather_fields())
+
+        self.migrate(self.after)
+        self.assertEqual(
+            sorted(WeatherData.objects.values_list('id', flat=True)),
+            sorted([rows[-1].id, single.id]),
+        )
+
+
+@mock.patch('weather.weather_service.time.monotonic')
+class CircuitBreakerTests(SimpleTestCase):
+    """CircuitBreaker moves between closed, open and half-open"""
+
+    def open_breaker(self, monotonic):
+        monotonic.return_value = 100.0
+        breaker = CircuitBreaker(threshold=3, reset_timeout=60)
+        with self.assertLogs('weather.weather_service', 'WARNING'):
+            for _ in range(3):
+                self.assertTrue(breaker.allow())
+                breaker.record_failure()
+        return breaker
+
+    def test_opens_after_threshold_failures(self, monotonic):
+        breaker = self.open_breaker(monotonic)
+        self.assertTrue(breaker.is_open)
+        monotonic.return_value = 159.0
+        self.assertFalse(breaker.allow())
+
+    def test_success_resets_failure_count(self, monotonic):
+        breaker = CircuitBreaker(threshold=3, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+
+    def test_half_open_lets_one_trial_through(self, monotonic):
+        breaker = self.open_breaker(monotonic)
+        monotonic.return_value = 160.0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+    def test_successful_trial_closes(self, monotonic):
+        breaker = self.open_breaker(monotonic)
+        monotonic.return_value = 160.0
+        breaker.allow()
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.allow())
+
+    def test_failed_trial_reopens(self, monotonic):
+        breaker = self.open_breaker(monotonic)
+        monotonic.return_value = 160.0
+        breaker.allow()
+        with self.assertLogs('weather.weather_service', 'WARNING'):
+            breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        monotonic.return_value = 219.0
+        self.assertFalse(breaker.allow())
+        monotonic.return_value = 220.0
+        self.assertTrue(breaker.allow())
+
+    def test_unexpected_error_ends_trial(self, monotonic):
+        half_open = self.open_breaker(monotonic)
+        monotonic.return_value = 160.0
+        service = WeatherService()
+        with mock.patch('weather.weather_service.breaker', half_open), \
+                mock.patch.object(service, 'get_cell_center', side_effect=RuntimeError('boom')), \
+                self.assertLogs('weather.weather_service', 'WARNING'):
+            with self.assertRaises(RuntimeError):
+                service._request('weather', (0, 0), 'breaker-trial-test', 60)
+        self.assertFalse(half_open.trial_in_flight)
+        self.assertTrue(half_open.is_open)
+        monotonic.return_value = 220.0
+        self.assertTrue(half_open.allow())
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Concurrent callers of one key share a single execution"""
+
+    THREADS = 8
+
+    def run_flight(self, fn):
+        """Call `fn` through one SingleFlight key from THREADS threads at once
+
+        The leader's call is held open until every other thread waits on it.
+        Returns the (result or exception) seen by each thread.
+        """
+        flight = SingleFlight()
+        waiting = threading.Semaphore(0)
+
+        class WatchedEvent(threading.Event):
+            def wait(self, timeout=None):
+                waiting.release()
+                return super().wait(timeout)
+
+        class WatchedCall(locks._Call):
+            def __init__(self):
+                super().__init__()
+                self.done = WatchedEvent()
+
+        def leader():
+            for _ in range(self.THREADS - 1):
+                self.assertTrue(waiting.acquire(timeout=5))
+            return fn()
+
+        outcomes = []
+        outcomes_lock = threading.Lock()
+
+        def caller():
+            try:
+                outcome = flight.do('cell', leader)
+            except Exception as e:
+                outcome = e
+            with outcomes_lock:
+                outcomes.append(outcome)
+
+        with mock.patch.object(locks, '_Call', WatchedCall):
+            threads = [threading.Thread(target=caller) for _ in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+        self.assertEqual(len(outcomes), self.THREADS)
+        return outcomes
+
+    def test_one_call_per_key(self):
+        provider = mock.Mock(return_value={'payload': 1})
+        outcomes = self.run_flight(provider)
+
+        provider.assert_called_once()
+        self.assertEqual(outcomes, [{'payload': 1}] * self.THREADS)
+        # Every caller gets the very same result object
+        self.assertEqual(len({id(outcome) for outcome in outcomes}), 1)
+
+    def test_exception_reaches_every_waiter(self):
+        error = ConnectionError('provider down')
+        provider = mock.Mock(side_effect=error)
+        outcomes = self.run_flight(provider)
+
+        provider.assert_called_once()
+        self.assertTrue(all(outcome is error for outcome in outcomes))
+
+    def test_key_is_released_after_the_call(self):
+        flight = SingleFlight()
+        provider = mock.Mock(side_effect=[ValueError('first'), 'second'])
+        with self.assertRaises(ValueError):
+            flight.do('cell', provider)
+        self.assertEqual(flight.do('cell', provider), 'second')
+        self.assertEqual(provider.call_count, 2)
+
+
+class FetchWeatherTests(SimpleTestCase):
+    """Provider calls run in parallel on the shared pool and retry within a time budget"""
+
+    def setUp(self):
+        self.service = WeatherService()
+        self.farm = Farm(latitude=12.97, longitude=77.59)
+
+    def test_current_and_forecast_fetched_concurrently(self):
+        # Both calls must be in flight at once for the barrier to open
+        barrier = threading.Barrier(2, timeout=5)
+
+        def meet(lat, lon):
+            barrier.wait()
+            return threading.current_thread()
+
+        with mock.patch.object(self.service, 'get_current_weather', side_effect=meet), \
+                mock.patch.object(self.service, 'get_forecast', side_effect=meet):
+            current, forecast = self.service.fetch_weather(self.farm)
+            # The pool slot is released for the next request
+            current_again, _ = self.service.fetch_weather(self.farm)
+
+        self.assertIs(forecast, threading.current_thread())
+        self.assertIsNot(current, forecast)
+        self.assertIsNot(current_again, forecast)
+
+    def test_saturated_pool_fetches_inline(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+
+        def thread(lat, lon):
+            return threading.current_thread()
+
+        with mock.patch.object(weather_service, '_fetch_slots', slots), \
+                mock.patch.object(self.service, 'get_current_weather', side_effect=thread), \
+                mock.patch.object(self.service, 'get_forecast', side_effect=thread):
+            current, forecast = self.service.fetch_weather(self.farm)
+
+        self.assertIs(current, threading.current_thread())
+        self.assertIs(forecast, threading.current_thread())
+
+    @mock.patch('weather.weather_service.time.monotonic')
+    def test_retries_stop_at_time_budget(self, monotonic):
+        retry = JitteredRetry(total=10, connect=10, backoff_factor=1, time_budget=5)
+        error = ConnectTimeoutError('timed out')
+
+        monotonic.return_value = 100.0
+        retry = retry.increment('GET', '/weather', error=error)
+        # Second retry backs off up to 2s and still starts within the budget
+        monotonic.return_value = 102.0
+        retry = retry.increment('GET', '/weather', error=error)
+        # A third would back off up to 4s, past 105
+        monotonic.return_value = 103.0
+        with self.assertRaises(MaxRetryError):
+            retry.increment('GET', '/weather', error=error)
+
+
+class KeysetPageTests(TestCase):
+    """keyset_page walks newest-first pages without skipping or repeating rows"""
+
+    def setUp(self):
+        self.farms = [make_farm(f'Farm {n}') for n in range(5)]
+
+    def walk(self, limit):
+        ids, cursor = [], None
+        while True:
+            page, cursor = keyset_page(Farm.objects.all(), cursor, limit)
+            ids.extend(farm.id for farm in page)
+            if cursor is None:
+                return ids
+
+    def test_equal_created_at_is_ordered_by_id(self):
+        Farm.objects.update(created_at=timezone.now())
+        self.assertEqual(self.walk(2), sorted((farm.id for farm in self.farms), reverse=True))
+
+    def test_mixed_created_at(self):
+        now = timezone.now()
+        Farm.objects.filter(id__in=[farm.id for farm in self.farms[:3]]).update(created_at=now)
+        Farm.objects.filter(id__in=[farm.id for farm in self.farms[3:]]).update(created_at=now - timedelta(days=1))
+        expected = [farm.id for farm in reversed(self.farms[:3])] + [farm.id for farm in reversed(self.farms[3:])]
+        for limit in (1, 2, 5, 10):
+            self.assertEqual(self.walk(limit), expected)
+
+    def test_invalid_cursor(self):
+        for cursor in ('not-a-cursor', 'WzFd', '!!!'):
+            with self.assertRaises(InvalidCursor):
+                keyset_page(Farm.objects.all(), cursor)
+
+    def test_api_rejects_invalid_cursor(self):
+        response = self.client.get(reverse('api_farms'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_api_next_cursor_header(self):
+        response = self.client.get(reverse('api_farms'), {'limit': 3})
+        self.assertEqual(len(response.json()), 3)
+        response = self.client.get(reverse('api_farms'), {'limit': 3, 'cursor': response['X-Next-Cursor']})
+        self.assertEqual(len(response.json()), 2)
+        self.assertNotIn('X-Next-Cursor', response)
+
+
+class ChangeLogTests(TestCase):
+    """changes_since returns the net change per row after a cursor"""
+
+    def setUp(self):
+        self.farm = make_farm()
+        self.start = latest_cursor()
+
+    def test_actions_on_one_row_collapse_into_the_last(self):
+        log_changes('WEATHER', 'UPSERT', [(self.farm.id, 1), (self.farm.id, 2)])
+        log_changes('WEATHER', 'UPSERT', [(self.farm.id, 1)])
+        log_changes('WEATHER', 'DELETE', [(self.farm.id, 2)])
+        log_changes('INSIGHT', 'UPSERT', [(self.farm.id, 1)])
+        log_changes('INSIGHT', 'EXPIRE', [(self.farm.id, 1)])
+
+        weather, insights, cursor, has_more = changes_since(self.farm, self.start)
+        self.assertEqual(weather, {1: 'UPSERT', 2: 'DELETE'})
+        self.assertEqual(insights, {1: 'EXPIRE'})
+        self.assertEqual(cursor, latest_cursor())
+        self.assertFalse(has_more)
+
+    def test_other_farms_are_excluded(self):
+        other = make_farm('Other farm')
+        log_changes('WEATHER', 'UPSERT', [(other.id, 1), (self.farm.id, 2)])
+
+        weather, _, _, _ = changes_since(self.farm, self.start)
+        self.assertEqual(weather, {2: 'UPSERT'})
+
+    def test_pages_through_changes(self):
+        log_changes('WEATHER', 'UPSERT', [(self.farm.id, pk) for pk in range(1, 6)])
+
+        weather, _, cursor, has_more = changes_since(self.farm, self.start, limit=3)
+        self.assertEqual(sorted(weather), [1, 2, 3])
+        self.assertTrue(has_more)
+        weather, _, cursor, has_more = changes_since(self.farm, cursor, limit=3)
+        self.assertEqual(sorted(weather), [4, 5])
+        self.assertFalse(has_more)
+        self.assertEqual(changes_since(self.farm, cursor)[:2], ({}, {}))
+
+    def test_cursor_expires_after_pruning(self):
+        log_changes('WEATHER', 'UPSERT', [(self.farm.id, pk) for pk in range(1, 4)])
+        ChangeLogEntry.objects.update(created_at=timezone.now() - timedelta(days=30))
+        log_changes('WEATHER', 'UPSERT', [(self.farm.id, 4)])
+        current = latest_cursor()
+
+        self.assertEqual(prune_change_log(), 3)
+        with self.assertRaises(CursorExpired):
+            changes_since(self.farm, self.start)
+        self.assertEqual(changes_since(self.farm, current - 1)[0], {4: 'UPSERT'})
+
+    def test_pruning_keeps_the_newest_entry(self):
+        log_changes('WEATHER', 'UPSERT', [(self.farm.id, 1), (self.farm.id, 2)])
+        ChangeLogEntry.objects.update(created_at=timezone.now() - timedelta(days=30))
+        current = latest_cursor()
+
+        prune_change_log()
+        self.assertEqual(latest_cursor(), current)
+        with self.assertRaises(CursorExpired):
+            changes_since(self.farm, self.start)
+
+    def test_unknown_cursor_expires(self):
+        log_changes('WEATHER', 'UPSERT', [(self.farm.id, 1)])
+        with self.assertRaises(CursorExpired):
+            changes_since(self.farm, latest_cursor() + 1)
+
+    def test_api_resets_on_expired_cursor(self):
+        log_changes('WEATHER', 'UPSERT', [(self.farm.id, 1)])
+        url = reverse('api_farm_weather_changes', args=[self.farm.id])
+
+        response = self.client.get(url, {'cursor': latest_cursor() + 1}).json()
+        self.assertTrue(response['reset'])
+        self.assertEqual(response['cursor'], str(latest_cursor()))
+
+        response = self.client.get(url, {'cursor': response['cursor']}).json()
+        self.assertFalse(response['reset'])
+        self.assertEqual(response['weather'], {'upserted': [], 'deleted': []})
+
+
+class DeltaSyncConcurrencyTests(TransactionTestCase):
+    """Delta sync reads never wait for a refresh's provider calls"""
+
+    def test_slow_refresh_does_not_block_changes(self):
+        farm = make_farm()
+        log_changes('WEATHER', 'UPSERT', [(farm.id, 1)])
+        service = WeatherService()
+        fetching, release = threading.Event(), threading.Event()
+
+        def slow_fetch(farm):
+            fetching.set()
+            release.wait(10)
+            return None, None
+
+        def refresh():
+            try:
+                refresh_farm(farm, service=service)
+            finally:
+                connection.close()
+
+        with mock.patch.object(service, 'fetch_weather', side_effect=slow_fetch):
+            thread = threading.Thread(target=refresh)
+            thread.start()
+            self.addCleanup(thread.join)
+            self.addCleanup(release.set)
+            self.assertTrue(fetching.wait(5))
+
+            started = time.monotonic()
+            weather, _, _, _ = changes_since(farm, 0)
+            response = self.client.get(reverse('api_farm_weather_changes', args=[farm.id]), {'cursor': 0})
+            self.assertLess(time.monotonic() - started, 2)
+            self.assertEqual(weather, {1: 'UPSERT'})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(thread.is_alive())
+
+
+class FleetInsightTests(TestCase):
+    """generate_fleet_insights writes what generate_insights writes per farm"""
+
+    def setUp(self):
+        rng = random.Random(7)
+        crops = [
+            make_crop(),
+            make_crop(name='WHEAT', optimal_temp_min=12, optimal_temp_max=25, optimal_humidity_min=40,
+                      optimal_humidity_max=70, water_requirement='LOW', frost_tolerance=True),
+            make_crop(name='RICE', optimal_temp_min=20, optimal_temp_max=35, optimal_humidity_min=70,
+                      optimal_humidity_max=90, water_requirement='HIGH'),
+        ]
+        self.now = timezone.now().replace(microsecond=0)
+        self.farms = [make_farm(f'Farm {n}', crop=rng.choice(crops)) for n in range(24)]
+        self.farms.append(make_farm('No crop'))
+
+        rows = []
+        for farm in self.farms:
+            for step in range(rng.choice([0, 5, 40, 45])):
+                rows.append(WeatherData(
+                    farm=farm,
+                    timestamp=self.now + timedelta(hours=1 + 3 * step),
+                    **weather_fields(
+                        rng.uniform(-3, 38),
+                        humidity=rng.uniform(10, 100),
+                        wind_speed=rng.uniform(0, 20),
+                        precipitation=rng.choice([0, 0, 1, 12]),
+                        weather_condition=rng.choice(['Rain', 'Clear', 'Clouds']),
+                    ),
+                ))
+        WeatherData.objects.bulk_create(rows)
+        insight_cache.clear()
+        self.addCleanup(insight_cache.clear)
+
+    def stored(self):
+        return sorted(FarmingInsight.objects.values_list(
+            'farm_id', 'insight_type', 'title', 'description', 'priority', 'valid_from', 'valid_until'
+        ))
+
+    def test_fleet_matches_per_farm(self):
+        generator = InsightGenerator()
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            for farm in Farm.objects.select_related('crop'):
+                generator.generate_insights(farm)
+            expected = self.stored()
+            fingerprints = dict(WeatherSyncState.objects.values_list('farm_id', 'insight_fingerprint'))
+
+            FarmingInsight.objects.all().delete()
+            WeatherSyncState.objects.update(insight_fingerprint='')
+            insight_cache.clear()
+            updated, written = generator.generate_fleet_insights(batch_size=7)
+
+        self.assertTrue(expected)
+        self.assertEqual(self.stored(), expected)
+        self.assertEqual(updated, len([farm_id for farm_id, value in fingerprints.items() if value]))
+        self.assertEqual(written, len(expected))
+        self.assertEqual(dict(WeatherSyncState.objects.values_list('farm_id', 'insight_fingerprint')), fingerprints)
+
+    def test_unchanged_fleet_is_skipped(self):
+        generator = InsightGenerator()
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            generator.generate_fleet_insights()
+            self.assertEqual(generator.generate_fleet_insights(), (0, 0))
+
+    def test_refresh_during_fleet_run_is_kept(self):
+        generator = InsightGenerator()
+        farm = Farm.objects.select_related('crop').filter(crop__isnull=False, weather_records__isnull=False).first()
+        real_farm_locks = insights.farm_locks
+        refreshed = {}
+
+        @contextmanager
+        def refresh_first(farm_ids):
+            # A per-farm refresh stores new weather and insights after the
+            # fleet batch was evaluated but before it takes the locks
+            if farm.id in farm_ids and not refreshed:
+                WeatherData.objects.filter(farm=farm).update(temperature=-2, feels_like=-2)
+                generator.generate_insights(farm)
+                refreshed['insights'] = self.stored_for(farm)
+                refreshed['fingerprint'] = WeatherSyncState.objects.get(farm=farm).insight_fingerprint
+            with real_farm_locks(farm_ids):
+                yield
+
+        with mock.patch('django.utils.timezone.now', return_value=self.now), \
+                mock.patch.object(insights, 'farm_locks', refresh_first):
+            generator.generate_fleet_insights(batch_size=7)
+
+        self.assertTrue(refreshed['insights'])
+        self.assertEqual(self.stored_for(farm), refreshed['insights'])
+        self.assertEqual(WeatherSyncState.objects.get(farm=farm).insight_fingerprint, refreshed['fingerprint'])
+        with mock.patch('django.utils.timezone.now', return_value=self.now):
+            self.assertEqual(generator.generate_fleet_insights(), (0, 0))
+
+    def stored_for(self, farm):
+        return [row for row in self.stored() if row[0] == farm.id]
+
+
+class MockProviderTests(TestCase):
+    """WeatherService against the bundled mock OpenWeatherMap server, without network access"""
+
+    def start_server(self, **options):
+        server = MockOpenWeatherServer(('127.0.0.1', 0), load_payload_sets(SAMPLES_DIR), **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        settings = override_settings(OPENWEATHER_BASE_URL=f'http://127.0.0.1:{server.server_port}/data/2.5')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        return server
+
+    def setUp(self):
+        cache.clear()
+        breaker.record_success()
+        self.addCleanup(cache.clear)
+        self.addCleanup(breaker.record_success)
+        self.farm = make_farm()
+
+    def test_stores_current_and_forecast(self):
+        server = self.start_server()
+        summary = WeatherService().get_weather_summary(self.farm)
+
+        self.assertEqual(server.stats['requests'], 2)
+        self.assertEqual(len(summary['forecast']['list']), 40)
+        self.assertEqual(WeatherData.objects.filter(farm=self.farm).count(), 41)
+        self.assertTrue(self.farm.daily_summaries.exists())
+        state = WeatherSyncState.objects.get(farm=self.farm)
+        self.assertIsNotNone(state.checked_at)
+        self.assertIsNotNone(state.weather_changed_at)
+
+    def test_neighbouring_farms_share_cached_payloads(self):
+        server = self.start_server()
+        neighbour = make_farm('Neighbour', latitude=self.farm.latitude + 0.001, longitude=self.farm.longitude)
+        service = WeatherService()
+        service.get_weather_summary(self.farm)
+        service.get_weather_summary(neighbour)
+
+        self.assertEqual(server.stats['requests'], 2)
+        self.assertEqual(WeatherData.objects.filter(farm=neighbour).count(), 41)
+
+    def test_server_errors_are_retried(self):
+        server = self.start_server(error_rate=1.0, error_status=503)
+        with mock.patch.object(weather_service, '_session', None), \
+                override_settings(WEATHER_HTTP_RETRIES=2), \
+                self.assertLogs('weather.weather_service', 'WARNING'):
+            summary = WeatherService().get_weather_summary(self.farm)
+
+        self.assertEqual(summary, {'current': None, 'forecast': None})
+        # One call and two retries per endpoint, each endpoint one breaker failure
+        self.assertEqual(server.stats['errors'], 6)
+        self.assertEqual(breaker.failures, 2)
+
+    def test_provider_errors_store_nothing(self):
+        server = self.start_server(error_rate=1.0, error_status=401)
+        with self.assertLogs('weather.weather_service', 'WARNING'):
+            summary = WeatherService().get_weather_summary(self.farm)
+
+        self.assertEqual(summary, {'current': None, 'forecast': None})
+        self.assertEqual(server.stats['errors'], 2)
+        self.assertFalse(WeatherData.objects.filter(farm=self.farm).exists())
+        self.assertEqual(breaker.failures, 2)
+
+
+@mock.patch('weather.api_views.refresh_in_background')
+class ConditionalWeatherTests(TestCase):
+    """GET /api/farms/<id>/weather/ answers revalidations from the sync state"""
+
+    def setUp(self):
+        self.farm = make_farm()
+        self.current, self.forecast = sample_payloads(self.farm)
+        WeatherService().store_weather(self.farm, self.current, self.forecast)
+        self.url = reverse('api_farm_weather', args=[self.farm.id])
+
+    def test_validators_on_full_response(self, refresh):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+        self.assertIn('max-age', response['Cache-Control'])
+        refresh.assert_not_called()
+
+    def test_if_none_match_hit(self, refresh):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_if_none_match_miss(self, refresh):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['location'], self.farm.location_name)
+
+    def test_if_modified_since(self, refresh):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        earlier = http_date(parse_http_date(last_modified) - 3600)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=earlier).status_code, 200)
+
+    def test_validators_change_with_data(self, refresh):
+        first = self.client.get(self.url)
+        changed = dict(self.current, main=dict(self.current['main'], temp=self.current['main']['temp'] + 1))
+        WeatherService().store_weather(self.farm, changed, self.forecast)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['current']['temperature'], changed['main']['temp'])
+
+    def test_unchanged_refresh_keeps_validators(self, refresh):
+        first = self.client.get(self.url)
+        WeatherService().store_weather(self.farm, dict(self.current), self.forecast)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+    def test_no_weather_yet_is_not_cached(self, refresh):
+        farm = make_farm('New farm')
+        response = self.client.get(reverse('api_farm_weather', args=[farm.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertIn('no-store', response['Cache-Control'])
+        refresh.assert_called_once()
+
+
+class TokenBucketTests(SimpleTestCase):
+    """TokenBucket refills at its rate and makes callers wait for missing tokens"""
+
+    def setUp(self):
+        self.now = 0.0
+        self.slept = []
+        monotonic = mock.patch('weather.refresh.time.monotonic', side_effect=self.clock)
+        sleep = mock.patch('weather.refresh.asyncio.sleep', side_effect=self.sleep)
+        monotonic.start()
+        sleep.start()
+        self.addCleanup(monotonic.stop)
+        self.addCleanup(sleep.stop)
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+    def test_burst_up_to_capacity_then_throttles(self):
+        bucket = TokenBucket(60, period=60)
+        asyncio.run(bucket.acquire(60))
+        self.assertEqual(self.slept, [])
+
+        # Empty bucket, one token per second: two tokens cost two seconds
+        asyncio.run(bucket.acquire(2))
+        self.assertEqual(self.slept, [2.0])
+        self.assertAlmostEqual(bucket.tokens, 0.0)
+
+    def test_refill_is_capped_at_capacity(self):
+        bucket = TokenBucket(30, period=60, capacity=10)
+        asyncio.run(bucket.acquire(10))
+        self.now += 1000
+        asyncio.run(bucket.acquire(1))
+        self.assertEqual(self.slept, [])
+        self.assertAlmostEqual(bucket.tokens, 9.0)
+
+        # Half a token per second
+        asyncio.run(bucket.acquire(10))
+        self.assertEqual(self.slept, [2.0])
+
+
+class BulkRefresherTests(TestCase):
+    """BulkRefresher fetches once per grid cell and stores every farm in it"""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # Three farms in one 0.05° cell and one far away
+        self.cell_farms = [
+            make_farm(f'Cell farm {i}', latitude=12.97 + i * 0.001, longitude=77.59 + i * 0.001)
+            for i in range(3)
+        ]
+        self.far_farm = make_farm('Far farm', latitude=20.0, longitude=70.0)
+        self.farms = self.cell_farms + [self.far_farm]
+
+        self.service = WeatherService()
+        current, forecast = sample_payloads(self.far_farm)
+        self.current = mock.patch.object(self.service, 'get_current_weather', return_value=current).start()
+        self.forecast = mock.patch.object(self.service, 'get_forecast', return_value=forecast).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def refresh(self, **options):
+        return async_to_sync(BulkRefresher(self.service, calls_per_minute=600, **options).refresh)(self.farms)
+
+    def test_one_provider_call_per_cell(self):
+        report = self.refresh(concurrency=2)
+
+        self.assertEqual(self.current.call_count, 2)
+        self.assertEqual(self.forecast.call_count, 2)
+        self.assertEqual(report.upstream_calls, 4)
+        self.assertEqual(sorted(report.latencies), sorted(farm.id for farm in self.farms))
+        self.assertEqual(report.failed, [])
+        for farm in self.farms:
+            self.assertEqual(WeatherData.objects.filter(farm=farm).count(), 41)
+
+    def test_cached_cells_take_no_tokens(self):
+        cached = self.service.get_cell(self.far_farm.latitude, self.far_farm.longitude)
+
+        def is_cached(lat, lon):
+            return self.service.get_cell(lat, lon) == cached
+
+        with mock.patch.object(self.service, 'is_cached', side_effect=is_cached):
+            report = self.refresh()
+        self.assertEqual(report.upstream_calls, 2)
+
+    def test_failed_cell_reports_its_farms(self):
+        self.current.return_value = self.forecast.return_value = None
+        report = self.refresh()
+        self.assertEqual(sorted(report.failed), sorted(farm.id for farm in self.farms))
+        self.assertFalse(WeatherData.objects.exists())
+
+
+@mock.patch('weather.scheduler.close_old_connections')
+class SchedulerTests(SimpleTestCase):
+    """Scheduler passes, leader election and the in-process scheduler guard"""
+
+    def report(self, refreshed=0, failed=0):
+        report = mock.Mock()
+        report.summary.return_value = {
+            'refreshed': refreshed, 'failed': failed, 'upstream_calls': 2 * refreshed, 'duration': 1.5,
+        }
+        return report
+
+    def test_run_pass_refreshes_stale_farms(self, close_old_connections):
+        with mock.patch.object(scheduler, 'refresh_stale_farms', return_value=self.report(3)) as refresh_stale:
+            summary = scheduler.run_pass()
+        refresh_stale.assert_called_once_with(refresh_max_age())
+        self.assertEqual(summary['refreshed'], 3)
+        self.assertEqual(close_old_connections.call_count, 2)
+
+    def test_run_weather_scheduler_once(self, close_old_connections):
+        stdout = StringIO()
+        with mock.patch.object(scheduler, 'refresh_stale_farms', return_value=self.report(3, 1)) as refresh_stale:
+            call_command('run_weather_scheduler', '--once', '--max-age', '600', stdout=stdout)
+        refresh_stale.assert_called_once_with(timedelta(seconds=600))
+        self.assertIn('Refreshed 3 farms (1 failed), 6 provider calls', stdout.getvalue())
+
+    def test_run_weather_scheduler_survives_failed_pass(self, close_old_connections):
+        stderr = StringIO()
+        with mock.patch.object(scheduler, 'refresh_stale_farms', side_effect=RuntimeError('database down')):
+            call_command('run_weather_scheduler', '--once', stderr=stderr)
+        self.assertIn('Scheduler pass failed: database down', stderr.getvalue())
+
+    @skipIf(scheduler.fcntl is None, 'needs fcntl file locks')
+    def test_one_leader_per_lock_file(self, close_old_connections):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f'{directory.name}/scheduler.lock'
+        with open(path, 'a') as first, open(path, 'a') as second:
+            self.assertTrue(scheduler._acquire_leader(first))
+            self.assertFalse(scheduler._acquire_leader(second))
+            first.close()
+            self.assertTrue(scheduler._acquire_leader(second))
+
+    @override_settings(WEATHER_SCHEDULER_IN_PROCESS=True)
+    def test_in_process_scheduler_starts_once(self, close_old_connections):
+        with mock.patch.object(scheduler, '_started', False), \
+                mock.patch.object(scheduler, 'serving_requests', return_value=True), \
+                mock.patch.object(scheduler.threading, 'Thread') as thread:
+            self.assertTrue(scheduler.start_in_process_scheduler())
+            self.assertFalse(scheduler.start_in_process_scheduler())
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+    @override_settings(WEATHER_SCHEDULER_IN_PROCESS=True)
+    def test_in_process_scheduler_not_started_under_tests(self, close_old_connections):
+        with mock.patch.object(scheduler, '_started', False), \
+                mock.patch.object(scheduler.threading, 'Thread') as thread:
+            self.assertFalse(scheduler.start_in_process_scheduler())
+        thread.assert_not_called()
+
+    def test_only_servers_run_the_in_process_scheduler(self, close_old_connections):
+        # Outside the test runner (no locmem outbox)
+        with mock.patch.object(scheduler, 'mail', mock.Mock(spec=[])):
+            self.assertTrue(scheduler.serving_requests(['gunicorn', 'farmer_weather.wsgi']))
+            self.assertTrue(scheduler.serving_requests(['uvicorn', 'farmer_weather.asgi:application']))
+            self.assertTrue(scheduler.serving_requests(['manage.py', 'runserver']))
+            for command in ('test', 'migrate', 'shell', 'run_weather_scheduler', 'refresh_weather'):
+                self.assertFalse(scheduler.serving_requests(['manage.py', command]), command)
+        self.assertFalse(scheduler.serving_requests(['gunicorn', 'farmer_weather.wsgi']))
+
+
+class RefreshEndpointTests(TestCase):
+    """Reads never wait on the provider; the refresh endpoint reports what happened"""
+
+    def setUp(self):
+        self.farm = make_farm()
+        self.url = reverse('api_refresh_farm_weather', args=[self.farm.id])
+        self.fetch = mock.patch.object(WeatherService, 'fetch_weather', return_value=sample_payloads(self.farm)).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def make_stale(self):
+        WeatherSyncState.objects.filter(farm=self.farm).update(
+            checked_at=timezone.now() - refresh_max_age() - timedelta(minutes=1)
+        )
+
+    def test_wait_refreshes(self):
+        response = self.client.post(self.url + '?wait=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'refreshed')
+        self.assertFalse(response.json()['stale'])
+        self.assertTrue(WeatherData.objects.filter(farm=self.farm).exists())
+
+    def test_fresh_farm_is_not_fetched_again(self):
+        self.client.post(self.url + '?wait=1')
+        response = self.client.post(self.url + '?wait=1')
+        self.assertEqual(response.json()['status'], 'fresh')
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_force_ignores_max_age(self):
+        self.client.post(self.url + '?wait=1')
+        response = self.client.post(self.url + '?wait=1&force=1')
+        self.assertEqual(response.json()['status'], 'refreshed')
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_stale_farm_is_fetched(self):
+        self.client.post(self.url + '?wait=1')
+        self.make_stale()
+        self.assertEqual(self.client.post(self.url + '?wait=1').json()['status'], 'refreshed')
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_provider_failure(self):
+        self.fetch.return_value = (None, None)
+        response = self.client.post(self.url + '?wait=1')
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(response.json()['status'], 'failed')
+        self.assertTrue(response.json()['stale'])
+
+    def test_forced_failure_on_fresh_farm(self):
+        self.client.post(self.url + '?wait=1')
+        self.fetch.return_value = (None, None)
+        response = self.client.post(self.url + '?wait=1&force=1')
+        self.assertEqual(response.status_code, 502)
+        self.assertFalse(response.json()['stale'])
+
+    def test_refresh_farm_max_age(self):
+        self.assertTrue(refresh_farm(self.farm, max_age=refresh_max_age()))
+        self.assertFalse(refresh_farm(self.farm, max_age=refresh_max_age()))
+        self.assertTrue(refresh_farm(self.farm))
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_background_refresh_is_queued_once(self):
+        executor = mock.patch.object(refresh, '_background').start()
+        mock.patch.object(refresh, 'close_old_connections').start()
+
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'queued')
+        self.assertEqual(self.client.post(self.url).json()['status'], 'already_queued')
+        self.assertEqual(self.client.get(self.url).json()['status'], 'queued')
+        executor.submit.assert_called_once()
+
+        task, farm = executor.submit.call_args.args
+        task(farm)
+        self.assertEqual(self.client.get(self.url).json()['status'], 'idle')
+        self.assertFalse(self.client.get(self.url).json()['stale'])
+
+    def test_stale_read_queues_refresh(self):
+        self.client.post(self.url + '?wait=1')
+        background = mock.patch('weather.api_views.refresh_in_background').start()
+        weather_url = reverse('api_farm_weather', args=[self.farm.id])
+
+        self.client.get(weather_url)
+        background.assert_not_called()
+
+        self.make_stale()
+        etag = self.client.get(weather_url)['ETag']
+        self.assertEqual(self.client.get(weather_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(background.call_count, 2)
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_ensure_weather(self):
+        background = mock.patch.object(refresh, 'refresh_in_background').start()
+        ensure_weather(self.farm)
+        self.assertEqual(self.fetch.call_count, 1)
+
+        ensure_weather(self.farm)
+        background.assert_not_called()
+
+        self.make_stale()
+        ensure_weather(self.farm)
+        background.assert_called_once_with(self.farm)
+        self.assertEqual(self.fetch.call_count, 1)
+
+
+class EventBrokerTests(SimpleTestCase):
+    """EventBroker wakes the streams subscribed to a farm"""
+
+    def test_publish_wakes_subscribers(self):
+        async def scenario():
+            broker = EventBroker()
+            first, second, other = broker.subscribe(1), broker.subscribe(1), broker.subscribe(2)
+
+            # publish() is called from writer threads
+            threading.Thread(target=broker.publish, args=([1],)).start()
+            await asyncio.wait_for(asyncio.gather(first.wait(), second.wait()), 1)
+            self.assertFalse(other.is_set())
+
+            broker.unsubscribe(1, first)
+            first.clear()
+            second.clear()
+            broker.publish([1])
+            await asyncio.wait_for(second.wait(), 1)
+            self.assertFalse(first.is_set())
+
+            broker.unsubscribe(1, second)
+            broker.unsubscribe(2, other)
+            self.assertEqual(broker._subscribers, {})
+
+        asyncio.run(scenario())
+
+    def test_weather_updated_signal_publishes(self):
+        async def scenario():
+            wakeup = event_broker.subscribe(1)
+            try:
+                weather_updated.send(sender=WeatherData, farm_ids=[1])
+                await asyncio.wait_for(wakeup.wait(), 1)
+            finally:
+                event_broker.unsubscribe(1, wakeup)
+
+        asyncio.run(scenario())
+
+
+class FarmWeatherEventsTests(TestCase):
+    """GET /api/farms/<id>/weather/events/ over ASGI and WSGI"""
+
+    def setUp(self):
+        self.farm = make_farm()
+        changed_at = timezone.now()
+        WeatherSyncState.objects.create(farm=self.farm, checked_at=changed_at, weather_changed_at=changed_at)
+        self.version = version_id((changed_at, None))
+        self.url = reverse('api_farm_weather_events', args=[self.farm.id])
+
+    async def test_stream_sends_current_version(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        frames = []
+        async for chunk in response.streaming_content:
+            frames.append(chunk.decode())
+            if 'data:' in chunk.decode():
+                break
+        self.assertTrue(frames[0].startswith('retry:'))
+        self.assertIn(f'id: {self.version}\n', frames[-1])
+        self.assertIn(f'"farm": {self.farm.id}', frames[-1])
+
+    def test_wsgi_sends_one_event(self):
+        response = self.client.get(self.url)
+        body = response.content.decode()
+        self.assertEqual(body.count('data:'), 1)
+        self.assertIn(f'id: {self.version}\n', body)
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_wsgi_skips_known_version(self):
+        body = self.client.get(self.url, HTTP_LAST_EVENT_ID=self.version).content.decode()
+        self.assertTrue(body.startswith('retry:'))
+        self.assertNotIn('data:', body)
+        body = self.client.get(self.url, {'last_event_id': self.version}).content.decode()
+        self.assertNotIn('data:', body)
+
+    def test_unknown_farm(self):
+        self.assertEqual(self.client.get(reverse('api_farm_weather_events', args=[0])).status_code, 404)
+
+
+class BatchWeatherTests(TestCase):
+    """GET /api/farms/weather/?ids= loads every farm's rows with a fixed number of queries"""
+
+    def setUp(self):
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        self.farms = [make_farm(f'Farm {n}') for n in range(3)]
+        WeatherData.objects.bulk_create([
+            WeatherData(farm=farm, timestamp=now + timedelta(hours=3 * step), **weather_fields(farm.id * 100 + step))
+            for farm in self.farms
+            for step in range(-3, 45)
+        ])
+        FarmingInsight.objects.bulk_create([
+            FarmingInsight(
+                farm=farm, insight_type='GENERAL', title=f'Insight {n}', description='Test',
+                priority=n % 3 + 1, valid_from=now, valid_until=now + timedelta(days=1),
+            )
+            for farm in self.farms
+            for n in range(12)
+        ])
+        self.now = now
+
+    def test_per_farm_slices(self):
+        ids = [farm.id for farm in reversed(self.farms)]
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('api_farms_weather'), {'ids': ','.join(map(str, ids + [0]))})
+        body = response.json()
+
+        self.assertEqual([result['farm'] for result in body['results']], ids)
+        self.assertEqual(body['not_found'], [0])
+        for result in body['results']:
+            base = result['farm'] * 100
+            self.assertEqual(result['current']['temperature'], base)
+            self.assertEqual(len(result['forecast']), 40)
+            self.assertEqual(result['forecast'][0]['temperature'], base + 1)
+            self.assertEqual(len(result['insights']), 10)
+            self.assertEqual([insight['priority'] for insight in result['insights']][:4], [3, 3, 3, 3])
+
+    def test_queries_do_not_grow_with_farms(self):
+        more = [make_farm(f'Extra {n}') for n in range(5)]
+        ids = [farm.id for farm in self.farms + more]
+        with self.assertNumQueries(4):
+            self.client.get(reverse('api_farms_weather'), {'ids': ','.join(map(str, ids))})
+
+    def test_only_unknown_ids(self):
+        # No farms found: the prefetch queries are skipped
+        with self.assertNumQueries(1):
+            body = self.client.get(reverse('api_farms_weather'), {'ids': '0,-1'}).json()
+        self.assertEqual(body, {'results': [], 'not_found': [0, -1]})
+
+    def test_invalid_ids(self):
+        self.assertEqual(self.client.get(reverse('api_farms_weather')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api_farms_weather'), {'ids': '1,x'}).status_code, 400)
+        too_many = ','.join(str(n) for n in range(1, 102))
+        self.assertEqual(self.client.get(reverse('api_farms_weather'), {'ids': too_many}).status_code, 400)
+
+
+def hour_start(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(timestamp):
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class CompactWeatherTests(TestCase):
+    """compact_weather rolls raw rows past retention into rollups and deletes them"""
+
+    def setUp(self):
+        self.farm = make_farm()
+        rng = random.Random(11)
+        start = (timezone.now() - timedelta(days=40)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.old = WeatherData.objects.bulk_create([
+            WeatherData(
+                farm=self.farm,
+                timestamp=start + timedelta(minutes=20 * step),
+                **weather_fields(
+                    rng.uniform(-5, 35),
+                    humidity=rng.uniform(20, 100),
+                    pressure=rng.uniform(990, 1030),
+                    wind_speed=rng.uniform(0, 15),
+                    precipitation=rng.choice([0, 0, 0.5, 2]),
+                    clouds=rng.uniform(0, 100),
+                ),
+            )
+            for step in range(3 * 24 * 3)
+        ])
+        self.recent = WeatherData.objects.create(farm=self.farm, timestamp=timezone.now(), **weather_fields())
+
+    def expected(self, rows, period):
+        groups = {}
+        for row in rows:
+            groups.setdefault(period(row.timestamp), []).append(row)
+        return {
+            start: {
+                'sample_count': len(group),
+                'temperature_min': min(row.temperature for row in group),
+                'temperature_max': max(row.temperature for row in group),
+                'temperature_mean': sum(row.temperature for row in group) / len(group),
+                'humidity_mean': sum(row.humidity for row in group) / len(group),
+                'pressure_mean': sum(row.pressure for row in group) / len(group),
+                'wind_speed_max': max(row.wind_speed for row in group),
+                'clouds_mean': sum(row.clouds for row in group) / len(group),
+                'precipitation_total': sum(row.precipitation for row in group),
+            }
+            for start, group in groups.items()
+        }
+
+    def assertRollupsMatch(self, model, expected):
+        rollups = {rollup.period_start: rollup for rollup in model.objects.filter(farm=self.farm)}
+        self.assertEqual(set(rollups), set(expected))
+        for start, values in expected.items():
+            for field, value in values.items():
+                self.assertAlmostEqual(getattr(rollups[start], field), value, places=6, msg=f'{start} {field}')
+
+    def test_rollups_match_raw_rows(self):
+        farms, deleted = compact_weather(older_than_days=30)
+        self.assertEqual((farms, deleted), (1, len(self.old)))
+
+        self.assertRollupsMatch(HourlyWeatherRollup, self.expected(self.old, hour_start))
+        self.assertRollupsMatch(DailyWeatherRollup, self.expected(self.old, day_start))
+
+    def test_only_rows_past_retention_are_deleted(self):
+        compact_weather(older_than_days=30, chunk_size=50, window_days=1)
+        self.assertEqual(list(WeatherData.objects.filter(farm=self.farm)), [self.recent])
+
+    def test_later_runs_merge_into_existing_rollups(self):
+        first, late = self.old[::2], self.old[1::2]
+        WeatherData.objects.filter(id__in=[row.id for row in late]).delete()
+        compact_weather(older_than_days=30)
+        WeatherData.objects.bulk_create(late)
+        compact_weather(older_than_days=30)
+
+        self.assertRollupsMatch(DailyWeatherRollup, self.expected(first + late, day_start))
+
+    def test_dry_run_changes_nothing(self):
+        self.assertEqual(compact_weather(older_than_days=30, dry_run=True), (1, len(self.old)))
+        self.assertEqual(WeatherData.objects.filter(farm=self.farm).count(), len(self.old) + 1)
+        self.assertFalse(HourlyWeatherRollup.objects.exists())
+
+
+class WeatherArchiveTests(TestCase):
+    """export_weather_archive partitions round-trip through open_archive"""
+
+    def setUp(self):
+        self.farms = [make_farm('North'), make_farm('South')]
+        start = datetime(2025, 5, 30, tzinfo=dt_timezone.utc)
+        WeatherData.objects.bulk_create([
+            WeatherData(
+                farm=farm,
+                timestamp=start + timedelta(hours=6 * step),
+                **weather_fields(
+                    farm.id + step / 4,
+                    weather_condition=['Rain', 'Clear'][step % 2],
+                    weather_description=['light rain', 'clear sky', 'broken clouds'][step % 3],
+                ),
+            )
+            for farm in self.farms
+            for step in range(4 * 40)
+        ])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+
+    def test_round_trip(self):
+        call_command('export_weather_archive', self.root, '--since', '2025-05', '--until', '2025-07',
+                     '--chunk-size', '7', stdout=StringIO())
+
+        partitions = list(open_archive(self.root))
+        self.assertEqual([(p.farm_id, p.month) for p in partitions], [
+            (farm.id, month) for farm in self.farms for month in ('2025-05', '2025-06')
+        ])
+        for partition in partitions:
+            month = datetime.strptime(partition.month, '%Y-%m').replace(tzinfo=dt_timezone.utc)
+            rows = list(WeatherData.objects.filter(
+                farm_id=partition.farm_id, timestamp__gte=month, timestamp__lt=month.replace(month=month.month + 1),
+            ).order_by('timestamp'))
+            self.assertEqual(len(partition), len(rows))
+
+            self.assertIsInstance(partition['temperature'], np.memmap)
+            np.testing.assert_array_equal(
+                partition.timestamps(),
+                np.array([row.timestamp.replace(tzinfo=None) for row in rows], dtype='datetime64[s]'),
+            )
+            np.testing.assert_allclose(partition['temperature'], [row.temperature for row in rows], rtol=1e-6)
+            np.testing.assert_allclose(partition['humidity'], [row.humidity for row in rows], rtol=1e-6)
+            self.assertEqual(partition.labels('weather_condition').tolist(), [row.weather_condition for row in rows])
+            self.assertEqual(partition.labels('weather_description').tolist(),
+                             [row.weather_description for row in rows])
+
+    def test_farm_filter_and_incomplete_months(self):
+        call_command('export_weather_archive', self.root, '--farm', str(self.farms[0].id),
+                     '--until', '2025-07', stdout=StringIO())
+        self.assertEqual([(p.farm_id, p.month) for p in open_archive(self.root)],
+                         [(self.farms[0].id, '2025-05'), (self.farms[0].id, '2025-06')])
+        self.assertEqual([p.month for p in open_archive(self.root, self.farms[0].id, months=['2025-06'])],
+                         ['2025-06'])
+
+
+class AgronomyTests(TestCase):
+    """FAO-56 reference evapotranspiration and growing degree days"""
+
+    def test_extraterrestrial_radiation_daily(self):
+        # FAO-56 example 8: 20°S on 3 September, Ra = 32.2 MJ m-2 day-1
+        start = datetime(2025, 9, 3, tzinfo=dt_timezone.utc).timestamp()
+        radiation = agronomy.extraterrestrial_radiation([int(start)], 24, -20, 0)
+        self.assertAlmostEqual(float(radiation[0]), 32.2, places=1)
+
+    def test_reference_et0_hourly(self):
+        # FAO-56 example 19 (N'Diaye, Senegal, 1 October). Ra and Rs/Rso of
+        # the example are reproduced through the sunshine fraction, 1 - clouds
+        with mock.patch.object(agronomy, 'extraterrestrial_radiation', return_value=np.array([3.543])):
+            day = agronomy.reference_et0([0], 1, 16.2, -16.25, 38, 52, 3.3 / agronomy.WIND_10M_TO_2M, 1013, 11.7)
+        with mock.patch.object(agronomy, 'extraterrestrial_radiation', return_value=np.array([0.0])):
+            night = agronomy.reference_et0([0], 1, 16.2, -16.25, 28, 90, 1.9 / agronomy.WIND_10M_TO_2M, 1013, 30)
+        self.assertAlmostEqual(float(day[0]), 0.63, places=2)
+        self.assertAlmostEqual(float(night[0]), 0.0, places=2)
+
+    def test_growing_degree_days_base(self):
+        gdd = agronomy.growing_degree_days([5, 10, 22], 10, 3)
+        np.testing.assert_allclose(gdd, [0, 0, 12 * 3 / 24])
+        self.assertEqual(agronomy.gdd_base(make_crop(name='WHEAT')), 0.0)
+        self.assertEqual(agronomy.gdd_base(make_crop(name='COTTON')), 15.6)
+        self.assertIsNone(agronomy.gdd_base(None))
+
+    def test_accumulation_caps_steps_and_is_incremental(self):
+        farm = make_farm(crop=make_crop())
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        # Three 3-hour steps, then a 12-hour gap counted as one 3-hour step
+        offsets = [-24, -21, -18, -15, -3]
+        WeatherData.objects.bulk_create([
+            WeatherData(farm=farm, timestamp=now + timedelta(hours=hours), **weather_fields(22))
+            for hours in offsets
+        ])
+
+        self.assertEqual(agronomy.accumulate_agronomy([farm]), 1)
+        totals = FarmAgronomy.objects.get(farm=farm)
+        self.assertAlmostEqual(totals.gdd_total, 4 * (22 - 10) * 3 / 24)
+        self.assertEqual(totals.gdd_base, 10.0)
+        self.assertEqual(totals.accumulated_through, now - timedelta(hours=3))
+        first_et0 = totals.et0_total
+        self.assertGreater(first_et0, 0)
+
+        self.assertEqual(agronomy.accumulate_agronomy([farm]), 0)
+        self.assertEqual(FarmAgronomy.objects.get(farm=farm).gdd_total, totals.gdd_total)
+
+        WeatherData.objects.create(farm=farm, timestamp=now, **weather_fields(22))
+        self.assertEqual(agronomy.accumulate_agronomy([farm]), 1)
+        totals = FarmAgronomy.objects.get(farm=farm)
+        self.assertAlmostEqual(totals.gdd_total, 5 * (22 - 10) * 3 / 24)
+        self.assertGreater(totals.et0_total, first_et0)
+
+    def test_incremental_matches_single_run(self):
+        crop = make_crop()
+        farms = [make_farm('Incremental', crop=crop), make_farm('Single', crop=crop)]
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+        for farm in farms:
+            WeatherData.objects.bulk_create([
+                WeatherData(farm=farm, timestamp=now - timedelta(hours=3 * step),
+                            **weather_fields(10 + step, clouds=step * 5))
+                for step in range(1, 17)
+            ])
+        incremental, single = farms
+
+        with mock.patch('django.utils.timezone.now', return_value=now - timedelta(hours=24)):
+            agronomy.accumulate_agronomy([incremental])
+        agronomy.accumulate_agronomy([incremental])
+        agronomy.accumulate_agronomy([single])
+
+        first, second = FarmAgronomy.objects.get(farm=incremental), FarmAgronomy.objects.get(farm=single)
+        self.assertAlmostEqual(first.et0_total, second.et0_total, places=9)
+        self.assertAlmostEqual(first.gdd_total, second.gdd_total, places=9)
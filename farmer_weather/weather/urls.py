@@ -13,8 +13,12 @@ urlpatterns = [
     
     # API endpoints (for React frontend)
     path('api/farms/', api_views.get_farms, name='api_farms'),
+    path('api/farms/weather/', api_views.get_farms_weather, name='api_farms_weather'),
     path('api/farms/<int:farm_id>/', api_views.delete_farm, name='api_delete_farm'),
     path('api/farms/<int:farm_id>/weather/', api_views.get_farm_weather, name='api_farm_weather'),
+    path('api/farms/<int:farm_id>/weather/changes/', api_views.get_farm_weather_changes, name='api_farm_weather_changes'),
+    path('api/farms/<int:farm_id>/weather/events/', api_views.farm_weather_events, name='api_farm_weather_events'),
+    path('api/farms/<int:farm_id>/weather/refresh/', api_views.refresh_farm_weather, name='api_refresh_farm_weather'),
     path('api/crops/', api_views.get_crops, name='api_crops'),
     path('api/predict/', api_views.predict_blight, name='api_predict'),
     path('api/chat/', api_views.chat_with_gemini, name='api_chat'),
@@ -1,10 +1,10 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.conf import settings
-from .models import Farm, Crop, WeatherData, FarmingInsight
-from .weather_service import WeatherService
-from .insights import InsightGenerator
-from datetime import datetime, timedelta
+from django.utils import timezone
+from .models import Farm, Crop
+from . import queries
+from .refresh import ensure_weather
 import json
 
 
@@ -26,6 +26,7 @@ def create_farm(request):
         crop = Crop.objects.get(id=crop_id) if crop_id else None
         
         farm = Farm.objects.create(
+            user=request.user if request.user.is_authenticated else None,
             name=name,
             latitude=latitude,
             longitude=longitude,
@@ -47,30 +48,15 @@ def farm_dashboard(request, farm_id):
     """Main dashboard showing weather data and insights"""
     farm = get_object_or_404(Farm, id=farm_id)
     
-    # Fetch fresh weather data
-    weather_service = WeatherService()
-    weather_data = weather_service.get_weather_summary(farm)
+    # Weather and insights are kept fresh by the scheduler; only block on
+    # the provider when this farm has no data yet
+    ensure_weather(farm)
     
-    # Generate insights
-    insight_generator = InsightGenerator()
-    insights = insight_generator.generate_insights(farm)
-    
-    # Get stored weather data
-    current_weather = WeatherData.objects.filter(
-        farm=farm,
-        timestamp__lte=datetime.now()
-    ).order_by('-timestamp').first()
-    
-    forecast_data = WeatherData.objects.filter(
-        farm=farm,
-        timestamp__gte=datetime.now()
-    ).order_by('timestamp')[:40]
-    
-    # Get insights from database
-    active_insights = FarmingInsight.objects.filter(
-        farm=farm,
-        valid_until__gte=datetime.now()
-    ).order_by('-priority', 'valid_from')
+    # Get stored weather data and insights
+    now = timezone.now()
+    current_weather = queries.current_weather(now, farm).first()
+    forecast_data = queries.forecast(now, farm)
+    active_insights = queries.active_insights(now, farm)
     
     return render(request, 'weather/dashboard.html', {
         'farm': farm,
@@ -84,24 +70,12 @@ def weather_calendar(request, farm_id):
     """Weather calendar view"""
     farm = get_object_or_404(Farm, id=farm_id)
     
-    # Get weather data for the next 5 days
-    forecast_data = WeatherData.objects.filter(
-        farm=farm,
-        timestamp__gte=datetime.now(),
-        timestamp__lte=datetime.now() + timedelta(days=5)
-    ).order_by('timestamp')
-    
-    # Group by date
-    calendar_data = {}
-    for weather in forecast_data:
-        date_key = weather.timestamp.date()
-        if date_key not in calendar_data:
-            calendar_data[date_key] = []
-        calendar_data[date_key].append(weather)
+    # Daily summaries are maintained at ingest time; read one row per day
+    calendar_days = queries.calendar_days(farm, timezone.localdate())
     
     return render(request, 'weather/calendar.html', {
         'farm': farm,
-        'calendar_data': calendar_data
+        'calendar_days': calendar_days
     })
 
 
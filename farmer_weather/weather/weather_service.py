@@ -1,7 +1,186 @@
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from django.conf import settings
-from .models import WeatherData, Farm
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+from .changelog import log_changes
+from .events import notify_weather_updated
+from .locks import SingleFlight
+from .models import WeatherData, Farm, WeatherSyncState
+from .summaries import update_daily_summaries
+
+
+# OpenWeatherMap publishes its 5-day forecast in 3-hour steps
+FORECAST_STEP_SECONDS = 3 * 60 * 60
+MIN_FORECAST_TTL = 5 * 60
+
+# Columns refreshed when a (farm, timestamp) row already exists
+UPSERT_FIELDS = [
+    'temperature', 'feels_like', 'humidity', 'pressure', 'wind_speed',
+    'precipitation', 'weather_condition', 'weather_description', 'clouds',
+    'fetched_at',
+]
+
+# (connect, read) timeouts in seconds
+REQUEST_TIMEOUT = (3.05, 10)
+
+# Responses that mean the provider itself is unavailable or refusing us,
+# as opposed to a bad request for one location
+PROVIDER_FAILURE_STATUSES = {401, 403, 429}
+
+logger = logging.getLogger(__name__)
+
+
+class JitteredRetry(Retry):
+    """Retry policy using full-jitter backoff so workers don't retry in lockstep
+    
+    With `time_budget` set, no retry is started (backoff included) more than
+    that many seconds after the first failed attempt, however many retries
+    are left, so a struggling provider can't hold a request thread for long.
+    """
+    
+    def __init__(self, *args, time_budget=None, retry_deadline=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.time_budget = time_budget
+        self.retry_deadline = retry_deadline
+    
+    def new(self, **kw):
+        kw.setdefault('time_budget', self.time_budget)
+        kw.setdefault('retry_deadline', self.retry_deadline)
+        return super().new(**kw)
+    
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) if backoff > 0 else 0
+    
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        if self.time_budget is None:
+            return retry
+        
+        now = time.monotonic()
+        if retry.retry_deadline is None:
+            retry.retry_deadline = now + self.time_budget
+        if now + Retry.get_backoff_time(retry) > retry.retry_deadline:
+            reason = error or ResponseError(f"retry time budget of {self.time_budget}s exhausted")
+            raise MaxRetryError(_pool, url, reason) from reason
+        return retry
+
+
+class CircuitBreaker:
+    """Stop calling the provider after repeated failures
+    
+    After `threshold` consecutive failures the circuit opens and calls are
+    refused for `reset_timeout` seconds. Then a single trial call is let
+    through; its outcome closes the circuit or opens it again.
+    """
+    
+    def __init__(self, threshold=5, reset_timeout=60):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.opened_at is not None
+    
+    def allow(self):
+        """Whether a provider call may be made now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial_in_flight or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial_in_flight = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    logger.warning("Weather provider circuit opened after %d failures", self.failures)
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+
+_session = None
+_session_lock = threading.Lock()
+_fetch_workers = getattr(settings, 'WEATHER_FETCH_WORKERS', 8)
+_fetch_executor = ThreadPoolExecutor(max_workers=_fetch_workers, thread_name_prefix='weather-fetch')
+# One slot per worker: work is only handed to the pool when it can start at once
+_fetch_slots = threading.BoundedSemaphore(_fetch_workers)
+_cell_flights = SingleFlight()
+breaker = CircuitBreaker(
+    threshold=getattr(settings, 'WEATHER_BREAKER_THRESHOLD', 5),
+    reset_timeout=getattr(settings, 'WEATHER_BREAKER_RESET_TIMEOUT', 60),
+)
+
+
+def _in_fetch_slot(fetch, *args):
+    try:
+        return fetch(*args)
+    finally:
+        _fetch_slots.release()
+
+
+def content_fingerprint(value):
+    """Stable hash of JSON-serialisable content, used to detect unchanged data"""
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def get_session():
+    """Return the process-wide keep-alive session used for provider calls"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = JitteredRetry(
+                    total=getattr(settings, 'WEATHER_HTTP_RETRIES', 3),
+                    connect=2,
+                    read=1,
+                    backoff_factor=0.5,
+                    status_forcelist=(500, 502, 503, 504),
+                    allowed_methods=frozenset(['GET']),
+                    # Rate limiting is left to the circuit breaker rather than
+                    # parking request threads for a provider-chosen delay
+                    respect_retry_after_header=False,
+                    raise_on_status=False,
+                    time_budget=getattr(settings, 'WEATHER_HTTP_RETRY_BUDGET', 10),
+                )
+                pool_size = getattr(settings, 'WEATHER_HTTP_POOL_SIZE', 10)
+                adapter = HTTPAdapter(
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
 
 
 class WeatherService:
@@ -11,59 +190,109 @@ class WeatherService:
     
     def __init__(self):
         self.api_key = settings.OPENWEATHER_API_KEY
+        self.base_url = getattr(settings, 'OPENWEATHER_BASE_URL', '') or self.BASE_URL
+        self.resolution = getattr(settings, 'WEATHER_CACHE_RESOLUTION', 0.05)
+        self.current_ttl = getattr(settings, 'WEATHER_CURRENT_TTL', 600)
+        self.negative_ttl = getattr(settings, 'WEATHER_NEGATIVE_CACHE_TTL', 60)
     
-    def get_current_weather(self, lat, lon):
-        """Fetch current weather data"""
-        url = f"{self.BASE_URL}/weather"
-        params = {
-            'lat': lat,
-            'lon': lon,
-            'appid': self.api_key,
-            'units': 'metric'
-        }
-        
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"Error fetching current weather: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response status: {e.response.status_code}")
-                print(f"Response text: {e.response.text}")
-            return None
+    def get_cell(self, lat, lon):
+        """Snap coordinates to the grid cell shared by neighbouring farms"""
+        return (round(float(lat) / self.resolution), round(float(lon) / self.resolution))
     
-    def get_forecast(self, lat, lon, days=5):
-        """Fetch weather forecast data"""
-        url = f"{self.BASE_URL}/forecast"
-        params = {
-            'lat': lat,
-            'lon': lon,
-            'appid': self.api_key,
-            'units': 'metric'
-        }
+    def get_cell_center(self, cell):
+        """Coordinates sent upstream for every farm in a grid cell"""
+        return (round(cell[0] * self.resolution, 4), round(cell[1] * self.resolution, 4))
+    
+    def _cache_key(self, endpoint, cell):
+        return f"weather:{endpoint}:{self.resolution}:{cell[0]}:{cell[1]}"
+    
+    def _failure_key(self, key):
+        return f"{key}:failed"
+    
+    def is_cached(self, lat, lon):
+        """Whether both payloads for the grid cell containing (lat, lon) are cached"""
+        cell = self.get_cell(lat, lon)
+        keys = [self._cache_key('weather', cell), self._cache_key('forecast', cell)]
+        return len(cache.get_many(keys)) == len(keys)
+    
+    def _forecast_ttl(self):
+        """Keep a forecast until the provider publishes its next 3-hour step"""
+        remaining = FORECAST_STEP_SECONDS - int(time.time()) % FORECAST_STEP_SECONDS
+        return max(remaining, MIN_FORECAST_TTL)
+    
+    def _fetch(self, endpoint, lat, lon, ttl):
+        """Fetch an endpoint for the grid cell containing (lat, lon), via the shared cache"""
+        cell = self.get_cell(lat, lon)
+        key = self._cache_key(endpoint, cell)
         
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"Error fetching forecast: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response status: {e.response.status_code}")
-                print(f"Response text: {e.response.text}")
+        payload = cache.get(key)
+        if payload is not None:
+            return payload
+        
+        # Serve nothing (callers fall back to stored WeatherData) while the
+        # provider recently failed for this cell
+        if cache.get(self._failure_key(key)):
             return None
+        
+        # Farms in the same cell refreshing concurrently share one provider call
+        return _cell_flights.do(key, self._request, endpoint, cell, key, ttl)
     
-    def save_weather_data(self, farm, weather_json):
-        """Save weather data to database"""
-        if not weather_json:
+    def _request(self, endpoint, cell, key, ttl):
+        """Call the provider for a grid cell and cache the payload"""
+        payload = cache.get(key)
+        if payload is not None:
+            return payload
+        
+        if not breaker.allow():
             return None
         
-        timestamp = datetime.fromtimestamp(weather_json['dt'])
+        provider_failed = True
+        try:
+            cell_lat, cell_lon = self.get_cell_center(cell)
+            url = f"{self.base_url}/{endpoint}"
+            params = {
+                'lat': cell_lat,
+                'lon': cell_lon,
+                'appid': self.api_key,
+                'units': 'metric'
+            }
+            
+            try:
+                response = get_session().get(url, params=params, timeout=REQUEST_TIMEOUT)
+                response.raise_for_status()
+                payload = response.json()
+            except (requests.RequestException, ValueError) as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                message = str(e).replace(self.api_key, '***') if self.api_key else str(e)
+                logger.warning("Error fetching %s for cell %s (status %s): %s", endpoint, cell, status, message)
+                provider_failed = status is None or status >= 500 or status in PROVIDER_FAILURE_STATUSES
+                cache.set(self._failure_key(key), True, self.negative_ttl)
+                return None
+            provider_failed = False
+        finally:
+            # Report every call the breaker allowed, unexpected errors
+            # included, so a half-open trial is never left in flight
+            if provider_failed:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
         
-        weather_data = WeatherData.objects.create(
+        cache.set(key, payload, ttl)
+        return payload
+    
+    def get_current_weather(self, lat, lon):
+        """Fetch current weather data"""
+        return self._fetch('weather', lat, lon, self.current_ttl)
+    
+    def get_forecast(self, lat, lon, days=5):
+        """Fetch weather forecast data"""
+        return self._fetch('forecast', lat, lon, self._forecast_ttl())
+    
+    def build_weather_data(self, farm, weather_json):
+        """Map a provider payload onto an unsaved WeatherData instance"""
+        return WeatherData(
             farm=farm,
-            timestamp=timestamp,
+            timestamp=datetime.fromtimestamp(weather_json['dt']),
             temperature=weather_json['main']['temp'],
             feels_like=weather_json['main']['feels_like'],
             humidity=weather_json['main']['humidity'],
@@ -74,38 +303,141 @@ class WeatherService:
             weather_description=weather_json['weather'][0]['description'],
             clouds=weather_json['clouds']['all']
         )
+    
+    def upsert_weather_data(self, records):
+        """Insert records, overwriting any existing row for the same farm and timestamp"""
+        return WeatherData.objects.bulk_create(
+            records,
+            update_conflicts=True,
+            unique_fields=['farm', 'timestamp'],
+            update_fields=UPSERT_FIELDS,
+        )
+    
+    def log_upserts(self, farm, records):
+        """Record the written records in the change log"""
+        ids = WeatherData.objects.filter(
+            farm=farm,
+            timestamp__in=[record.timestamp for record in records]
+        ).values_list('id', flat=True)
+        log_changes('WEATHER', 'UPSERT', [(farm.id, pk) for pk in ids])
+    
+    def save_weather_data(self, farm, weather_json, state=None):
+        """Save weather data to database
+        
+        Returns the written record, or None when the payload is identical to
+        the one stored last time for this farm.
+        """
+        if not weather_json:
+            return None
+        
+        save_state = state is None
+        if save_state:
+            state, _ = WeatherSyncState.objects.get_or_create(farm=farm)
+        
+        fingerprint = content_fingerprint(weather_json)
+        if fingerprint == state.current_fingerprint:
+            return None
+        
+        weather_data = self.build_weather_data(farm, weather_json)
+        with transaction.atomic():
+            self.upsert_weather_data([weather_data])
+            self.log_upserts(farm, [weather_data])
+            
+            state.current_fingerprint = fingerprint
+            if save_state:
+                state.save(update_fields=['current_fingerprint'])
         
         return weather_data
     
-    def save_forecast_data(self, farm, forecast_json):
-        """Save forecast data to database"""
+    def save_forecast_data(self, farm, forecast_json, state=None):
+        """Save forecast data to database
+        
+        Returns the written records, or an empty list when the forecast is
+        identical to the one stored last time for this farm.
+        """
         if not forecast_json or 'list' not in forecast_json:
             return []
         
-        # Clear old forecast data
-        WeatherData.objects.filter(
-            farm=farm,
-            timestamp__gte=datetime.now()
-        ).delete()
+        save_state = state is None
+        if save_state:
+            state, _ = WeatherSyncState.objects.get_or_create(farm=farm)
         
-        saved_records = []
-        for item in forecast_json['list']:
-            weather_data = self.save_weather_data(farm, item)
-            if weather_data:
-                saved_records.append(weather_data)
+        fingerprint = content_fingerprint(forecast_json['list'])
+        if fingerprint == state.forecast_fingerprint:
+            return []
+        
+        records = [self.build_weather_data(farm, item) for item in forecast_json['list']]
+        
+        with transaction.atomic():
+            # Drop future slots the provider no longer returns, then write the
+            # whole forecast in one upsert
+            dropped = list(WeatherData.objects.filter(
+                farm=farm,
+                timestamp__gte=datetime.now()
+            ).exclude(
+                timestamp__in=[record.timestamp for record in records]
+            ).values_list('id', flat=True))
+            if dropped:
+                WeatherData.objects.filter(id__in=dropped).delete()
+                log_changes('WEATHER', 'DELETE', [(farm.id, pk) for pk in dropped])
+            self.upsert_weather_data(records)
+            self.log_upserts(farm, records)
+            
+            state.forecast_fingerprint = fingerprint
+            if save_state:
+                state.save(update_fields=['forecast_fingerprint'])
         
-        return saved_records
+        return records
     
-    def get_weather_summary(self, farm):
-        """Get weather summary for the farm"""
-        current = self.get_current_weather(farm.latitude, farm.longitude)
-        forecast = self.get_forecast(farm.latitude, farm.longitude)
+    def store_weather(self, farm, current, forecast):
+        """Persist already fetched current and forecast payloads for a farm"""
+        if not current and not forecast:
+            return
+        
+        state, _ = WeatherSyncState.objects.get_or_create(farm=farm)
+        written = []
         
         if current:
-            self.save_weather_data(farm, current)
+            record = self.save_weather_data(farm, current, state=state)
+            if record is not None:
+                written.append(record)
         
         if forecast:
-            self.save_forecast_data(farm, forecast)
+            written.extend(self.save_forecast_data(farm, forecast, state=state))
+        
+        update_daily_summaries(farm, [record.timestamp for record in written])
+        
+        if written:
+            state.weather_changed_at = max(record.fetched_at for record in written)
+        state.checked_at = timezone.now()
+        state.save(update_fields=['current_fingerprint', 'forecast_fingerprint', 'weather_changed_at', 'checked_at'])
+        if written:
+            notify_weather_updated(WeatherData, [farm.id])
+    
+    def fetch_weather(self, farm):
+        """Fetch the current and forecast payloads for a farm without storing them"""
+        # Issue both provider calls at once, the forecast on this thread. When
+        # every pool worker is busy, fetch both here rather than queue behind
+        # other requests' calls
+        if not _fetch_slots.acquire(blocking=False):
+            return (
+                self.get_current_weather(farm.latitude, farm.longitude),
+                self.get_forecast(farm.latitude, farm.longitude),
+            )
+        try:
+            current_future = _fetch_executor.submit(
+                _in_fetch_slot, self.get_current_weather, farm.latitude, farm.longitude
+            )
+        except BaseException:
+            _fetch_slots.release()
+            raise
+        forecast = self.get_forecast(farm.latitude, farm.longitude)
+        return current_future.result(), forecast
+    
+    def get_weather_summary(self, farm):
+        """Get weather summary for the farm"""
+        current, forecast = self.fetch_weather(farm)
+        self.store_weather(farm, current, forecast)
         
         return {
             'current': current,
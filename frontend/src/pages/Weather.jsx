@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import axios from 'axios'
 import './Weather.css'
 import ChatButton from '../components/ChatButton'
@@ -18,12 +18,37 @@ const Weather = () => {
     crop: ''
   })
   const [crops, setCrops] = useState([])
+  // Update-event id of the weather currently shown
+  const weatherVersion = useRef('')
 
   useEffect(() => {
     fetchFarms()
     fetchCrops()
   }, [])
 
+  useEffect(() => {
+    if (!selectedFarm) return
+    // Re-read the stored weather whenever the server reports an update.
+    // Passing the loaded version stops the stream replaying it on connect.
+    const events = new EventSource(
+      `/api/farms/${selectedFarm}/weather/events/?last_event_id=${weatherVersion.current}`
+    )
+    events.addEventListener('update', async (event) => {
+      if (event.lastEventId === weatherVersion.current) return
+      try {
+        // The version param bypasses copies cached under max-age
+        const response = await axios.get(`/api/farms/${selectedFarm}/weather/`, {
+          params: { v: event.lastEventId },
+        })
+        weatherVersion.current = response.headers['x-weather-version'] || event.lastEventId
+        setWeatherData(response.data)
+      } catch (error) {
+        console.error('Error reloading weather:', error)
+      }
+    })
+    return () => events.close()
+  }, [selectedFarm])
+
   const fetchCrops = async () => {
     try {
       const response = await axios.get('/api/crops/')
@@ -35,8 +60,17 @@ const Weather = () => {
 
   const fetchFarms = async () => {
     try {
-      const response = await axios.get('/api/farms/')
-      setFarms(response.data)
+      // The list is paginated: follow X-Next-Cursor until the last page
+      const allFarms = []
+      let cursor = null
+      do {
+        const response = await axios.get('/api/farms/', {
+          params: { limit: 200, ...(cursor ? { cursor } : {}) },
+        })
+        allFarms.push(...response.data)
+        cursor = response.headers['x-next-cursor']
+      } while (cursor)
+      setFarms(allFarms)
     } catch (error) {
       console.error('Error fetching farms:', error)
     }
@@ -45,7 +79,13 @@ const Weather = () => {
   const fetchWeather = async (farmId) => {
     setLoading(true)
     try {
-      const response = await axios.get(`/api/farms/${farmId}/weather/`)
+      let response = await axios.get(`/api/farms/${farmId}/weather/`)
+      if (response.data.forecast.length === 0) {
+        // Nothing stored yet: refresh now, then read again
+        await axios.post(`/api/farms/${farmId}/weather/refresh/?wait=1`)
+        response = await axios.get(`/api/farms/${farmId}/weather/`)
+      }
+      weatherVersion.current = response.headers['x-weather-version'] || ''
       setWeatherData(response.data)
       setSelectedFarm(farmId)
     } catch (error) {